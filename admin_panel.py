@@ -8,18 +8,26 @@ from telegram.ext import (
     ContextTypes, ConversationHandler, CommandHandler, 
     CallbackQueryHandler, MessageHandler, filters
 )
-from database import init_db, Club, Book, User, DailyLog, UserBook, ActionLog, get_session_scope
+from database import Session, Club, Book, User, DailyLog, UserBook, ActionLog, Recommendation, get_session_scope
 from utils import get_admin_ids, get_today_date
 from admin_cancel import cancel_handler
+from delivery import deliver, OutgoingMessage
+from reading_stats import delete_user_stats, reset_log_stats, rebuild as rebuild_reading_stats
+from club_snapshots import get_snapshot, invalidate_club
+from identity_cache import identity_cache, get_user
+from loaders import loader_options
+from pagination import PageRequest, split_page_data, fetch_page, build_page_keyboard
+from user_search import search_users
+from sqlalchemy import func, select
+import html
 import uuid
 
-Session = init_db()
-
 MAIN_MENU, CLUB_MENU, BOOK_MENU, USER_MENU, STATS_MENU, LOGS_MENU = range(6)
 CREATE_CLUB_NAME, CREATE_CLUB_TYPE, CREATE_CLUB_GOALS_PRL, CREATE_CLUB_GOALS_RNK, CREATE_CLUB_GOALS_TOTAL = range(6, 11)
 ADD_BOOK_CLUB, ADD_BOOK_TITLE, ADD_BOOK_PAGES = range(11, 14)
 BROADCAST_CLUB, BROADCAST_MESSAGE = range(14, 16)
 SELECT_USER, CONFIRM_ACTION = range(16, 18)
+USER_FILTER, USER_SEARCH = range(18, 20)
 
 
 def admin_only_callback(func):
@@ -85,6 +93,7 @@ def build_user_menu():
     """Build the user management menu"""
     keyboard = [
         [InlineKeyboardButton("📋 List Users", callback_data="user_list")],
+        [InlineKeyboardButton("🔎 Search Users", callback_data="user_search")],
         [InlineKeyboardButton("🚫 Kick User", callback_data="user_kick")],
         [InlineKeyboardButton("🔄 Reset User", callback_data="user_reset")],
         [InlineKeyboardButton("⬅️ Back", callback_data="back_main")],
@@ -102,18 +111,47 @@ def build_stats_menu():
     return InlineKeyboardMarkup(keyboard)
 
 
-def build_club_selector(clubs, action_prefix):
-    """Build a club selector keyboard"""
-    keyboard = []
-    for club in clubs:
-        keyboard.append([
-            InlineKeyboardButton(
-                f"{club.name} ({len(club.users)} members)",
-                callback_data=f"{action_prefix}_{club.id}"
-            )
-        ])
-    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_main")])
-    return InlineKeyboardMarkup(keyboard)
+def club_page(session, page):
+    """One page of clubs (id, name, members), member counts included in the same query"""
+    members = select(func.count(User.id)).where(User.club_id == Club.id).scalar_subquery()
+    return fetch_page(session, select(Club.id, Club.name, members.label('members')), Club.id, page,
+                      name_column=Club.name)
+
+
+def build_club_selector(clubs, action_prefix, list_data, back_data="back_main"):
+    """Build a club selector keyboard for a page of clubs (see club_page); `list_data` reopens the list"""
+    return build_page_keyboard(
+        clubs, list_data,
+        lambda club: InlineKeyboardButton(f"{club.name} ({club.members} members)",
+                                          callback_data=f"{action_prefix}_{club.id}"),
+        back_data=back_data
+    )
+
+
+def user_list_message(session, page):
+    """Text and keyboard for a page of the user list, optionally filtered by name prefix"""
+    users = fetch_page(
+        session,
+        select(User.id, User.full_name, Club.name.label('club_name')).outerjoin(Club, User.club_id == Club.id),
+        User.id, page, name_column=User.full_name
+    )
+    if page.name_prefix:
+        title = f"👥 <b>Users named {html.escape(page.name_prefix)}…</b>"
+        filter_button = InlineKeyboardButton("✖️ Clear filter", callback_data="user_list")
+    else:
+        title = f"👥 <b>All Users</b> ({session.scalar(select(func.count()).select_from(User))} total)"
+        filter_button = InlineKeyboardButton("🔤 Filter by name", callback_data="user_filter")
+    
+    keyboard = build_page_keyboard(
+        users, "user_list",
+        lambda user: InlineKeyboardButton(f"{user.full_name} ({user.club_name or 'No Club'})",
+                                          callback_data=f"viewuser_{user.id}"),
+        back_data="back_users",
+        extra_rows=[[filter_button]]
+    )
+    if not users.rows:
+        return f"{title}\n\nNo users found.", keyboard
+    return f"{title}\n\nSelect a user to view profile:", keyboard
 
 
 def build_back_button(callback_data="back_main"):
@@ -195,29 +233,7 @@ async def main_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return STATS_MENU
     
     elif data == "menu_broadcast":
-        # Show broadcast options: all users or by club
-        with get_session_scope(Session) as session:
-            clubs = session.query(Club).all()
-            user_count = session.query(User).count()
-            
-            keyboard = [
-                [InlineKeyboardButton(f"📢 All Users ({user_count})", callback_data="broadcast_all")],
-            ]
-            for club in clubs:
-                club_user_count = len(club.users)
-                keyboard.append([
-                    InlineKeyboardButton(
-                        f"📋 {club.name} ({club_user_count})",
-                        callback_data=f"broadcast_{club.id}"
-                    )
-                ])
-            keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_main")])
-            
-            await query.edit_message_text(
-                "📢 <b>Broadcast Message</b>\n\nSelect target:",
-                parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
+        await show_broadcast_targets(query, split_page_data(query.data)[1])
         return BROADCAST_CLUB
     
     elif data == "menu_logs":
@@ -272,7 +288,7 @@ async def club_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    data = query.data
+    data, page = split_page_data(query.data)
     
     if data == "club_create":
         await query.edit_message_text(
@@ -285,9 +301,9 @@ async def club_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data == "club_list":
         with get_session_scope(Session) as session:
-            clubs = session.query(Club).all()
+            clubs = club_page(session, page)
             
-            if not clubs:
+            if not clubs.rows:
                 await query.edit_message_text(
                     "📋 <b>All Clubs</b>\n\nNo clubs found.",
                     parse_mode='HTML',
@@ -295,21 +311,10 @@ async def club_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 )
                 return CLUB_MENU
             
-            keyboard = []
-            for club in clubs:
-                user_count = len(club.users)
-                keyboard.append([
-                    InlineKeyboardButton(
-                        f"{club.name} ({user_count} members)",
-                        callback_data=f"viewclub_{club.id}"
-                    )
-                ])
-            keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_clubs")])
-            
             await query.edit_message_text(
                 "📋 <b>All Clubs</b>\n\nSelect a club to view details:",
                 parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                reply_markup=build_club_selector(clubs, "viewclub", data, back_data="back_clubs")
             )
         return CLUB_MENU
     
@@ -399,8 +404,8 @@ async def club_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data == "club_delete":
         with get_session_scope(Session) as session:
-            clubs = session.query(Club).all()
-            if not clubs:
+            clubs = club_page(session, page)
+            if not clubs.rows:
                 await query.edit_message_text(
                     "No clubs to delete.",
                     reply_markup=build_back_button("back_clubs")
@@ -410,7 +415,7 @@ async def club_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text(
                 "🗑️ <b>Delete Club</b>\n\nSelect a club to delete:\n\n⚠️ This will remove all club data!",
                 parse_mode='HTML',
-                reply_markup=build_club_selector(clubs, "delete_club")
+                reply_markup=build_club_selector(clubs, "delete_club", data)
             )
         return CLUB_MENU
     
@@ -429,15 +434,20 @@ async def club_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if club:
                 club_name = club.name
                 # Delete related data
+                delete_user_stats(session, session.query(User.id).filter_by(club_id=club_id))
                 session.query(UserBook).filter(UserBook.user_id.in_(
                     session.query(User.id).filter_by(club_id=club_id)
                 )).delete(synchronize_session=False)
                 session.query(DailyLog).filter(DailyLog.user_id.in_(
                     session.query(User.id).filter_by(club_id=club_id)
                 )).delete(synchronize_session=False)
+                from recommendations import invalidate_club_recommendations
+                invalidate_club_recommendations(session, club_id)
                 session.query(User).filter_by(club_id=club_id).delete()
                 session.query(Book).filter_by(club_id=club_id).delete()
                 session.delete(club)
+                invalidate_club(club_id)
+                identity_cache.invalidate_club(club_id)
                 
                 await query.edit_message_text(
                     f"✅ Club <b>{club_name}</b> deleted successfully.",
@@ -607,13 +617,13 @@ async def book_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    data = query.data
+    data, page = split_page_data(query.data)
     
     if data == "book_add":
         # Show club selector for adding book
         with get_session_scope(Session) as session:
-            clubs = session.query(Club).all()
-            if not clubs:
+            clubs = club_page(session, page)
+            if not clubs.rows:
                 await query.edit_message_text(
                     "No clubs found. Create a club first.",
                     reply_markup=build_back_button("back_books")
@@ -623,7 +633,7 @@ async def book_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text(
                 "➕ <b>Add Book</b>\n\nSelect a club:",
                 parse_mode='HTML',
-                reply_markup=build_club_selector(clubs, "addbook")
+                reply_markup=build_club_selector(clubs, "addbook", data)
             )
         return BOOK_MENU
     
@@ -640,8 +650,8 @@ async def book_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data == "book_list":
         with get_session_scope(Session) as session:
-            clubs = session.query(Club).all()
-            if not clubs:
+            clubs = club_page(session, page)
+            if not clubs.rows:
                 await query.edit_message_text(
                     "No clubs found.",
                     reply_markup=build_back_button("back_books")
@@ -651,7 +661,7 @@ async def book_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text(
                 "📋 <b>List Books</b>\n\nSelect a club:",
                 parse_mode='HTML',
-                reply_markup=build_club_selector(clubs, "listbooks")
+                reply_markup=build_club_selector(clubs, "listbooks", data)
             )
         return BOOK_MENU
     
@@ -677,8 +687,8 @@ async def book_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data == "book_delete":
         with get_session_scope(Session) as session:
-            clubs = session.query(Club).all()
-            if not clubs:
+            clubs = club_page(session, page)
+            if not clubs.rows:
                 await query.edit_message_text(
                     "No clubs found.",
                     reply_markup=build_back_button("back_books")
@@ -688,36 +698,35 @@ async def book_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text(
                 "🗑️ <b>Delete Book</b>\n\nSelect a club:",
                 parse_mode='HTML',
-                reply_markup=build_club_selector(clubs, "delbook_club")
+                reply_markup=build_club_selector(clubs, "delbook_club", data)
             )
         return BOOK_MENU
     
     elif data.startswith("delbook_club_"):
         club_id = int(data.split("_")[2])
         with get_session_scope(Session) as session:
-            books = session.query(Book).filter_by(club_id=club_id).all()
+            books = fetch_page(
+                session, select(Book.id, Book.title, Book.total_pages).where(Book.club_id == club_id), Book.id, page
+            )
             
-            if not books:
+            if not books.rows:
                 await query.edit_message_text(
                     "No books in this club.",
                     reply_markup=build_back_button("back_books")
                 )
                 return BOOK_MENU
             
-            keyboard = []
-            for book in books:
-                keyboard.append([
-                    InlineKeyboardButton(
-                        f"🗑️ {book.title} ({book.total_pages}p)",
-                        callback_data=f"delbook_{book.id}"
-                    )
-                ])
-            keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_books")])
+            keyboard = build_page_keyboard(
+                books, data,
+                lambda book: InlineKeyboardButton(f"🗑️ {book.title} ({book.total_pages}p)",
+                                                  callback_data=f"delbook_{book.id}"),
+                back_data="back_books"
+            )
             
             await query.edit_message_text(
                 "🗑️ <b>Delete Book</b>\n\nSelect a book to delete:",
                 parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                reply_markup=keyboard
             )
         return BOOK_MENU
     
@@ -727,8 +736,13 @@ async def book_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             book = session.query(Book).filter_by(id=book_id).first()
             if book:
                 title = book.title
+                finished_by = [uid for (uid,) in session.query(UserBook.user_id).filter_by(book_id=book_id, finished=True)]
                 session.query(UserBook).filter_by(book_id=book_id).delete()
                 session.delete(book)
+                from recommendations import invalidate_club_recommendations
+                invalidate_club_recommendations(session, book.club_id)
+                if finished_by:
+                    rebuild_reading_stats(session, finished_by)
                 
                 await query.edit_message_text(
                     f"✅ Book <b>{title}</b> deleted.",
@@ -778,6 +792,8 @@ async def add_book_pages(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             session.add(book)
             session.flush()
+            from recommendations import invalidate_club_recommendations
+            invalidate_club_recommendations(session, book.club_id)
             
             await update.message.reply_text(
                 f"✅ <b>Book Added!</b>\n\n"
@@ -803,44 +819,37 @@ async def user_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    data = query.data
+    data, page = split_page_data(query.data)
     
     if data == "user_list":
         with get_session_scope(Session) as session:
-            users = session.query(User).all()
-            
-            if not users:
-                await query.edit_message_text(
-                    "👥 <b>All Users</b>\n\nNo users found.",
-                    parse_mode='HTML',
-                    reply_markup=build_back_button("back_users")
-                )
-                return USER_MENU
-            
-            keyboard = []
-            for user in users:
-                club_name = user.club.name if user.club else "No Club"
-                keyboard.append([
-                    InlineKeyboardButton(
-                        f"{user.full_name} ({club_name})",
-                        callback_data=f"viewuser_{user.id}"
-                    )
-                ])
-            keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_users")])
-            
-            await query.edit_message_text(
-                f"👥 <b>All Users</b> ({len(users)} total)\n\nSelect a user to view profile:",
-                parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
+            text, keyboard = user_list_message(session, page)
+        await query.edit_message_text(text, parse_mode='HTML', reply_markup=keyboard)
         return USER_MENU
     
+    elif data == "user_filter":
+        await query.edit_message_text(
+            "🔤 <b>Filter Users</b>\n\nType the first letters of the name:",
+            parse_mode='HTML',
+            reply_markup=build_cancel_button()
+        )
+        return USER_FILTER
+    
+    elif data == "user_search":
+        await query.edit_message_text(
+            "🔎 <b>Search Users</b>\n\nType part of a name, a @username or a Telegram ID:",
+            parse_mode='HTML',
+            reply_markup=build_cancel_button()
+        )
+        return USER_SEARCH
+    
     elif data.startswith("viewuser_"):
         user_id = int(data.split("_")[1])
         with get_session_scope(Session) as session:
-            from utils import generate_contribution_graph, generate_profile_message, calculate_reading_stats
+            from utils import month_day_statuses, current_month_logs, text_calendar, generate_profile_message, calculate_reading_stats
+            from graph_cache import send_graph
             
-            user = session.query(User).filter_by(id=user_id).first()
+            user = session.get(User, user_id, options=loader_options("profile"))
             
             if not user:
                 await query.edit_message_text(
@@ -849,10 +858,10 @@ async def user_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 )
                 return USER_MENU
             
-            logs = user.logs
+            logs = current_month_logs(session, user.id)
             
-            # Generate graph
-            graph_buf = generate_contribution_graph(logs)
+            # Plain calendar data; the image is cached or rendered off the event loop
+            calendar_data = month_day_statuses(logs)
             
             # Calculate stats
             stats = calculate_reading_stats(user)
@@ -867,12 +876,24 @@ async def user_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             # Delete the callback message and send photo
             await query.message.delete()
-            await context.bot.send_photo(
-                chat_id=query.message.chat_id,
-                photo=graph_buf,
+            chat_id = query.message.chat_id
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            
+            async def send_text_calendar():
+                return await context.bot.send_message(
+                    chat_id=chat_id,
+                    text=f"{text_calendar(*calendar_data)}\n\n{caption}",
+                    parse_mode='HTML',
+                    reply_markup=reply_markup
+                )
+            
+            await send_graph(
+                context.bot.send_photo, calendar_data,
+                fallback=send_text_calendar,
+                chat_id=chat_id,
                 caption=caption,
                 parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                reply_markup=reply_markup
             )
         return USER_MENU
 
@@ -880,7 +901,7 @@ async def user_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = int(data.split("_")[3])
         
         with get_session_scope(Session) as session:
-            user = session.query(User).filter_by(id=user_id).first()
+            user = session.get(User, user_id, options=loader_options("finished_books"))
             if not user:
                 await query.answer("User not found.")
                 return USER_MENU
@@ -915,8 +936,8 @@ async def user_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data == "user_kick":
         with get_session_scope(Session) as session:
-            clubs = session.query(Club).all()
-            if not clubs:
+            clubs = club_page(session, page)
+            if not clubs.rows:
                 await query.edit_message_text(
                     "No clubs found.",
                     reply_markup=build_back_button("back_users")
@@ -926,36 +947,32 @@ async def user_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text(
                 "🚫 <b>Kick User</b>\n\nSelect a club:",
                 parse_mode='HTML',
-                reply_markup=build_club_selector(clubs, "kickuser_club")
+                reply_markup=build_club_selector(clubs, "kickuser_club", data)
             )
         return USER_MENU
     
     elif data.startswith("kickuser_club_"):
         club_id = int(data.split("_")[2])
         with get_session_scope(Session) as session:
-            users = session.query(User).filter_by(club_id=club_id).all()
+            users = fetch_page(session, select(User.id, User.full_name).where(User.club_id == club_id), User.id, page)
             
-            if not users:
+            if not users.rows:
                 await query.edit_message_text(
                     "No users in this club.",
                     reply_markup=build_back_button("back_users")
                 )
                 return USER_MENU
             
-            keyboard = []
-            for user in users:
-                keyboard.append([
-                    InlineKeyboardButton(
-                        f"🚫 {user.full_name}",
-                        callback_data=f"kickuser_{user.id}"
-                    )
-                ])
-            keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_users")])
+            keyboard = build_page_keyboard(
+                users, data,
+                lambda user: InlineKeyboardButton(f"🚫 {user.full_name}", callback_data=f"kickuser_{user.id}"),
+                back_data="back_users"
+            )
             
             await query.edit_message_text(
                 "🚫 <b>Kick User</b>\n\nSelect a user to remove:",
                 parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                reply_markup=keyboard
             )
         return USER_MENU
     
@@ -967,6 +984,10 @@ async def user_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 name = user.full_name
                 session.query(UserBook).filter_by(user_id=user_id).delete()
                 session.query(DailyLog).filter_by(user_id=user_id).delete()
+                delete_user_stats(session, [user_id])
+                session.query(Recommendation).filter_by(user_id=user_id).delete()
+                invalidate_club(user.club_id)
+                identity_cache.invalidate(user.telegram_id)
                 session.delete(user)
                 
                 await query.edit_message_text(
@@ -983,8 +1004,8 @@ async def user_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data == "user_reset":
         with get_session_scope(Session) as session:
-            clubs = session.query(Club).all()
-            if not clubs:
+            clubs = club_page(session, page)
+            if not clubs.rows:
                 await query.edit_message_text(
                     "No clubs found.",
                     reply_markup=build_back_button("back_users")
@@ -994,36 +1015,32 @@ async def user_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text(
                 "🔄 <b>Reset User</b>\n\nSelect a club:",
                 parse_mode='HTML',
-                reply_markup=build_club_selector(clubs, "resetuser_club")
+                reply_markup=build_club_selector(clubs, "resetuser_club", data)
             )
         return USER_MENU
     
     elif data.startswith("resetuser_club_"):
         club_id = int(data.split("_")[2])
         with get_session_scope(Session) as session:
-            users = session.query(User).filter_by(club_id=club_id).all()
+            users = fetch_page(session, select(User.id, User.full_name).where(User.club_id == club_id), User.id, page)
             
-            if not users:
+            if not users.rows:
                 await query.edit_message_text(
                     "No users in this club.",
                     reply_markup=build_back_button("back_users")
                 )
                 return USER_MENU
             
-            keyboard = []
-            for user in users:
-                keyboard.append([
-                    InlineKeyboardButton(
-                        f"🔄 {user.full_name}",
-                        callback_data=f"resetuser_{user.id}"
-                    )
-                ])
-            keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_users")])
+            keyboard = build_page_keyboard(
+                users, data,
+                lambda user: InlineKeyboardButton(f"🔄 {user.full_name}", callback_data=f"resetuser_{user.id}"),
+                back_data="back_users"
+            )
             
             await query.edit_message_text(
                 "🔄 <b>Reset User</b>\n\nSelect a user to reset (keeps account, clears progress):",
                 parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                reply_markup=keyboard
             )
         return USER_MENU
     
@@ -1038,6 +1055,9 @@ async def user_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 user.streak = 0
                 user.best_streak = 0
                 session.query(DailyLog).filter_by(user_id=user_id).delete()
+                reset_log_stats(session, user_id)
+                invalidate_club(user.club_id)
+                identity_cache.invalidate(user.telegram_id)
                 
                 await query.edit_message_text(
                     f"✅ User <b>{name}</b> progress reset.",
@@ -1070,13 +1090,41 @@ async def user_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return USER_MENU
 
 
+async def filter_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show the user list filtered by the name prefix the admin typed"""
+    with get_session_scope(Session) as session:
+        text, keyboard = user_list_message(session, PageRequest(name_prefix=update.message.text.strip()))
+    await update.message.reply_text(text, parse_mode='HTML', reply_markup=keyboard)
+    return USER_MENU
+
+
+async def search_users_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show the best matches for the name, username or Telegram ID the admin typed"""
+    query_text = update.message.text.strip()
+    with get_session_scope(Session) as session:
+        users = search_users(session, query_text)
+    
+    def label(user):
+        username = f" @{user.username}" if user.username else ""
+        return f"{user.full_name}{username} ({user.club_name or 'No Club'})"
+    
+    keyboard = [[InlineKeyboardButton(label(user), callback_data=f"viewuser_{user.id}")] for user in users]
+    keyboard.append([InlineKeyboardButton("🔎 New Search", callback_data="user_search")])
+    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_users")])
+    
+    title = f"🔎 <b>Users matching {html.escape(query_text)}</b>"
+    text = f"{title}\n\nSelect a user to view profile:" if users else f"{title}\n\nNo users found."
+    await update.message.reply_text(text, parse_mode='HTML', reply_markup=InlineKeyboardMarkup(keyboard))
+    return USER_MENU
+
+
 async def view_user_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """View a user's profile by Telegram ID"""
     try:
         telegram_id = int(update.message.text)
         
         with get_session_scope(Session) as session:
-            user = session.query(User).filter_by(telegram_id=telegram_id).first()
+            user = get_user(session, telegram_id)
             
             if not user:
                 await update.message.reply_text(
@@ -1086,6 +1134,8 @@ async def view_user_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 return ConversationHandler.END
             
             club_name = user.club.name if user.club else "None"
+            books_count = session.query(UserBook).filter(UserBook.user_id == user.id).count()
+            logs_count = session.query(DailyLog).filter(DailyLog.user_id == user.id).count()
             
             text = (
                 f"👤 <b>{user.full_name}</b>\n\n"
@@ -1095,8 +1145,8 @@ async def view_user_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"<b>XP:</b> {user.xp}\n"
                 f"<b>Streak:</b> {user.streak} days\n"
                 f"<b>Best Streak:</b> {user.best_streak} days\n"
-                f"<b>Books:</b> {len(user.readings)}\n"
-                f"<b>Logs:</b> {len(user.logs)}\n"
+                f"<b>Books:</b> {books_count}\n"
+                f"<b>Logs:</b> {logs_count}\n"
             )
             
             await update.message.reply_text(text, parse_mode='HTML')
@@ -1116,12 +1166,12 @@ async def stats_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
     
-    data = query.data
+    data, page = split_page_data(query.data)
     
     if data == "stats_club":
         with get_session_scope(Session) as session:
-            clubs = session.query(Club).all()
-            if not clubs:
+            clubs = club_page(session, page)
+            if not clubs.rows:
                 await query.edit_message_text(
                     "No clubs found.",
                     reply_markup=build_back_button("back_stats")
@@ -1131,7 +1181,7 @@ async def stats_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await query.edit_message_text(
                 "📊 <b>Club Statistics</b>\n\nSelect a club:",
                 parse_mode='HTML',
-                reply_markup=build_club_selector(clubs, "clubstats")
+                reply_markup=build_club_selector(clubs, "clubstats", data)
             )
         return STATS_MENU
     
@@ -1139,7 +1189,7 @@ async def stats_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         club_id = int(data.split("_")[1])
         with get_session_scope(Session) as session:
             from sqlalchemy import func
-            from datetime import date
+            from datetime import date, timedelta
             
             club = session.query(Club).filter_by(id=club_id).first()
             users = session.query(User).filter_by(club_id=club_id).all()
@@ -1169,6 +1219,25 @@ async def stats_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
             else:
                 text += f"<b>Daily Goal:</b> {club.daily_min_total}p total\n"
             
+            # Last 7 days for the whole club, one query + numpy
+            from log_arrays import load_log_arrays, window_stats
+            report_day = get_today_date()
+            week_start = report_day - timedelta(days=6)
+            week = window_stats(
+                load_log_arrays(session, club_id=club_id, since=week_start),
+                week_start, report_day + timedelta(days=1)
+            )
+            week_pages = sum(w['pages'] for w in week.values())
+            week_active = sum(1 for w in week.values() if w['days_active'])
+            avg_per_member = week_pages / len(users) / 7 if users else 0
+            text += (
+                f"\n<b>📅 Last 7 Days:</b>\n"
+                f"Pages: {week_pages} (PRL {sum(w['prl'] for w in week.values())}, "
+                f"RNK {sum(w['rnk'] for w in week.values())})\n"
+                f"Active members: {week_active}/{len(users)}\n"
+                f"Avg per member: {avg_per_member:.1f} pages/day\n"
+            )
+            
             # Top readers
             if users:
                 top_users = sorted(users, key=lambda u: u.xp, reverse=True)[:5]
@@ -1185,8 +1254,8 @@ async def stats_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     elif data == "stats_leaderboard":
         with get_session_scope(Session) as session:
-            clubs = session.query(Club).all()
-            if not clubs:
+            clubs = club_page(session, page)
+            if not clubs.rows:
                 await query.edit_message_text(
                     "No clubs found.",
                     reply_markup=build_back_button("back_stats")
@@ -1196,7 +1265,7 @@ async def stats_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await query.edit_message_text(
                 "🏆 <b>Leaderboard</b>\n\nSelect a club:",
                 parse_mode='HTML',
-                reply_markup=build_club_selector(clubs, "leaderboard")
+                reply_markup=build_club_selector(clubs, "leaderboard", data)
             )
         return STATS_MENU
     
@@ -1223,27 +1292,19 @@ async def stats_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         with get_session_scope(Session) as session:
             club = session.query(Club).filter_by(id=club_id).first()
             
-            # Get all club members
-            members = session.query(User).filter_by(club_id=club_id).all()
-            
-            # Calculate pages read today for each member
-            member_pages = []
-            for member in members:
-                log = session.query(DailyLog).filter_by(user_id=member.id, date=today).first()
-                pages = (log.pages_read_prl or 0) + (log.pages_read_rnk or 0) if log else 0
-                member_pages.append((member, pages))
-            
-            # Sort by pages descending
-            sorted_members = sorted(member_pages, key=lambda x: x[1], reverse=True)
+            # Today's pages per member, from the shared club-day snapshot
+            snapshot = get_snapshot(session, club_id, today)
+            names = dict(session.query(User.id, User.full_name).filter_by(club_id=club_id))
+            sorted_members = [(names.get(user_id, "Unknown"), pages) for user_id, pages in snapshot.ranking()]
             
             if not sorted_members:
                 text = f"📅 <b>Daily Leaderboard - {club.name}</b>\n\nNo activity today."
             else:
                 text = f"📅 <b>Daily Leaderboard - {club.name}</b>\n\n"
                 medals = ["🥇", "🥈", "🥉"]
-                for i, (user, pages) in enumerate(sorted_members, 1):
+                for i, (full_name, pages) in enumerate(sorted_members, 1):
                     medal = medals[i-1] if i <= 3 else f"{i}."
-                    text += f"{medal} <b>{user.full_name}</b>: {pages} pages\n"
+                    text += f"{medal} <b>{full_name}</b>: {pages} pages\n"
         
         await query.edit_message_text(
             text,
@@ -1287,15 +1348,38 @@ async def stats_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 # ==================== BROADCAST HANDLERS ====================
 
+async def show_broadcast_targets(query, page):
+    """Broadcast options: all users or a page of clubs"""
+    with get_session_scope(Session) as session:
+        clubs = club_page(session, page)
+        user_count = session.scalar(select(func.count()).select_from(User))
+    
+    keyboard = build_page_keyboard(
+        clubs, "menu_broadcast",
+        lambda club: InlineKeyboardButton(f"📋 {club.name} ({club.members})", callback_data=f"broadcast_{club.id}"),
+        top_rows=[[InlineKeyboardButton(f"📢 All Users ({user_count})", callback_data="broadcast_all")]]
+    )
+    await query.edit_message_text(
+        "📢 <b>Broadcast Message</b>\n\nSelect target:",
+        parse_mode='HTML',
+        reply_markup=keyboard
+    )
+
+
 @admin_only_callback
 async def broadcast_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle broadcast target selection"""
     query = update.callback_query
     await query.answer()
     
-    data = query.data
+    data, page = split_page_data(query.data)
+    
+    if data == "menu_broadcast":
+        # Prev/Next in the target list
+        await show_broadcast_targets(query, page)
+        return BROADCAST_CLUB
     
-    if data == "broadcast_all":
+    elif data == "broadcast_all":
         context.user_data['broadcast_target'] = 'all'
         await query.edit_message_text(
             "📢 <b>Broadcast to ALL Users</b>\n\n"
@@ -1340,26 +1424,17 @@ async def send_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("No users to send to.")
             return ConversationHandler.END
         
-        sent_count = 0
-        failed_count = 0
-        
-        for user in users:
-            try:
-                await context.bot.send_message(
-                    chat_id=user.telegram_id,
-                    text=f"{header}\n\n{message}",
-                    parse_mode='HTML'
-                )
-                sent_count += 1
-            except Exception:
-                failed_count += 1
-        
-        await update.message.reply_text(
-            f"✅ Broadcast sent!\n\n"
-            f"<b>Sent:</b> {sent_count}\n"
-            f"<b>Failed:</b> {failed_count}",
-            parse_mode='HTML'
-        )
+        outgoing = [OutgoingMessage(user.telegram_id, f"{header}\n\n{message}") for user in users]
+    
+    stats = await deliver(context.bot, outgoing, name="send_broadcast")
+    
+    await update.message.reply_text(
+        f"✅ Broadcast sent!\n\n"
+        f"<b>Sent:</b> {stats.sent}\n"
+        f"<b>Failed:</b> {stats.failed}\n"
+        f"<b>Time:</b> {stats.elapsed:.1f}s",
+        parse_mode='HTML'
+    )
     
     context.user_data.clear()
     return ConversationHandler.END
@@ -1428,11 +1503,21 @@ admin_panel_conv = ConversationHandler(
             MessageHandler(filters.TEXT & ~filters.COMMAND, view_user_profile),
             CallbackQueryHandler(cancel_action, pattern="^cancel_action$"),
         ],
+        USER_FILTER: [
+            MessageHandler(filters.TEXT & ~filters.COMMAND, filter_users),
+            CallbackQueryHandler(cancel_action, pattern="^cancel_action$"),
+        ],
+        USER_SEARCH: [
+            MessageHandler(filters.TEXT & ~filters.COMMAND, search_users_handler),
+            CallbackQueryHandler(cancel_action, pattern="^cancel_action$"),
+        ],
     },
     fallbacks=[
         CommandHandler('cancel', cancel_handler),
         CallbackQueryHandler(cancel_action, pattern="^cancel_action$"),
     ],
+    name='admin_panel_conv',
+    persistent=True,
     per_message=False,
     allow_reentry=True
 )
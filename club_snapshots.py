@@ -0,0 +1,110 @@
+"""
+In-memory per-(club, day) snapshot of today's club activity.
+
+finish_report used to load every club member and query their DailyLog one by
+one to build the "Club Stats" block and the user's rank. A snapshot keeps the
+status counts and a sorted (pages desc) list of members for one club and day:
+  * built with a single query on first use (or after invalidation)
+  * updated in place when a report is saved
+so counts are O(1) and the rank is a bisect.
+
+Anything that changes membership or rewrites logs in bulk must invalidate:
+join/change club, kick, reset, club delete, check-in and close_questionnaire.
+"""
+import bisect
+from collections import Counter
+
+from sqlalchemy import event, select, and_, func
+
+from database import User, DailyLog
+
+SKIPPED = 'skipped'  # member without a log for the day
+
+
+class ClubDaySnapshot:
+    def __init__(self, club_id, day, rows):
+        """`rows` are (user_id, pages, status) with status None when there's no log."""
+        self.club_id = club_id
+        self.day = day
+        self._members = {}  # user_id -> (pages, status)
+        self._ranking = []  # sorted (-pages, user_id)
+        self.counts = Counter()
+        for user_id, pages, status in rows:
+            status = status or SKIPPED
+            self._members[user_id] = (pages, status)
+            self.counts[status] += 1
+        self._ranking = sorted((-pages, user_id) for user_id, (pages, _) in self._members.items())
+
+    @property
+    def total_members(self):
+        return len(self._members)
+
+    def percent(self, status):
+        return self.counts[status] / self.total_members * 100 if self.total_members else 0
+
+    def update(self, user_id, pages, status):
+        """Fold a saved report (the member's new day totals) into the snapshot."""
+        old = self._members.get(user_id)
+        if old is not None:
+            old_pages, old_status = old
+            self.counts[old_status] -= 1
+            del self._ranking[bisect.bisect_left(self._ranking, (-old_pages, user_id))]
+        self._members[user_id] = (pages, status)
+        self.counts[status] += 1
+        bisect.insort(self._ranking, (-pages, user_id))
+
+    def rank(self, user_id):
+        """1-based position by pages today (ties by user id), or None for non-members."""
+        member = self._members.get(user_id)
+        if member is None:
+            return None
+        return bisect.bisect_left(self._ranking, (-member[0], user_id)) + 1
+
+    def ranking(self):
+        """[(user_id, pages)] sorted by pages read, most first."""
+        return [(user_id, -neg_pages) for neg_pages, user_id in self._ranking]
+
+
+_snapshots = {}
+
+
+def load_snapshot(session, club_id, day):
+    """Build a snapshot from the database with one query."""
+    pages = func.coalesce(DailyLog.pages_read_prl, 0) + func.coalesce(DailyLog.pages_read_rnk, 0)
+    rows = session.execute(
+        select(User.id, pages, DailyLog.status)
+        .outerjoin(DailyLog, and_(DailyLog.user_id == User.id, DailyLog.date == day))
+        .where(User.club_id == club_id)
+    ).all()
+    return ClubDaySnapshot(club_id, day, rows)
+
+
+def get_snapshot(session, club_id, day):
+    snapshot = _snapshots.get((club_id, day))
+    if snapshot is None:
+        # Only today's snapshots are useful; drop the rest when the day rolls over
+        for key in [key for key in _snapshots if key[1] != day]:
+            del _snapshots[key]
+        snapshot = _snapshots[(club_id, day)] = load_snapshot(session, club_id, day)
+    return snapshot
+
+
+def record_report(session, club_id, day, user_id, pages, status):
+    """
+    Update the cached snapshot (if any) with a report saved in `session`.
+    Should that transaction roll back, the snapshot is dropped instead.
+    """
+    snapshot = _snapshots.get((club_id, day))
+    if snapshot is None:
+        return
+    snapshot.update(user_id, pages, status)
+    event.listen(session, "after_soft_rollback", lambda *args: invalidate_club(club_id), once=True)
+
+
+def invalidate_club(*club_ids):
+    for key in [key for key in _snapshots if key[0] in club_ids]:
+        del _snapshots[key]
+
+
+def clear():
+    _snapshots.clear()
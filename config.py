@@ -22,8 +22,31 @@ WEEKLY_SUMMARY_DAY = 6  # Sunday
 # ==================== LIMITS ====================
 MAX_MESSAGE_LENGTH = 4000
 MAX_BUTTONS_PER_MESSAGE = 50
+ADMIN_PAGE_SIZE = 20  # Rows per page in admin list keyboards (plus navigation, under MAX_BUTTONS_PER_MESSAGE)
 LEADERBOARD_LIMIT = 10
 
+# ==================== DELIVERY ====================
+# Telegram allows ~30 messages/second per bot and ~1 message/second per chat
+DELIVERY_CONCURRENCY = int(os.getenv('DELIVERY_CONCURRENCY', 20))
+DELIVERY_GLOBAL_RATE = 30
+DELIVERY_PER_CHAT_RATE = 1
+DELIVERY_MAX_RETRIES = 3
+
+# ==================== CONTRIBUTION GRAPH ====================
+# Rendered calendars are cached by (month, today, day statuses); empty dir = memory only
+GRAPH_CACHE_SIZE = int(os.getenv('GRAPH_CACHE_SIZE', 512))
+GRAPH_CACHE_DIR = os.getenv('GRAPH_CACHE_DIR', 'cache/graphs')
+# 'matplotlib' (original look) or 'pillow' (same layout, much cheaper to import and render)
+GRAPH_RENDERER = os.getenv('GRAPH_RENDERER', 'matplotlib')
+# Renders run in a process pool; past GRAPH_RENDER_MAX_QUEUE pending renders users get a text calendar
+GRAPH_RENDER_WORKERS = int(os.getenv('GRAPH_RENDER_WORKERS', 2))
+GRAPH_RENDER_MAX_QUEUE = int(os.getenv('GRAPH_RENDER_MAX_QUEUE', 8))
+
+# ==================== IDENTITY CACHE ====================
+# telegram_id -> (user id, club goal settings) for handler entry points
+IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', 4096))
+IDENTITY_CACHE_TTL = int(os.getenv('IDENTITY_CACHE_TTL', 300))  # seconds
+
 # ==================== BADGE THRESHOLDS ====================
 STREAK_THRESHOLDS = [3, 7, 30]
 PAGE_THRESHOLDS = [100, 500, 1000]
@@ -36,4 +59,19 @@ CLUB_CHAMPION_DAYS = 7
 DEFAULT_TIMEZONE = os.getenv('TIMEZONE', 'Etc/GMT-5')
 
 # ==================== DATABASE ====================
-DATABASE_PATH = 'sqlite:///reading_club.db'
+DATABASE_PATH = os.getenv('DATABASE_URL', 'sqlite:///reading_club.db')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+
+# SQLite connection profile, applied to every new connection.
+# Each value can be overridden from the environment; an empty value skips that pragma.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)),
+    'cache_size': os.getenv('SQLITE_CACHE_SIZE', '-65536'),  # negative = KiB, i.e. 64 MB
+    'temp_store': os.getenv('SQLITE_TEMP_STORE', 'MEMORY'),
+    'busy_timeout': os.getenv('SQLITE_BUSY_TIMEOUT', '5000'),  # ms to wait on a locked database
+    'foreign_keys': os.getenv('SQLITE_FOREIGN_KEYS', ''),
+}
@@ -1,9 +1,16 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, ForeignKey, Date, DateTime
+from sqlalchemy import (
+    create_engine, event, make_url, inspect, insert, select, update, func, or_, text,
+    Column, Integer, String, Boolean, ForeignKey, Date, DateTime, Index, LargeBinary
+)
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from datetime import datetime
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
 from sqlalchemy.exc import SQLAlchemyError
+from config import DATABASE_PATH, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, SQLITE_PRAGMAS
 import logging
+import threading
+import time
 
 Base = declarative_base()
 
@@ -28,7 +35,7 @@ class Book(Base):
     title = Column(String, nullable=False)
     category = Column(String, nullable=False) # 'PRL' or 'RNK'
     total_pages = Column(Integer, nullable=False)
-    club_id = Column(Integer, ForeignKey('clubs.id'))
+    club_id = Column(Integer, ForeignKey('clubs.id'), index=True)
     priority_level = Column(Integer, default=8)  # 1-8, lower is higher priority
     
     club = relationship("Club", back_populates="books")
@@ -40,7 +47,7 @@ class User(Base):
     telegram_id = Column(Integer, unique=True, nullable=False, index=True)
     username = Column(String)
     full_name = Column(String)
-    club_id = Column(Integer, ForeignKey('clubs.id'), nullable=True)
+    club_id = Column(Integer, ForeignKey('clubs.id'), nullable=True, index=True)
     streak = Column(Integer, default=0)
     joined_at = Column(DateTime, default=datetime.now)
     
@@ -48,6 +55,7 @@ class User(Base):
     readings = relationship("UserBook", back_populates="user")
     logs = relationship("DailyLog", back_populates="user")
     badges = relationship("UserBadge", back_populates="user")
+    reading_stats = relationship("UserReadingStats", back_populates="user", uselist=False)
     
     # Gamification & Settings
     xp = Column(Integer, default=0)
@@ -91,6 +99,8 @@ class UserBadge(Base):
 
 class DailyLog(Base):
     __tablename__ = 'daily_logs'
+    # One log per user per day; also serves every (user_id, date) lookup
+    __table_args__ = (Index('ux_daily_logs_user_date', 'user_id', 'date', unique=True),)
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), index=True)
     date = Column(Date, nullable=False, index=True)
@@ -100,6 +110,67 @@ class DailyLog(Base):
     
     user = relationship("User", back_populates="logs")
 
+class UserReadingStats(Base):
+    """Per-user reading aggregates, kept up to date on every report (see reading_stats.py)"""
+    __tablename__ = 'user_reading_stats'
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    total_pages = Column(Integer, default=0, nullable=False)
+    total_prl = Column(Integer, default=0, nullable=False)
+    total_rnk = Column(Integer, default=0, nullable=False)
+    active_days = Column(Integer, default=0, nullable=False)
+    first_log_date = Column(Date, nullable=True)  # Date of the first daily log, any status
+    books_finished = Column(Integer, default=0, nullable=False)
+    
+    # Pages read per weekday (Monday..Sunday)
+    pages_mon = Column(Integer, default=0, nullable=False)
+    pages_tue = Column(Integer, default=0, nullable=False)
+    pages_wed = Column(Integer, default=0, nullable=False)
+    pages_thu = Column(Integer, default=0, nullable=False)
+    pages_fri = Column(Integer, default=0, nullable=False)
+    pages_sat = Column(Integer, default=0, nullable=False)
+    pages_sun = Column(Integer, default=0, nullable=False)
+    
+    user = relationship("User", back_populates="reading_stats")
+
+class Recommendation(Base):
+    """Next recommended book per user, precomputed nightly (see recommendations.py)"""
+    __tablename__ = 'recommendations'
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    book_id = Column(Integer, ForeignKey('books.id'), nullable=True)  # None = nothing left to recommend
+    priority = Column(Integer, nullable=True)
+    computed_at = Column(DateTime, default=datetime.now, nullable=False)
+    
+    book = relationship("Book")
+
+class JobRun(Base):
+    """One run of a scheduled job for one logical date, with its checkpoint (see job_runs.py)"""
+    __tablename__ = 'job_runs'
+    __table_args__ = (Index('ux_job_runs_name_date', 'job_name', 'run_date', unique=True),)
+    id = Column(Integer, primary_key=True)
+    job_name = Column(String, nullable=False)  # e.g. 'close_questionnaire', 'send_reminder_20'
+    run_date = Column(Date, nullable=False)  # The day the run is for, not when it ran
+    status = Column(String, default='running', nullable=False)  # running, done, abandoned
+    last_id = Column(Integer, nullable=True)  # Last user id processed (club id for the daily report); None = nothing yet
+    started_at = Column(DateTime, default=datetime.now, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+class PersistedData(Base):
+    """One user_data / chat_data entry, or bot_data / callback_data, for the bot's persistence (see persistence.py)"""
+    __tablename__ = 'persisted_data'
+    kind = Column(String, primary_key=True)  # 'user_data', 'chat_data', 'bot_data', 'callback_data'
+    key = Column(Integer, primary_key=True)  # User or chat id, 0 for bot_data / callback_data
+    value = Column(LargeBinary, nullable=False)  # Pickled
+    updated_at = Column(DateTime, default=datetime.now, nullable=False)
+
+class PersistedConversation(Base):
+    """State of one in-flight conversation (see persistence.py); deleted when it ends"""
+    __tablename__ = 'persisted_conversations'
+    name = Column(String, primary_key=True)  # ConversationHandler name
+    key = Column(String, primary_key=True)  # Conversation key (chat id, user id, ...) as JSON
+    state = Column(LargeBinary, nullable=False)  # Pickled
+    updated_at = Column(DateTime, default=datetime.now, nullable=False)
+
 class ActionLog(Base):
     __tablename__ = 'action_logs'
     id = Column(Integer, primary_key=True)
@@ -114,10 +185,386 @@ class ActionLog(Base):
     user = relationship("User")
     club = relationship("Club")
 
-def init_db(db_path='sqlite:///reading_club.db'):
-    engine = create_engine(db_path)
-    Base.metadata.create_all(engine)
-    return sessionmaker(bind=engine, expire_on_commit=False)
+# ==================== UPSERTS ====================
+
+def _dialect_insert(session):
+    """Return the dialect's INSERT construct if it supports ON CONFLICT, else None."""
+    dialect = session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+def upsert_daily_log(session, user_id, day, pages_prl=0, pages_rnk=0):
+    """
+    Create the user's log for `day` or add pages to the existing one, in a
+    single INSERT ... ON CONFLICT statement. Returns the up-to-date DailyLog.
+    """
+    dialect_insert = _dialect_insert(session)
+    if dialect_insert is None:
+        log = session.query(DailyLog).filter_by(user_id=user_id, date=day).first()
+        if not log:
+            log = DailyLog(user_id=user_id, date=day, status='pending', pages_read_prl=0, pages_read_rnk=0)
+            session.add(log)
+        log.pages_read_prl = (log.pages_read_prl or 0) + pages_prl
+        log.pages_read_rnk = (log.pages_read_rnk or 0) + pages_rnk
+        session.flush()
+        return log
+
+    stmt = dialect_insert(DailyLog).values(
+        user_id=user_id, date=day, status='pending',
+        pages_read_prl=pages_prl, pages_read_rnk=pages_rnk
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'date'],
+        set_={
+            'pages_read_prl': func.coalesce(DailyLog.pages_read_prl, 0) + stmt.excluded.pages_read_prl,
+            'pages_read_rnk': func.coalesce(DailyLog.pages_read_rnk, 0) + stmt.excluded.pages_read_rnk,
+        }
+    ).returning(DailyLog)
+    return session.scalars(stmt, execution_options={'populate_existing': True}).one()
+
+def insert_missing_daily_logs(session, user_ids, day, status='pending', chunk_size=500):
+    """
+    Create a `status` log for `day` for every user that doesn't have one yet.
+    Returns the set of user ids that got a new log.
+    """
+    created = set()
+    user_ids = list(user_ids)
+    dialect_insert = _dialect_insert(session)
+
+    for i in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[i:i + chunk_size]
+        rows = [{'user_id': uid, 'date': day, 'status': status, 'pages_read_prl': 0, 'pages_read_rnk': 0} for uid in chunk]
+
+        if dialect_insert is None:
+            existing = set(session.scalars(
+                select(DailyLog.user_id).where(DailyLog.user_id.in_(chunk), DailyLog.date == day)
+            ))
+            rows = [r for r in rows if r['user_id'] not in existing]
+            if rows:
+                session.execute(insert(DailyLog), rows)
+            created.update(r['user_id'] for r in rows)
+            continue
+
+        stmt = (
+            dialect_insert(DailyLog).values(rows)
+            .on_conflict_do_nothing(index_elements=['user_id', 'date'])
+            .returning(DailyLog.user_id)
+        )
+        created.update(session.execute(stmt).scalars())
+
+    # A new log can be the user's first one (the all-time average counts from it)
+    created_ids = list(created)
+    for i in range(0, len(created_ids), chunk_size):
+        session.execute(
+            update(UserReadingStats)
+            .where(UserReadingStats.user_id.in_(created_ids[i:i + chunk_size]),
+                   or_(UserReadingStats.first_log_date.is_(None), UserReadingStats.first_log_date > day))
+            .values(first_log_date=day)
+        )
+    return created
+
+# ==================== MIGRATIONS ====================
+
+STATUS_PRIORITY = ['achieved', 'read_not_enough', 'not_read', 'missed', 'pending']
+
+def migrate_daily_log_unique_index(connection):
+    """Merge duplicate (user_id, date) logs and add the unique index on existing databases."""
+    indexes = {ix['name'] for ix in inspect(connection).get_indexes('daily_logs')}
+    if 'ux_daily_logs_user_date' in indexes:
+        return
+
+    duplicates = connection.execute(text(
+        "SELECT user_id, date FROM daily_logs GROUP BY user_id, date HAVING COUNT(*) > 1"
+    )).all()
+    for user_id, day in duplicates:
+        rows = connection.execute(text(
+            "SELECT id, pages_read_prl, pages_read_rnk, status FROM daily_logs "
+            "WHERE user_id = :user_id AND date = :day ORDER BY id"
+        ), {'user_id': user_id, 'day': day}).all()
+        keep = rows[0]
+        statuses = [r.status for r in rows if r.status in STATUS_PRIORITY]
+        best_status = min(statuses, key=STATUS_PRIORITY.index) if statuses else keep.status
+        connection.execute(text(
+            "UPDATE daily_logs SET pages_read_prl = :prl, pages_read_rnk = :rnk, status = :status WHERE id = :id"
+        ), {
+            'prl': sum(r.pages_read_prl or 0 for r in rows),
+            'rnk': sum(r.pages_read_rnk or 0 for r in rows),
+            'status': best_status,
+            'id': keep.id,
+        })
+        connection.execute(text(
+            "DELETE FROM daily_logs WHERE user_id = :user_id AND date = :day AND id != :id"
+        ), {'user_id': user_id, 'day': day, 'id': keep.id})
+
+    if duplicates:
+        logging.getLogger(__name__).warning(f"Merged {len(duplicates)} duplicate daily log groups")
+    unique_index = next(ix for ix in DailyLog.__table__.indexes if ix.name == 'ux_daily_logs_user_date')
+    unique_index.create(connection)
+
+def migrate_missing_indexes(connection):
+    """Create model indexes added after a table already existed (create_all skips existing tables)."""
+    inspector = inspect(connection)
+    for table in (User.__table__, Book.__table__):
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+
+def backfill_user_reading_stats(connection):
+    """Fill the reading stats rollup from daily_logs the first time it exists."""
+    from reading_stats import rebuild
+    has_stats = connection.execute(select(func.count()).select_from(UserReadingStats)).scalar()
+    has_logs = connection.execute(select(func.count()).select_from(DailyLog)).scalar()
+    if has_logs and not has_stats:
+        rebuild(connection)
+
+def create_user_search_index(connection):
+    """FTS index behind the admin user search, built from users once (SQLite only)."""
+    from user_search import create_search_index
+    create_search_index(connection)
+
+MIGRATIONS = [
+    migrate_daily_log_unique_index,
+    migrate_missing_indexes,
+    backfill_user_reading_stats,
+    create_user_search_index,
+]
+
+def run_migrations(engine):
+    """Bring an existing database up to date with the current models."""
+    with engine.begin() as connection:
+        for migration in MIGRATIONS:
+            migration(connection)
+
+# ==================== ENGINE ====================
+
+def install_sqlite_profile(engine, pragmas=None):
+    """
+    Apply the SQLite performance profile (WAL, synchronous=NORMAL, mmap,
+    cache, temp_store, busy_timeout) to every connection the engine opens.
+    """
+    pragmas = {k: v for k, v in (pragmas or SQLITE_PRAGMAS).items() if v not in (None, '')}
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    return engine
+
+
+def engine_options(url, engine_kwargs=None):
+    """Pool and driver options shared by the sync and async engines for `url`."""
+    is_sqlite = url.get_backend_name() == 'sqlite'
+    kwargs = dict(engine_kwargs or {})
+    # In-memory SQLite uses a single-connection pool that takes no sizing options
+    if not (is_sqlite and url.database in (None, '', ':memory:')):
+        kwargs.setdefault('pool_size', DB_POOL_SIZE)
+        kwargs.setdefault('max_overflow', DB_MAX_OVERFLOW)
+        kwargs.setdefault('pool_timeout', DB_POOL_TIMEOUT)
+        kwargs.setdefault('pool_pre_ping', True)
+
+    if is_sqlite and SQLITE_PRAGMAS.get('busy_timeout'):
+        # pysqlite has its own lock wait on top of the pragma; keep them in sync
+        connect_args = dict(kwargs.get('connect_args', {}))
+        connect_args.setdefault('timeout', int(SQLITE_PRAGMAS['busy_timeout']) / 1000)
+        kwargs['connect_args'] = connect_args
+    return kwargs
+
+
+class SessionRegistry:
+    """
+    Process-wide engine and sessionmaker, created lazily on first use.
+    Every module shares this one object (`database.Session`), so there is a
+    single connection pool and `create_all` runs once per process.
+    """
+
+    def __init__(self, url=None, **engine_kwargs):
+        self._url = url
+        self._engine_kwargs = engine_kwargs
+        self._engine = None
+        self._factory = None
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return self._url or DATABASE_PATH
+
+    def configure(self, url=None, **engine_kwargs):
+        """Point the registry at another database (disposes the current engine)."""
+        with self._lock:
+            self._dispose()
+            self._url = url
+            self._engine_kwargs = engine_kwargs
+
+    @contextmanager
+    def override(self, bind):
+        """Temporarily hand out sessions bound to `bind` (an Engine or Connection), e.g. in tests."""
+        with self._lock:
+            saved = (self._engine, self._factory)
+            self._factory = sessionmaker(bind=bind, expire_on_commit=False)
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._engine, self._factory = saved
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = self._create_engine()
+        return self._engine
+
+    @property
+    def factory(self):
+        if self._factory is None:
+            engine = self.engine
+            with self._lock:
+                if self._factory is None:
+                    self._factory = sessionmaker(bind=engine, expire_on_commit=False)
+        return self._factory
+
+    def __call__(self):
+        return self.factory()
+
+    def pool_stats(self):
+        """Snapshot of the connection pool (empty if no engine was created yet)."""
+        if self._engine is None:
+            return {}
+        pool = self._engine.pool
+        stats = {'class': type(pool).__name__, 'status': pool.status()}
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            if hasattr(pool, name):
+                stats[name] = getattr(pool, name)()
+        return stats
+
+    def dispose(self):
+        with self._lock:
+            self._dispose()
+
+    def _dispose(self):
+        if self._engine is not None:
+            self._engine.dispose()
+        self._engine = None
+        self._factory = None
+
+    def _create_engine(self):
+        url = make_url(self.url)
+        is_sqlite = url.get_backend_name() == 'sqlite'
+        kwargs = engine_options(url, self._engine_kwargs)
+
+        started = time.perf_counter()
+        engine = create_engine(url, **kwargs)
+        if is_sqlite:
+            install_sqlite_profile(engine)
+        Base.metadata.create_all(engine)
+        run_migrations(engine)
+        logging.getLogger(__name__).info(
+            f"Database engine ready for {url.render_as_string(hide_password=True)} "
+            f"in {time.perf_counter() - started:.3f}s"
+        )
+        return engine
+
+
+Session = SessionRegistry()
+
+
+# Async drivers for the backends we run on (the sync URL stays the config format)
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+def async_url(url):
+    """The asyncio-driver version of a database URL (sqlite -> aiosqlite, postgresql -> asyncpg)."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend!r} databases")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+class AsyncSessionRegistry:
+    """
+    AsyncEngine/AsyncSession counterpart of SessionRegistry, always on the same
+    database as `sync_registry`. Handlers migrated to it await their queries
+    instead of blocking the event loop. Schema creation and migrations still
+    run once through the sync engine, which scripts (test_bot.py, the
+    reading_stats rebuild) keep using as before.
+    """
+
+    def __init__(self, sync_registry):
+        self._sync = sync_registry
+        self._engine = None
+        self._engine_url = None
+        self._factory = None
+        self._override = None
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return async_url(self._sync.url)
+
+    @contextmanager
+    def override(self, bind):
+        """Temporarily hand out sessions bound to `bind` (an AsyncEngine or AsyncConnection), e.g. in tests."""
+        saved = self._override
+        self._override = async_sessionmaker(bind=bind, expire_on_commit=False)
+        try:
+            yield self
+        finally:
+            self._override = saved
+
+    @property
+    def engine(self):
+        url = self.url
+        if self._engine is None or self._engine_url != url:
+            with self._lock:
+                if self._engine is None or self._engine_url != url:
+                    self._engine, self._engine_url = self._create_engine(url), url
+                    self._factory = async_sessionmaker(bind=self._engine, expire_on_commit=False)
+        return self._engine
+
+    @property
+    def factory(self):
+        if self._override is not None:
+            return self._override
+        self.engine
+        return self._factory
+
+    def __call__(self):
+        return self.factory()
+
+    async def dispose(self):
+        engine, self._engine, self._factory = self._engine, None, None
+        if engine is not None:
+            await engine.dispose()
+
+    def _create_engine(self, url):
+        # Tables and migrations come from the sync engine (created once per process)
+        self._sync.engine
+        engine = create_async_engine(url, **engine_options(url))
+        if url.get_backend_name() == 'sqlite':
+            install_sqlite_profile(engine.sync_engine)
+        return engine
+
+
+AsyncSession = AsyncSessionRegistry(Session)
+
+def init_db(db_path=None):
+    """Initialise the shared engine (optionally for another URL) and return the session registry."""
+    if db_path and db_path != Session.url:
+        Session.configure(db_path)
+    Session.engine
+    return Session
 
 @contextmanager
 def get_session_scope(SessionFactory):
@@ -131,3 +578,16 @@ def get_session_scope(SessionFactory):
         raise
     finally:
         session.close()
+
+@asynccontextmanager
+async def get_async_session_scope(SessionFactory):
+    """Async version of get_session_scope, for the AsyncSession registry or any async_sessionmaker."""
+    session = SessionFactory()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
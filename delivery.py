@@ -0,0 +1,182 @@
+"""
+Shared message delivery engine for scheduled jobs and admin broadcasts.
+
+Messages are sent through a bounded pool of concurrent workers. Every send
+waits for a token from the bot-wide bucket (Telegram's global limit) and from
+the per-chat bucket of its recipient, and RetryAfter responses pause the whole
+bucket so other workers back off as well.
+"""
+import asyncio
+import logging
+import time
+import weakref
+from dataclasses import dataclass
+from datetime import timedelta
+
+from telegram.error import BadRequest, RetryAfter, NetworkError, TelegramError, TimedOut
+
+from config import (
+    DELIVERY_CONCURRENCY, DELIVERY_GLOBAL_RATE, DELIVERY_PER_CHAT_RATE,
+    DELIVERY_MAX_RETRIES
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Block all acquirers for `seconds` (used on RetryAfter)."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class OutgoingMessage:
+    chat_id: int
+    text: str
+    parse_mode: str = 'HTML'
+
+
+@dataclass
+class DeliveryStats:
+    name: str
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rate(self):
+        """Messages per second over the whole run"""
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.name}: sent={self.sent} failed={self.failed} retried={self.retried} "
+            f"elapsed={self.elapsed:.2f}s ({self.rate:.1f} msg/s)"
+        )
+
+
+# One global bucket per event loop - the Telegram limit applies to the bot as a
+# whole, so concurrent jobs must share it.
+_global_buckets = weakref.WeakKeyDictionary()
+
+
+def get_global_bucket():
+    loop = asyncio.get_running_loop()
+    bucket = _global_buckets.get(loop)
+    if bucket is None:
+        bucket = TokenBucket(DELIVERY_GLOBAL_RATE)
+        _global_buckets[loop] = bucket
+    return bucket
+
+
+def _retry_seconds(exc):
+    retry_after = exc.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+async def deliver(bot, messages, name="delivery", concurrency=DELIVERY_CONCURRENCY):
+    """
+    Send an iterable of OutgoingMessage through the rate-limited worker pool.
+    Returns DeliveryStats for the run; failures are logged, never raised.
+    """
+    stats = DeliveryStats(name=name)
+    global_bucket = get_global_bucket()
+    chat_buckets = {}
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    started = time.monotonic()
+
+    async def send(msg):
+        chat_bucket = chat_buckets.get(msg.chat_id)
+        if chat_bucket is None:
+            chat_bucket = chat_buckets[msg.chat_id] = TokenBucket(DELIVERY_PER_CHAT_RATE, capacity=1)
+
+        for attempt in range(DELIVERY_MAX_RETRIES + 1):
+            await chat_bucket.acquire()
+            await global_bucket.acquire()
+            try:
+                await bot.send_message(chat_id=msg.chat_id, text=msg.text, parse_mode=msg.parse_mode)
+                stats.sent += 1
+                return
+            except RetryAfter as e:
+                wait = _retry_seconds(e)
+                logger.warning(f"{name}: flood limit hit, pausing {wait:.0f}s")
+                global_bucket.pause(wait)
+            except BadRequest as e:
+                # A NetworkError subclass, but chat not found / bad markup won't fix itself
+                logger.info(f"{name}: failed to send to {msg.chat_id}: {e}")
+                stats.failed += 1
+                return
+            except TimedOut as e:
+                # The message may well have arrived; a retry could send it twice
+                logger.warning(f"{name}: timed out sending to {msg.chat_id}, not retrying: {e}")
+                stats.failed += 1
+                return
+            except NetworkError as e:
+                logger.warning(f"{name}: network error for {msg.chat_id}: {e}")
+                await asyncio.sleep(2 ** attempt)
+            except TelegramError as e:
+                # Blocked bot, chat not found, bad markup... retrying won't help
+                logger.info(f"{name}: failed to send to {msg.chat_id}: {e}")
+                stats.failed += 1
+                return
+            except Exception as e:
+                logger.error(f"{name}: unexpected error sending to {msg.chat_id}: {e}")
+                stats.failed += 1
+                return
+            if attempt < DELIVERY_MAX_RETRIES:
+                stats.retried += 1
+
+        logger.info(f"{name}: giving up on {msg.chat_id} after {DELIVERY_MAX_RETRIES} retries")
+        stats.failed += 1
+
+    async def worker():
+        while True:
+            msg = await queue.get()
+            try:
+                if msg is None:
+                    return
+                await send(msg)
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        for msg in messages:
+            await queue.put(msg)
+    finally:
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    stats.elapsed = time.monotonic() - started
+    logger.info(str(stats))
+    return stats
@@ -1,5 +1,9 @@
-from database import User, UserBadge, Badge, DailyLog, UserBook
-from sqlalchemy import func
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Callable
+from database import User, UserBadge, Badge, DailyLog, UserBook, Book
+from reading_stats import get_user_stats
+from sqlalchemy import func, select, insert
 from config import (
     XP_PER_PAGE, XP_STREAK_BONUS, XP_BOOK_FINISHED,
     STREAK_THRESHOLDS, PAGE_THRESHOLDS, LEVEL_THRESHOLDS,
@@ -32,130 +36,141 @@ def award_xp(user, amount, session):
         
     return leveled_up
 
-def check_badges(user, session):
-    """Check and award badges based on user stats"""
-    new_badges = []
-    
-    # Helper to check and award
-    def award(name):
-        badge = session.query(Badge).filter_by(name=name).first()
-        if badge:
-            has_badge = session.query(UserBadge).filter_by(user_id=user.id, badge_id=badge.id).first()
-            if not has_badge:
-                ub = UserBadge(user_id=user.id, badge_id=badge.id)
-                session.add(ub)
-                new_badges.append(badge)
-    
-    # 1. Streak Badges
-    if user.streak >= 3: award("3 Day Streak")
-    if user.streak >= 7: award("7 Day Streak")
-    if user.streak >= 30: award("30 Day Streak")
-    
-    # 2. Page Badges (Total pages read)
-    total_pages = session.query(
-        func.sum(DailyLog.pages_read_prl + DailyLog.pages_read_rnk)
-    ).filter_by(user_id=user.id).scalar() or 0
-    
-    if total_pages >= 100: award("100 Pages")
-    if total_pages >= 500: award("500 Pages")
-    if total_pages >= 1000: award("1000 Pages")
-    
-    # 3. Level Badges
-    if user.level >= 5: award("Level 5")
-    if user.level >= 10: award("Level 10")
-    
-    # 4. First Finish - Complete first book
-    finished_books = session.query(UserBook).filter_by(
-        user_id=user.id, finished=True
-    ).count()
-    if finished_books >= 1: award("First Finish")
-    
-    # 5. Speed Reader - Finish a book in 7 days or less
-    speed_reader_books = session.query(UserBook).filter(
-        UserBook.user_id == user.id,
-        UserBook.finished == True,
-        UserBook.finished_date != None
-    ).all()
-    
-    for ub in speed_reader_books:
-        if ub.finished_date:
-            # Check if book was added and finished within 7 days
-            # We'll use finished_date - assume they started when added
-            # For more accuracy, we'd need a started_date field
-            days_to_finish = 7  # Default assumption
-            if hasattr(ub, 'started_date') and ub.started_date:
-                days_to_finish = (ub.finished_date - ub.started_date).days
-            if days_to_finish <= SPEED_READER_DAYS:
-                award("Speed Reader")
-                break
-    
-    # 6. Diverse Reader - Read from both PRL and RNK categories
-    categories_read = set()
-    finished_user_books = session.query(UserBook).filter_by(
-        user_id=user.id, finished=True
-    ).all()
-    for ub in finished_user_books:
-        if ub.book:
-            categories_read.add(ub.book.category)
-    
-    if len(categories_read) >= 2:  # Both PRL and RNK
-        award("Diverse Reader")
-    
-    # 7. Comeback King - Had a streak, lost it, rebuilt it to 3+
-    # Check if best_streak > 0 and current streak >= 3 (meaning they recovered)
-    if user.best_streak > 0 and user.streak >= 3 and user.streak < user.best_streak:
-        award("Comeback King")
-    
+# ==================== BADGES ====================
+# Events a badge rule can react to; check_badges only evaluates the rules
+# triggered by the events that actually happened.
+PAGES_ADDED = 'pages_added'
+STREAK_CHANGED = 'streak_changed'
+BOOK_FINISHED = 'book_finished'
+LEVEL_UP = 'level_up'
+ALL_EVENTS = frozenset({PAGES_ADDED, STREAK_CHANGED, BOOK_FINISHED, LEVEL_UP})
+
+
+@dataclass(frozen=True)
+class BadgeRule:
+    name: str
+    description: str
+    icon: str
+    events: frozenset
+    check: Callable  # BadgeContext -> bool
+
+
+class BadgeContext:
+    """What the rules look at, loaded lazily so a rule only pays for the data it needs."""
+
+    def __init__(self, user, session):
+        self.user = user
+        self.session = session
+
+    @cached_property
+    def reading_stats(self):
+        return get_user_stats(self.session, self.user.id)
+
+    @cached_property
+    def finished_books(self):
+        """(finished_date, category) for every finished book, in one query"""
+        return self.session.execute(
+            select(UserBook.finished_date, Book.category)
+            .outerjoin(Book, UserBook.book_id == Book.id)
+            .where(UserBook.user_id == self.user.id, UserBook.finished == True)
+        ).all()
+
+    @cached_property
+    def finished_categories(self):
+        return {category for _, category in self.finished_books if category}
+
+
+def _has_speed_read(ctx):
+    # There's no started_date on UserBook yet, so every finished book is assumed
+    # to have taken 7 days - any dated finish counts (same as before)
+    days_to_finish = 7
+    return any(finished_date for finished_date, _ in ctx.finished_books) and days_to_finish <= SPEED_READER_DAYS
+
+
+def _came_back(ctx):
+    # Had a streak, lost it, rebuilt it to 3+
+    user = ctx.user
+    return user.best_streak > 0 and user.streak >= 3 and user.streak < user.best_streak
+
+
+def _events(*names):
+    return frozenset(names)
+
+
+BADGE_RULES = [
+    # Streak Badges
+    BadgeRule("3 Day Streak", "Maintained a 3-day reading streak", "🔥", _events(STREAK_CHANGED), lambda ctx: ctx.user.streak >= 3),
+    BadgeRule("7 Day Streak", "Maintained a 7-day reading streak", "🔥🔥", _events(STREAK_CHANGED), lambda ctx: ctx.user.streak >= 7),
+    BadgeRule("30 Day Streak", "Maintained a 30-day reading streak", "🔥🔥🔥", _events(STREAK_CHANGED), lambda ctx: ctx.user.streak >= 30),
+    # Page Badges
+    BadgeRule("100 Pages", "Read 100 pages total", "📖", _events(PAGES_ADDED), lambda ctx: ctx.reading_stats.total_pages >= 100),
+    BadgeRule("500 Pages", "Read 500 pages total", "📚", _events(PAGES_ADDED), lambda ctx: ctx.reading_stats.total_pages >= 500),
+    BadgeRule("1000 Pages", "Read 1000 pages total", "🧙‍♂️", _events(PAGES_ADDED), lambda ctx: ctx.reading_stats.total_pages >= 1000),
+    # Level Badges
+    BadgeRule("Level 5", "Reached Level 5", "⭐", _events(LEVEL_UP), lambda ctx: ctx.user.level >= 5),
+    BadgeRule("Level 10", "Reached Level 10", "🌟", _events(LEVEL_UP), lambda ctx: ctx.user.level >= 10),
+    # Achievement Badges
+    BadgeRule("First Finish", "Completed your first book", "📗", _events(BOOK_FINISHED), lambda ctx: ctx.reading_stats.books_finished >= 1),
+    BadgeRule("Speed Reader", "Finished a book in 7 days or less", "⚡", _events(BOOK_FINISHED), _has_speed_read),
+    BadgeRule("Diverse Reader", "Read books from both PRL and RNK categories", "🎨", _events(BOOK_FINISHED), lambda ctx: len(ctx.finished_categories) >= 2),
+    BadgeRule("Comeback King", "Recovered your reading streak after losing it", "💪", _events(STREAK_CHANGED), _came_back),
+]
+
+# Badge name -> id, filled by init_badges at startup (or on first use)
+_badge_ids = {}
+
+
+def get_badge_ids(session):
+    if not _badge_ids:
+        _badge_ids.update(session.execute(select(Badge.name, Badge.id)).all())
+    return _badge_ids
+
+
+def check_badges(user, session, events=ALL_EVENTS):
+    """
+    Award the badges whose rules are triggered by `events` and now pass.
+    Returns the newly earned BadgeRules (they carry name and icon).
+    """
+    badge_ids = get_badge_ids(session)
+    candidates = [rule for rule in BADGE_RULES if rule.events & set(events) and rule.name in badge_ids]
+    if not candidates:
+        return []
+
+    earned = set(session.scalars(select(UserBadge.badge_id).where(UserBadge.user_id == user.id)))
+    ctx = BadgeContext(user, session)
+    new_badges = [rule for rule in candidates if badge_ids[rule.name] not in earned and rule.check(ctx)]
+
+    if new_badges:
+        session.execute(insert(UserBadge), [
+            {'user_id': user.id, 'badge_id': badge_ids[rule.name]} for rule in new_badges
+        ])
+        session.expire(user, ['badges'])
     return new_badges
 
 def init_badges(session):
-    """Initialize all badge definitions in the database"""
-    badges = [
-        # Streak Badges
-        ("3 Day Streak", "Maintained a 3-day reading streak", "🔥"),
-        ("7 Day Streak", "Maintained a 7-day reading streak", "🔥🔥"),
-        ("30 Day Streak", "Maintained a 30-day reading streak", "🔥🔥🔥"),
-        # Page Badges
-        ("100 Pages", "Read 100 pages total", "📖"),
-        ("500 Pages", "Read 500 pages total", "📚"),
-        ("1000 Pages", "Read 1000 pages total", "🧙‍♂️"),
-        # Level Badges
-        ("Level 5", "Reached Level 5", "⭐"),
-        ("Level 10", "Reached Level 10", "🌟"),
-        # NEW: Achievement Badges
-        ("First Finish", "Completed your first book", "📗"),
-        ("Speed Reader", "Finished a book in 7 days or less", "⚡"),
-        ("Diverse Reader", "Read books from both PRL and RNK categories", "🎨"),
-        ("Comeback King", "Recovered your reading streak after losing it", "💪"),
-    ]
-    
-    for name, desc, icon in badges:
-        if not session.query(Badge).filter_by(name=name).first():
-            session.add(Badge(name=name, description=desc, icon=icon))
+    """Initialize all badge definitions in the database and cache their ids"""
+    existing = set(session.scalars(select(Badge.name)))
+    session.add_all([
+        Badge(name=rule.name, description=rule.description, icon=rule.icon)
+        for rule in BADGE_RULES if rule.name not in existing
+    ])
     session.commit()
 
+    _badge_ids.clear()
+    get_badge_ids(session)
+
 def get_all_badges_with_progress(user, session):
     """Get all badges with user's progress toward unlocking them"""
     all_badges = session.query(Badge).all()
     user_badge_ids = [ub.badge_id for ub in user.badges]
     
     # Calculate current stats
-    total_pages = session.query(
-        func.sum(DailyLog.pages_read_prl + DailyLog.pages_read_rnk)
-    ).filter_by(user_id=user.id).scalar() or 0
-    
-    finished_books_count = session.query(UserBook).filter_by(
-        user_id=user.id, finished=True
-    ).count()
+    reading_stats = get_user_stats(session, user.id)
+    total_pages = reading_stats.total_pages
+    finished_books_count = reading_stats.books_finished
     
     # Categories read
-    categories_read = set()
-    finished_user_books = session.query(UserBook).filter_by(
-        user_id=user.id, finished=True
-    ).all()
-    for ub in finished_user_books:
-        if ub.book:
-            categories_read.add(ub.book.category)
+    categories_read = BadgeContext(user, session).finished_categories
     
     badge_info = []
     
@@ -0,0 +1,199 @@
+"""
+Render cache for the monthly contribution graph.
+
+A calendar image only depends on the renderer, the month, today's date and
+the status of each day, so it is cached under that fingerprint. Lots of users
+share the same calendar (e.g. all green), so most /profile views become a
+dict lookup.
+
+Three levels:
+  * in-memory LRU of PNG bytes (GRAPH_CACHE_SIZE entries)
+  * PNG files on disk (GRAPH_CACHE_DIR), so restarts don't re-render everything
+  * Telegram file_ids of images we already uploaded, so they are re-sent
+    without uploading the bytes again
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from telegram.error import BadRequest
+
+from config import GRAPH_CACHE_SIZE, GRAPH_CACHE_DIR, GRAPH_RENDERER
+
+logger = logging.getLogger(__name__)
+
+
+def graph_key(year, month, today_day, statuses, backend=GRAPH_RENDERER):
+    """
+    Cache key for one calendar: 'YYYY-MM-DD:<one status char per day>:<backend>'.
+    The backend is part of it so switching GRAPH_RENDERER doesn't serve the old look.
+    """
+    return f"{year:04d}-{month:02d}-{today_day:02d}:{''.join(statuses)}:{backend}"
+
+
+class GraphCache:
+    def __init__(self, max_size=GRAPH_CACHE_SIZE, directory=GRAPH_CACHE_DIR):
+        self.max_size = max_size
+        self.directory = directory
+        self._png = OrderedDict()
+        self._file_ids = OrderedDict()
+        self._lock = threading.Lock()
+        self._pruned_month = None
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- PNG bytes ----------
+
+    def get_png(self, key):
+        with self._lock:
+            png = self._png.get(key)
+            if png is not None:
+                self._png.move_to_end(key)
+                self.hits += 1
+                return png
+
+        png = self._read_disk(key)
+        with self._lock:
+            if png is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(self._png, key, png)
+        return png
+
+    def put_png(self, key, png):
+        with self._lock:
+            self._remember(self._png, key, png)
+        self._write_disk(key, png)
+
+    def get_or_render(self, key, render):
+        """Return cached PNG bytes for `key`, calling `render()` on a miss."""
+        png = self.get_png(key)
+        if png is None:
+            png = render()
+            self.put_png(key, png)
+        return png
+
+    # ---------- Telegram file_ids ----------
+
+    def get_file_id(self, key):
+        with self._lock:
+            file_id = self._file_ids.get(key)
+            if file_id is not None:
+                self._file_ids.move_to_end(key)
+            return file_id
+
+    def put_file_id(self, key, file_id):
+        with self._lock:
+            self._remember(self._file_ids, key, file_id)
+
+    def forget_file_id(self, key):
+        with self._lock:
+            self._file_ids.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._png.clear()
+            self._file_ids.clear()
+            self.hits = self.misses = 0
+
+    # ---------- internals ----------
+
+    def _remember(self, store, key, value):
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > self.max_size:
+            store.popitem(last=False)
+
+    def _path(self, key):
+        # Month prefix keeps old files easy to prune, the digest keeps names short
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.directory, f"{key[:7]}-{digest}.png")
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, png):
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+            self._prune_old_months(key[:7])
+        except OSError as e:
+            logger.warning(f"Could not write graph cache file: {e}")
+
+    def _prune_old_months(self, month_prefix):
+        # Calendars of past months are never shown again once the month is over
+        if self._pruned_month == month_prefix:
+            return
+        self._pruned_month = month_prefix
+        for name in os.listdir(self.directory):
+            if name.endswith('.png') and not name.startswith(month_prefix):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+graph_cache = GraphCache()
+
+
+async def send_graph(send, calendar, fallback=None, **kwargs):
+    """
+    Send the calendar graph with `send` (reply_photo / send_photo).
+    `calendar` is the (year, month, today_day, statuses) tuple from
+    utils.month_day_statuses. Re-uses the Telegram file_id if this image was
+    uploaded before, otherwise uploads the cached PNG or renders it in the
+    worker pool. If the render queue is saturated, `fallback()` is awaited
+    instead (e.g. to send a text calendar).
+    """
+    from graph_renderer import renderer, RenderQueueFull
+
+    key = graph_key(*calendar)
+    file_id = graph_cache.get_file_id(key)
+    if file_id is not None:
+        try:
+            return await send(photo=file_id, **kwargs)
+        except BadRequest as e:
+            # file_ids are per bot; a stale one (e.g. new token) just means re-upload
+            logger.info(f"Cached graph file_id rejected, uploading again: {e}")
+            graph_cache.forget_file_id(key)
+
+    png = graph_cache.get_png(key)
+    if png is None:
+        try:
+            png = await renderer.render(*calendar)
+        except RenderQueueFull as e:
+            if fallback is None:
+                raise
+            logger.warning(f"Graph render queue saturated, sending text calendar: {e}")
+            return await fallback()
+        graph_cache.put_png(key, png)
+
+    message = await send(photo=io.BytesIO(png), **kwargs)
+    remember_upload(key, message)
+    return message
+
+
+def remember_upload(key, message):
+    """Record the file_id Telegram assigned to a graph we just sent."""
+    try:
+        file_id = message.photo[-1].file_id
+    except (AttributeError, IndexError, TypeError):
+        return
+    if isinstance(file_id, str):
+        graph_cache.put_file_id(key, file_id)
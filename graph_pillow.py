@@ -0,0 +1,132 @@
+"""
+Pillow backend for the contribution graph.
+
+Draws the same layout as the matplotlib renderer in utils, without pyplot:
+  * a background template per month (colour and header), cached
+  * one pre-blended tile per (status, day number, cell size), cached
+so a render is ~30 pastes plus the PNG encode.
+
+Geometry mirrors what matplotlib produces for figsize=(6, 5), dpi=150,
+bbox_inches='tight': an 885x735 image whose axes span 7 x (rows + 1) units.
+"""
+import calendar
+import importlib.util
+import io
+import os
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+WIDTH, HEIGHT = 885, 735
+# Axes box inside the image, in pixels
+AX_LEFT, AX_TOP, AX_WIDTH, AX_HEIGHT = 14.9, 15.0, 854.2, 705.0
+
+BACKGROUND = (44, 62, 80)  # #2c3e50
+HEADER_COLOR = (255, 255, 255)
+WEEKDAY_COLOR = (189, 195, 199)  # #bdc3c7
+CELL_ALPHA = 0.8
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+TEXT_OFFSET = -2
+
+# Point sizes of the matplotlib version, converted at 150 dpi
+PT = 150 / 72
+HEADER_SIZE, WEEKDAY_SIZE, DAY_SIZE, ICON_SIZE = round(16 * PT), round(10 * PT), round(12 * PT), round(10 * PT)
+
+
+def _hex(color):
+    return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+
+
+def _blend(color):
+    # Cells are drawn with alpha=0.8 over the background
+    return tuple(round(c * CELL_ALPHA + b * (1 - CELL_ALPHA)) for c, b in zip(_hex(color), BACKGROUND))
+
+
+@lru_cache(maxsize=None)
+def _font_path():
+    # Same face as matplotlib's default; use its bundled copy if the system has none
+    try:
+        return ImageFont.truetype('DejaVuSans-Bold.ttf', 10).path
+    except OSError:
+        pass
+    spec = importlib.util.find_spec('matplotlib')
+    if spec and spec.origin:
+        path = os.path.join(os.path.dirname(spec.origin), 'mpl-data', 'fonts', 'ttf', 'DejaVuSans-Bold.ttf')
+        if os.path.exists(path):
+            return path
+    return None
+
+
+@lru_cache(maxsize=None)
+def _font(size, bold=True):
+    path = _font_path()
+    if path is None:
+        return ImageFont.load_default(size=size)
+    if not bold:
+        path = path.replace('DejaVuSans-Bold.ttf', 'DejaVuSans.ttf')
+    return ImageFont.truetype(path, size)
+
+
+def _units(rows):
+    """Pixel size of one data unit along x and y for a month with `rows` weeks."""
+    return AX_WIDTH / 7, AX_HEIGHT / (rows + 1)
+
+
+def _to_px(x, y, rows):
+    """Data coordinates (y grows upwards, as in matplotlib) to image pixels."""
+    ux, uy = _units(rows)
+    return AX_LEFT + x * ux, AX_TOP + (rows + 1 - y) * uy
+
+
+def _text(draw, xy, text, fill, font):
+    # matplotlib centres on the ink box, Pillow's 'mm' on the font metrics; nudge up to match
+    draw.text((xy[0], xy[1] + TEXT_OFFSET), text, fill=fill, font=font, anchor='mm')
+
+
+@lru_cache(maxsize=32)
+def _template(year, month):
+    """Background and header for one month."""
+    rows = len(calendar.monthcalendar(year, month))
+    image = Image.new('RGB', (WIDTH, HEIGHT), BACKGROUND)
+    _text(ImageDraw.Draw(image), _to_px(3.5, rows + 0.5, rows), f"{calendar.month_name[month]} {year}",
+          HEADER_COLOR, _font(HEADER_SIZE))
+    return image, rows
+
+
+@lru_cache(maxsize=1024)
+def _tile(status, day, rows):
+    """One 0.9 x 0.9 unit cell with its day number and status glyph."""
+    from utils import DAY_STYLES
+
+    color, glyph = DAY_STYLES[status]
+    ux, uy = _units(rows)
+    width, height = round(0.9 * ux), round(0.9 * uy)
+    tile = Image.new('RGB', (width, height), _blend(color))
+    draw = ImageDraw.Draw(tile)
+    # Tile origin is the cell corner at (+0.05, +0.05) units
+    _text(draw, (0.45 * ux, 0.45 * uy), str(day), (255, 255, 255), _font(DAY_SIZE))
+    if glyph:
+        _text(draw, (0.75 * ux, 0.75 * uy), glyph, (255, 255, 255), _font(ICON_SIZE))
+    return tile
+
+
+def render(year, month, today_day, statuses, compress_level=3):
+    """Draw the calendar for a status vector and return the PNG bytes."""
+    image, rows = _template(year, month)
+    image = image.copy()
+
+    for r, week in enumerate(calendar.monthcalendar(year, month)):
+        for c, day in enumerate(week):
+            if day == 0:
+                continue
+            left, top = _to_px(c + 0.05, rows - r - 0.05, rows)
+            image.paste(_tile(statuses[day - 1], day, rows), (round(left), round(top)))
+
+    # Weekday names overlap the first row of cells, so they go on top like in matplotlib
+    draw = ImageDraw.Draw(image)
+    for i, name in enumerate(WEEKDAYS):
+        _text(draw, _to_px(i + 0.5, rows - 0.2, rows), name, WEEKDAY_COLOR, _font(WEEKDAY_SIZE, bold=False))
+
+    buf = io.BytesIO()
+    image.save(buf, format='PNG', compress_level=compress_level)
+    return buf.getvalue()
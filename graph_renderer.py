@@ -0,0 +1,112 @@
+"""
+Contribution-graph rendering off the event loop.
+
+A matplotlib render takes a few hundred ms of pure CPU, which used to stall
+every other update while /profile was drawing. Renders now run in a small
+process pool whose workers import the renderer (matplotlib/Agg or Pillow, see
+GRAPH_RENDERER) once at startup. Only plain data crosses the process
+boundary: (year, month, today_day, statuses) in, PNG bytes out.
+
+When more than GRAPH_RENDER_MAX_QUEUE renders are already waiting, `render`
+raises RenderQueueFull and callers fall back to utils.text_calendar.
+"""
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from config import GRAPH_RENDERER, GRAPH_RENDER_WORKERS, GRAPH_RENDER_MAX_QUEUE
+
+logger = logging.getLogger(__name__)
+
+
+class RenderQueueFull(Exception):
+    """Too many renders in flight; show the text calendar instead."""
+
+
+def _init_worker():
+    # Pay the renderer imports once per worker, not once per render
+    if GRAPH_RENDERER == 'pillow':
+        import graph_pillow  # noqa: F401
+        return
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot  # noqa: F401
+
+
+def _render(year, month, today_day, statuses):
+    from utils import render_contribution_graph
+    return render_contribution_graph(year, month, today_day, statuses)
+
+
+def _ping():
+    return True
+
+
+class GraphRenderer:
+    def __init__(self, workers=GRAPH_RENDER_WORKERS, max_queue=GRAPH_RENDER_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = None
+        # Metrics
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.rendered = 0
+        self.rejected = 0
+        self.render_time = 0.0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            # spawn, not fork: the bot process has threads (job queue, sqlite)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+        return self._executor
+
+    async def warm_up(self):
+        """Start every worker now so the first /profile doesn't pay for it."""
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        await asyncio.gather(*[loop.run_in_executor(self.executor, _ping) for _ in range(self.workers)])
+        logger.info(f"Graph renderer: {self.workers} workers ready in {time.monotonic() - started:.2f}s")
+
+    async def render(self, year, month, today_day, statuses):
+        """Render the calendar in a worker process and return the PNG bytes."""
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise RenderQueueFull(f"{self.queue_depth} renders already queued")
+
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        started = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            png = await loop.run_in_executor(self.executor, _render, year, month, today_day, tuple(statuses))
+        finally:
+            self.queue_depth -= 1
+        self.rendered += 1
+        self.render_time += time.monotonic() - started
+        return png
+
+    def stats(self):
+        avg = self.render_time / self.rendered if self.rendered else 0.0
+        return {
+            'workers': self.workers,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'rendered': self.rendered,
+            'rejected': self.rejected,
+            'avg_render_time': round(avg, 3),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+renderer = GraphRenderer()
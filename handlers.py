@@ -1,14 +1,19 @@
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, MessageHandler, CallbackQueryHandler, filters
-from database import init_db, User, Club, Book, UserBook, DailyLog, ActionLog, get_session_scope
-from utils import get_today_date, generate_contribution_graph
-from gamification import award_xp, check_badges, XP_PER_PAGE, XP_STREAK_BONUS, XP_BOOK_FINISHED, get_xp_for_next_level
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from database import Session, AsyncSession, User, Club, Book, UserBook, DailyLog, ActionLog, get_session_scope, get_async_session_scope, upsert_daily_log
+from utils import get_today_date, month_day_statuses, current_month_logs, text_calendar
+from graph_cache import send_graph
+from gamification import award_xp, check_badges, PAGES_ADDED, STREAK_CHANGED, BOOK_FINISHED, LEVEL_UP, XP_PER_PAGE, XP_STREAK_BONUS, XP_BOOK_FINISHED, get_xp_for_next_level
+from reading_stats import apply_report, record_book_finished
+from club_snapshots import get_snapshot, record_report, invalidate_club, SKIPPED
+from identity_cache import identity_cache, get_user, get_identity, get_user_async, get_identity_async
+from loaders import loader_options
 
 import logging
 logger = logging.getLogger(__name__)
 
-Session = init_db()
-
 # States
 ENTER_KEY = 0
 SELECT_BOOKS_PRL = 1
@@ -28,7 +33,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     full_name = update.effective_user.full_name
     
     with get_session_scope(Session) as session:
-        user = session.query(User).filter_by(telegram_id=user_id).first()
+        user = get_user(session, user_id)
         
         if not user:
             user = User(telegram_id=user_id, username=username, full_name=full_name)
@@ -60,13 +65,17 @@ async def enter_key(update: Update, context: ContextTypes.DEFAULT_TYPE):
         club = session.query(Club).filter_by(key=key).first()
         
         if club:
-            user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
+            user = get_user(session, update.effective_user.id)
             old_club_id = user.club_id
             
             # Check if this is a club change
             is_club_change = old_club_id is not None
             
             user.club_id = club.id
+            invalidate_club(old_club_id, club.id)
+            identity_cache.invalidate(user.telegram_id)
+            from recommendations import invalidate_user_recommendation
+            invalidate_user_recommendation(session, user.id)
             
             context.user_data['club_id'] = club.id
             
@@ -267,7 +276,7 @@ async def select_books_rnk(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         # Save all books
         with get_session_scope(Session) as session:
-            user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
+            user = get_user(session, update.effective_user.id)
             
             for b in context.user_data['selected_prl']:
                 ub = UserBook(
@@ -400,7 +409,7 @@ async def enter_current_page_rnk(update: Update, context: ContextTypes.DEFAULT_T
 # Reporting Flow
 async def report_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     with get_session_scope(Session) as session:
-        user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
+        user = get_user(session, update.effective_user.id, profile="report")
         
         # Only include books that are NOT finished
         active_books = [ub for ub in user.readings if not ub.finished]
@@ -424,7 +433,7 @@ async def ask_next_book_report(update: Update, context: ContextTypes.DEFAULT_TYP
         
     ub_id = context.user_data['report_queue'][0]
     with get_session_scope(Session) as session:
-        ub = session.query(UserBook).get(ub_id)
+        ub = session.get(UserBook, ub_id, options=[joinedload(UserBook.book)])
         book_title = ub.book.title
     
     await update.message.reply_text(
@@ -444,7 +453,7 @@ async def report_book_progress(update: Update, context: ContextTypes.DEFAULT_TYP
         ub_id = context.user_data['report_queue'].pop(0)
         
         with get_session_scope(Session) as session:
-            ub = session.query(UserBook).get(ub_id)
+            ub = session.get(UserBook, ub_id, options=[joinedload(UserBook.book)])
             
             # Calculate how many pages we can actually add (cap at total)
             pages_remaining = max(0, ub.total_pages - ub.current_page)
@@ -467,15 +476,15 @@ async def report_book_progress(update: Update, context: ContextTypes.DEFAULT_TYP
             context.user_data['report_results'][cat] += actual_pages
             
             # Log Action
-            user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
-            if user:
+            identity = get_identity(session, update.effective_user.id)
+            if identity:
                 action_log = ActionLog(
-                    user_id=user.id,
-                    telegram_id=user.telegram_id,
-                    user_name=user.full_name,
+                    user_id=identity.user_id,
+                    telegram_id=identity.telegram_id,
+                    user_name=identity.full_name,
                     action_type='REPORT',
                     details=f"Read {actual_pages} pages in '{ub.book.title}' ({ub.book.category})",
-                    club_id=user.club_id
+                    club_id=identity.club_id
                 )
                 session.add(action_log)
             
@@ -484,6 +493,7 @@ async def report_book_progress(update: Update, context: ContextTypes.DEFAULT_TYP
                 ub.finished = True
                 ub.finished_date = get_today_date()
                 ub.current_page = ub.total_pages # Cap at total
+                record_book_finished(session, ub.user_id)
                 
                 # Check if this was a recommended book for extra bonus
                 completion_bonus_msg = ""
@@ -511,24 +521,17 @@ async def report_book_progress(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def finish_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
     with get_session_scope(Session) as session:
-        user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
-        club = user.club
+        identity = get_identity(session, update.effective_user.id)
+        user = session.get(User, identity.user_id)
+        club = identity.club  # cached goal settings, no club query
         
         # Get current session report
         prl_read_now = context.user_data['report_results']['PRL']
         rnk_read_now = context.user_data['report_results']['RNK']
         
-        # Get existing log to accumulate
+        # Create today's log or accumulate into it (single upsert)
         today = get_today_date()
-        log = session.query(DailyLog).filter_by(user_id=user.id, date=today).first()
-        
-        if not log:
-            log = DailyLog(user_id=user.id, date=today, status='pending')
-            session.add(log)
-            
-        # Accumulate
-        log.pages_read_prl = (log.pages_read_prl or 0) + prl_read_now
-        log.pages_read_rnk = (log.pages_read_rnk or 0) + rnk_read_now
+        log = upsert_daily_log(session, user.id, today, prl_read_now, rnk_read_now)
         
         # Check status based on TOTAL
         total_prl = log.pages_read_prl
@@ -568,6 +571,8 @@ async def finish_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 user.grace_period_active = False
         
         log.status = new_status
+        apply_report(session, user.id, today, prl_read_now, rnk_read_now, old_status, new_status,
+                     previous_pages=total_all - prl_read_now - rnk_read_now)
         
         # XP calculation
         xp_gained = prl_read_now * XP_PER_PAGE + rnk_read_now * XP_PER_PAGE
@@ -577,7 +582,17 @@ async def finish_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
         xp_gained += finished_books_count * XP_BOOK_FINISHED
         
         leveled_up = award_xp(user, xp_gained, session)
-        new_badges = check_badges(user, session)
+        
+        # Only the badge rules touched by what just happened are evaluated.
+        # Finished books and levels also change outside reports (My Books adds
+        # already-read books and selection XP), so those rules are always
+        # re-checked here - they're skipped once earned.
+        badge_events = {BOOK_FINISHED, LEVEL_UP}
+        if prl_read_now + rnk_read_now > 0:
+            badge_events.add(PAGES_ADDED)
+        if new_status == 'achieved' and old_status != 'achieved':
+            badge_events.add(STREAK_CHANGED)
+        new_badges = check_badges(user, session, badge_events)
         
         # Store values before closing session
         user_level = user.level
@@ -600,52 +615,10 @@ async def finish_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             remaining_msg = "\n🎉 <b>Daily Goal Achieved!</b> Great work!"
 
-        # Calculate club statistics for today
-        from datetime import timedelta
-        today = get_today_date()
-        
-        # Get all club members
-        club_members = session.query(User).filter(User.club_id == club.id).all()
-        total_members = len(club_members)
-        
-        # Get today's stats for all members
-        achieved_count = 0
-        read_not_enough_count = 0
-        not_read_count = 0
-        skipped_count = 0
-        
-        today_pages = {}  # user_id -> total_pages_today
-        
-        for member in club_members:
-            today_log = session.query(DailyLog).filter(
-                DailyLog.user_id == member.id,
-                DailyLog.date == today
-            ).first()
-            
-            if today_log:
-                total_pages_member = (today_log.pages_read_prl or 0) + (today_log.pages_read_rnk or 0)
-                today_pages[member.id] = total_pages_member
-                
-                if today_log.status == 'achieved':
-                    achieved_count += 1
-                elif today_log.status == 'read_not_enough':
-                    read_not_enough_count += 1
-                elif today_log.status == 'not_read':
-                    not_read_count += 1
-            else:
-                # No log = skipped
-                skipped_count += 1
-                today_pages[member.id] = 0
-        
-        # Calculate percentages
-        achieved_pct = (achieved_count / total_members * 100) if total_members > 0 else 0
-        read_not_enough_pct = (read_not_enough_count / total_members * 100) if total_members > 0 else 0
-        not_read_pct = (not_read_count / total_members * 100) if total_members > 0 else 0
-        skipped_pct = (skipped_count / total_members * 100) if total_members > 0 else 0
-        
-        # Get user's ranking for today (by pages read)
-        sorted_users = sorted(today_pages.items(), key=lambda x: x[1], reverse=True)
-        user_rank = next((i + 1 for i, (uid, _) in enumerate(sorted_users) if uid == user.id), None)
+        # Club statistics for today, from the cached club-day snapshot
+        record_report(session, club.id, today, user.id, total_all, new_status)
+        snapshot = get_snapshot(session, club.id, today)
+        user_rank = snapshot.rank(user.id)
         
         # Calculate days since club creation
         club_age_days = (today - club.created_at.date()).days + 1 if hasattr(club, 'created_at') and club.created_at else 1
@@ -672,11 +645,11 @@ async def finish_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Add club statistics
         msg += f"\n\n📊 <b>Club Stats (Day {club_age_days})</b>\n"
-        msg += f"👥 Members: {total_members}\n"
-        msg += f"✅ Achieved: {achieved_count} ({achieved_pct:.0f}%)\n"
-        msg += f"📖 Read (not enough): {read_not_enough_count} ({read_not_enough_pct:.0f}%)\n"
-        msg += f"❌ Didn't read: {not_read_count} ({not_read_pct:.0f}%)\n"
-        msg += f"⏭ Skipped: {skipped_count} ({skipped_pct:.0f}%)\n"
+        msg += f"👥 Members: {snapshot.total_members}\n"
+        msg += f"✅ Achieved: {snapshot.counts['achieved']} ({snapshot.percent('achieved'):.0f}%)\n"
+        msg += f"📖 Read (not enough): {snapshot.counts['read_not_enough']} ({snapshot.percent('read_not_enough'):.0f}%)\n"
+        msg += f"❌ Didn't read: {snapshot.counts['not_read']} ({snapshot.percent('not_read'):.0f}%)\n"
+        msg += f"⏭ Skipped: {snapshot.counts[SKIPPED]} ({snapshot.percent(SKIPPED):.0f}%)\n"
         
         # Add user's ranking
         if user_rank:
@@ -693,15 +666,15 @@ async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     from utils import calculate_reading_stats, generate_profile_message
     
     with get_session_scope(Session) as session:
-        user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
+        user = get_user(session, update.effective_user.id, profile="profile")
         if not user:
             await update.message.reply_text("You are not registered yet. Use /start to join.")
             return
             
-        logs = user.logs
+        logs = current_month_logs(session, user.id)
         
-        # Generate graph
-        graph_buf = generate_contribution_graph(logs)
+        # Plain calendar data; the image is cached or rendered off the event loop
+        calendar_data = month_day_statuses(logs)
         
         # Calculate stats
         stats = calculate_reading_stats(user)
@@ -717,11 +690,21 @@ async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Add Finished Books Button
         keyboard = [[InlineKeyboardButton("📚 Finished Books", callback_data=f"view_finished_books_{user.telegram_id}")]]
         
-        await update.message.reply_photo(
-            photo=graph_buf,
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        async def send_text_calendar():
+            return await update.message.reply_text(
+                f"{text_calendar(*calendar_data)}\n\n{caption}",
+                parse_mode='HTML',
+                reply_markup=reply_markup
+            )
+        
+        await send_graph(
+            update.message.reply_photo, calendar_data,
+            fallback=send_text_calendar,
             caption=caption,
             parse_mode='HTML',
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=reply_markup
         )
 
 async def view_finished_books(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -732,7 +715,7 @@ async def view_finished_books(update: Update, context: ContextTypes.DEFAULT_TYPE
         user_id = int(query.data.split('_')[3])
         
         with get_session_scope(Session) as session:
-            user = session.query(User).filter_by(telegram_id=user_id).first()
+            user = get_user(session, user_id, profile="finished_books")
             
             if not user:
                 await query.edit_message_caption("User not found.")
@@ -773,34 +756,35 @@ async def view_finished_books(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_photo(photo=graph_buf, caption=caption, parse_mode='HTML')
 
 async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    with get_session_scope(Session) as session:
+    async with get_async_session_scope(AsyncSession) as session:
         # Get current user
-        current_user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
+        current_user = await get_identity_async(session, update.effective_user.id)
         
         # Top 10 by XP
-        users = session.query(User).filter(User.club_id == context.user_data.get('club_id')).order_by(User.xp.desc()).limit(10).all()
+        top_10 = select(User).order_by(User.xp.desc()).limit(10)
+        users = (await session.scalars(top_10.where(User.club_id == context.user_data.get('club_id')))).all()
         
         # If club_id not in context (e.g. restart), try to get from user
         if not users and current_user and current_user.club_id:
-            users = session.query(User).filter(User.club_id == current_user.club_id).order_by(User.xp.desc()).limit(10).all()
-        
-        import html
-        msg = "🏆 <b>Leaderboard</b> 🏆\n\n"
-        for i, u in enumerate(users):
-            # Show real name only for current user, otherwise show XXX
-            if current_user and u.id == current_user.id:
-                safe_name = html.escape(u.full_name)
-            else:
-                safe_name = "XXX"
-            msg += f"{i+1}. {safe_name} - Lvl {u.level} ({u.xp} XP)\n"
-            
-        await update.message.reply_text(msg, parse_mode='HTML')
+            users = (await session.scalars(top_10.where(User.club_id == current_user.club_id))).all()
+    
+    import html
+    msg = "🏆 <b>Leaderboard</b> 🏆\n\n"
+    for i, u in enumerate(users):
+        # Show real name only for current user, otherwise show XXX
+        if current_user and u.id == current_user.user_id:
+            safe_name = html.escape(u.full_name)
+        else:
+            safe_name = "XXX"
+        msg += f"{i+1}. {safe_name} - Lvl {u.level} ({u.xp} XP)\n"
+        
+    await update.message.reply_text(msg, parse_mode='HTML')
 
 async def badges(update: Update, context: ContextTypes.DEFAULT_TYPE):
     from gamification import get_all_badges_with_progress
     
     with get_session_scope(Session) as session:
-        user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
+        user = get_user(session, update.effective_user.id)
         
         if not user:
             await update.message.reply_text("Please join a club first with /start")
@@ -837,16 +821,17 @@ async def badges(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def reading_now(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show what books club members are currently reading"""
-    session = Session()
-    user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
-    
-    if not user or not user.club_id:
-        await update.message.reply_text("Please join a club first with /start")
-        session.close()
-        return
-    
-    # Get all users in the club
-    club_users = session.query(User).filter_by(club_id=user.club_id).all()
+    async with get_async_session_scope(AsyncSession) as session:
+        user = await get_identity_async(session, update.effective_user.id)
+        
+        if not user or not user.club_id:
+            await update.message.reply_text("Please join a club first with /start")
+            return
+        
+        # Get all users in the club
+        club_users = (await session.scalars(
+            select(User).options(*loader_options("club_readings")).where(User.club_id == user.club_id)
+        )).all()
     
     # Collect all in-progress books
     book_reader_counts = {}  # book_title -> count
@@ -864,7 +849,6 @@ async def reading_now(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Be the first to start!",
             parse_mode='HTML'
         )
-        session.close()
         return
     
     # Sort by popularity (most readers first)
@@ -879,12 +863,11 @@ async def reading_now(update: Update, context: ContextTypes.DEFAULT_TYPE):
             msg += f"📕 <b>{book_title}</b> - {reader_count} readers\n\n"
     
     await update.message.reply_text(msg, parse_mode='HTML')
-    session.close()
 
 async def change_club(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Allow users to change clubs while preserving their progress"""
     session = Session()
-    user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
+    user = get_user(session, update.effective_user.id)
     
     if not user or not user.club_id:
         await update.message.reply_text(
@@ -970,38 +953,27 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show detailed reading analytics and statistics"""
     from utils import get_today_date
-    from datetime import timedelta
-    from sqlalchemy import func
+    from reading_stats import stats_summary, most_productive_weekday, WEEKDAY_COLUMNS
+    import calendar
     import html
     
     user_id = update.effective_user.id
     
-    with get_session_scope(Session) as session:
-        user = session.query(User).filter_by(telegram_id=user_id).first()
+    async with get_async_session_scope(AsyncSession) as session:
+        user = await get_user_async(session, user_id)
         
-        if not user or not user.club:
+        if not user or not user.club_id:
             await update.message.reply_text("You need to join a club first! Use /start")
             return
         
-        today = get_today_date()
-        
-        # Get all user logs
-        all_logs = session.query(DailyLog).filter_by(user_id=user.id).all()
+        # Lifetime aggregates from the rollup plus the two-week pace window, one query
+        rollup, this_week_pages, last_week_pages = await session.run_sync(stats_summary, user.id, get_today_date())
         
-        if not all_logs:
+        if rollup.first_log_date is None:
             await update.message.reply_text("📊 No reading data yet! Start reading and use /report to build your stats.")
             return
         
         # === PACE TRENDS ===
-        week_ago = today - timedelta(days=7)
-        two_weeks_ago = today - timedelta(days=14)
-        
-        this_week_logs = [l for l in all_logs if l.date >= week_ago]
-        last_week_logs = [l for l in all_logs if two_weeks_ago <= l.date < week_ago]
-        
-        this_week_pages = sum((l.pages_read_prl or 0) + (l.pages_read_rnk or 0) for l in this_week_logs)
-        last_week_pages = sum((l.pages_read_prl or 0) + (l.pages_read_rnk or 0) for l in last_week_logs)
-        
         if last_week_pages > 0:
             pace_change = ((this_week_pages - last_week_pages) / last_week_pages) * 100
             if pace_change > 0:
@@ -1014,27 +986,22 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
             pace_trend = "🆕 First week tracking!"
         
         # === BEST READING DAY ===
-        day_totals = {}
-        for log in all_logs:
-            day_name = log.date.strftime("%A")
-            pages = (log.pages_read_prl or 0) + (log.pages_read_rnk or 0)
-            day_totals[day_name] = day_totals.get(day_name, 0) + pages
-        
-        if day_totals:
-            best_day = max(day_totals, key=day_totals.get)
-            best_day_pages = day_totals[best_day]
+        best_day_num = most_productive_weekday(rollup)
+        if best_day_num is not None:
+            best_day = calendar.day_name[best_day_num]
+            best_day_pages = getattr(rollup, WEEKDAY_COLUMNS[best_day_num])
         else:
             best_day = "N/A"
             best_day_pages = 0
         
         # === AVERAGE PER SESSION ===
-        active_days = len([l for l in all_logs if (l.pages_read_prl or 0) + (l.pages_read_rnk or 0) > 0])
-        total_pages = sum((l.pages_read_prl or 0) + (l.pages_read_rnk or 0) for l in all_logs)
+        active_days = rollup.active_days
+        total_pages = rollup.total_pages
         avg_per_session = total_pages / active_days if active_days > 0 else 0
         
         # === CATEGORY BREAKDOWN ===
-        total_prl = sum(l.pages_read_prl or 0 for l in all_logs)
-        total_rnk = sum(l.pages_read_rnk or 0 for l in all_logs)
+        total_prl = rollup.total_prl
+        total_rnk = rollup.total_rnk
         
         if total_prl + total_rnk > 0:
             prl_pct = (total_prl / (total_prl + total_rnk)) * 100
@@ -1109,6 +1076,8 @@ setup_conv = ConversationHandler(
         ENTER_CURRENT_PAGE_RNK: [MessageHandler(filters.TEXT & ~filters.COMMAND, enter_current_page_rnk)],
     },
     fallbacks=[CommandHandler('cancel', cancel)],
+    name='setup_conv',
+    persistent=True,
     per_message=False
 )
 
@@ -1118,5 +1087,7 @@ report_conv = ConversationHandler(
         REPORT_PRL: [MessageHandler(filters.TEXT & ~filters.COMMAND, report_book_progress)],
     },
     fallbacks=[CommandHandler('cancel', cancel)],
+    name='report_conv',
+    persistent=True,
     per_message=False
 )
@@ -0,0 +1,165 @@
+"""
+telegram_id -> user identity cache for handler entry points.
+
+Almost every handler starts by resolving the Telegram user to our User row
+and usually its club. The identity (user id, name, club goal settings) barely
+ever changes, so it is kept in a small TTL/LRU cache:
+  * get_identity() answers from the cache - handlers that only need ids
+    (leaderboard, reading_now, action logs) don't touch the users table
+  * get_user() loads the ORM object by primary key on a hit
+
+Join/change club, kick, reset and club delete invalidate the affected entries.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.orm import joinedload
+
+from config import IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL
+from database import User
+from loaders import loader_options
+
+
+@dataclass(frozen=True)
+class ClubGoal:
+    """The club fields handlers need (attribute names match Club)."""
+    id: int
+    name: str
+    goal_type: str
+    daily_min_prl: int
+    daily_min_rnk: int
+    daily_min_total: int
+    created_at: Optional[datetime]
+
+
+@dataclass(frozen=True)
+class UserIdentity:
+    user_id: int
+    telegram_id: int
+    full_name: str
+    club: Optional[ClubGoal]
+
+    @property
+    def club_id(self):
+        return self.club.id if self.club else None
+
+    @classmethod
+    def from_user(cls, user):
+        club = user.club
+        goal = None
+        if club is not None:
+            goal = ClubGoal(club.id, club.name, club.goal_type, club.daily_min_prl, club.daily_min_rnk,
+                            club.daily_min_total, getattr(club, 'created_at', None))
+        return cls(user.id, user.telegram_id, user.full_name, goal)
+
+
+class IdentityCache:
+    def __init__(self, max_size=IDENTITY_CACHE_SIZE, ttl=IDENTITY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # telegram_id -> (expires_at, UserIdentity)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id):
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(telegram_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[telegram_id]
+            self.misses += 1
+            return None
+
+    def put(self, identity):
+        with self._lock:
+            self._entries[identity.telegram_id] = (time.monotonic() + self.ttl, identity)
+            self._entries.move_to_end(identity.telegram_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_id):
+        with self._lock:
+            self._entries.pop(telegram_id, None)
+
+    def invalidate_club(self, club_id):
+        with self._lock:
+            for telegram_id in [t for t, (_, ident) in self._entries.items() if ident.club_id == club_id]:
+                del self._entries[telegram_id]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+identity_cache = IdentityCache()
+
+
+def _load(session, telegram_id, options=()):
+    """Query the user (with their club) and cache the identity. Returns (user, identity)."""
+    user = (
+        session.query(User)
+        .options(joinedload(User.club), *options)
+        .filter_by(telegram_id=telegram_id)
+        .first()
+    )
+    if user is None:
+        # Not cached: they may register any moment
+        return None, None
+    identity = UserIdentity.from_user(user)
+    identity_cache.put(identity)
+    return user, identity
+
+
+def get_identity(session, telegram_id):
+    """UserIdentity for a Telegram user, or None if they aren't registered."""
+    identity = identity_cache.get(telegram_id)
+    if identity is None:
+        _, identity = _load(session, telegram_id)
+    return identity
+
+
+def get_user(session, telegram_id, profile=None):
+    """
+    The User row for a Telegram user (by primary key when the identity is
+    cached), or None. `profile` names an eager-loading profile from loaders.py.
+    """
+    options = loader_options(profile)
+    identity = identity_cache.get(telegram_id)
+    if identity is not None:
+        user = session.get(User, identity.user_id, options=options)
+        if user is not None and user.telegram_id == telegram_id:
+            return user
+        identity_cache.invalidate(telegram_id)
+    user, _ = _load(session, telegram_id, options)
+    return user
+
+
+async def get_identity_async(session, telegram_id):
+    """get_identity for an AsyncSession; cache hits don't touch the database at all."""
+    identity = identity_cache.get(telegram_id)
+    if identity is None:
+        _, identity = await session.run_sync(_load, telegram_id)
+    return identity
+
+
+async def get_user_async(session, telegram_id, profile=None):
+    """get_user for an AsyncSession."""
+    return await session.run_sync(get_user, telegram_id, profile)
@@ -0,0 +1,99 @@
+"""
+Checkpoints for the scheduled jobs, so a restart in the middle of one
+neither repeats nor skips users.
+
+A run is one job (by name) for one logical date - close_questionnaire for the
+day it closes, a reminder for today. start() opens the run, or reopens an
+interrupted one with its checkpoint, and returns None if that run already
+finished. The job walks users in id order after `run.last_id`, calls
+checkpoint() as each chunk is done, then finish().
+
+Jobs that change state (check-in, close_questionnaire) save the checkpoint in
+the same transaction as the chunk's changes, so nothing is applied twice; a
+crash before delivery drops that chunk's messages. Read-only jobs checkpoint
+after delivering a chunk, so a crash re-sends at most one chunk.
+
+On startup main reschedules the recent runs that were left running
+(interrupted()).
+"""
+import datetime
+import logging
+
+from sqlalchemy import select, update
+
+from database import JobRun, Session, get_session_scope
+
+logger = logging.getLogger(__name__)
+
+# Interrupted runs for days older than this aren't worth finishing
+RESUME_WINDOW_DAYS = 1
+
+
+def job_key(context, name, day):
+    """
+    (job name, logical date) of this run. A job scheduled under its own name
+    (the two reminders) or resumed by main for an earlier date (passed as the
+    job data) overrides the defaults.
+    """
+    job = getattr(context, 'job', None)
+    if job is not None:
+        if isinstance(job.name, str):
+            name = job.name
+        if isinstance(job.data, datetime.date):
+            day = job.data
+    return name, day
+
+
+def start(name, day):
+    """Open the run of `name` for `day`; None if it already finished."""
+    with get_session_scope(Session) as session:
+        run = session.scalar(select(JobRun).where(JobRun.job_name == name, JobRun.run_date == day))
+        if run is None:
+            run = JobRun(job_name=name, run_date=day, status='running')
+            session.add(run)
+        elif run.status == 'done':
+            logger.info(f"{name} for {day} already finished, skipping")
+            return None
+        else:
+            logger.info(f"Resuming {name} for {day} after id {run.last_id}")
+            run.status = 'running'
+    return run
+
+
+def checkpoint(run, last_id, session=None):
+    """
+    Record that everything up to `last_id` is done. Pass the chunk's `session`
+    to commit the checkpoint together with the chunk's changes.
+    """
+    if session is None:
+        with get_session_scope(Session) as session:
+            return checkpoint(run, last_id, session)
+    session.execute(
+        update(JobRun).where(JobRun.id == run.id)
+        .values(last_id=last_id, updated_at=datetime.datetime.now())
+        .execution_options(synchronize_session=False)
+    )
+    run.last_id = last_id
+
+
+def finish(run):
+    now = datetime.datetime.now()
+    with get_session_scope(Session) as session:
+        session.execute(
+            update(JobRun).where(JobRun.id == run.id)
+            .values(status='done', finished_at=now, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    run.status = 'done'
+
+
+def interrupted(today):
+    """Runs a restart cut short that are still worth resuming; older ones are marked abandoned."""
+    cutoff = today - datetime.timedelta(days=RESUME_WINDOW_DAYS)
+    with get_session_scope(Session) as session:
+        runs = session.scalars(select(JobRun).where(JobRun.status == 'running').order_by(JobRun.id)).all()
+        for run in runs:
+            if run.run_date < cutoff:
+                logger.warning(f"Abandoning {run.job_name} for {run.run_date}, interrupted after id {run.last_id}")
+                run.status = 'abandoned'
+        return [run for run in runs if run.status == 'running']
@@ -0,0 +1,45 @@
+"""
+Named eager-loading profiles for User.
+
+Relationships on User are lazy by default, so walking user.readings -> ub.book
+or user.badges -> b.badge in a handler costs one SELECT per row. Handlers ask
+for the profile matching what they render instead:
+
+    user = get_user(session, telegram_id, profile="profile")
+
+tests/test_query_counts.py keeps an upper bound on the statements each handler
+issues, so an N+1 sneaking back in fails the suite.
+"""
+from sqlalchemy.orm import joinedload, selectinload
+
+from database import User, UserBook, UserBadge
+
+LOADER_PROFILES = {
+    # /profile and the admin user view: club, books in progress, badge icons, rollup
+    "profile": [
+        joinedload(User.club),
+        joinedload(User.reading_stats),
+        selectinload(User.readings).joinedload(UserBook.book),
+        selectinload(User.badges).joinedload(UserBadge.badge),
+    ],
+    # /report only needs which books are still open
+    "report": [
+        selectinload(User.readings),
+    ],
+    # Finished books list (filtered in Python; a criteria-filtered collection
+    # would leave user.readings incomplete for the rest of the session)
+    "finished_books": [
+        selectinload(User.readings).joinedload(UserBook.book),
+    ],
+    # /reading_now: every club member's books, loaded for the whole list at once
+    "club_readings": [
+        selectinload(User.readings).joinedload(UserBook.book),
+    ],
+}
+
+
+def loader_options(profile):
+    """Loader options for a named profile (None -> plain lazy loading)."""
+    if profile is None:
+        return []
+    return LOADER_PROFILES[profile]
@@ -0,0 +1,156 @@
+"""
+Columnar (NumPy) reading stats over DailyLog.
+
+Stats for many users at once (weekly summary, admin club dashboard) used to be
+a query plus a few Python passes per user. Here the logs for any set of users
+come back from one query as parallel arrays:
+
+    user  - row index into LogArrays.user_ids
+    day   - date ordinal
+    prl, rnk, status - pages and a small status code
+
+and every statistic is a masked np.bincount over the user index, so a whole
+club costs about the same as one member.
+
+numpy is heavy to import; import this module inside the function that needs it
+(like recommendations), never at the top of a handler module.
+"""
+import datetime
+from dataclasses import dataclass
+
+import numpy as np
+from sqlalchemy import select
+
+from database import DailyLog, User
+
+STATUS_CODES = {'achieved': 1, 'read_not_enough': 2, 'missed': 3, 'not_read': 4, 'pending': 5}
+ACHIEVED, READ_NOT_ENOUGH = STATUS_CODES['achieved'], STATUS_CODES['read_not_enough']
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+@dataclass
+class LogArrays:
+    user_ids: np.ndarray  # every requested user, including those without logs
+    user: np.ndarray
+    day: np.ndarray
+    prl: np.ndarray
+    rnk: np.ndarray
+    status: np.ndarray
+
+    @property
+    def pages(self):
+        return self.prl + self.rnk
+
+    def per_user(self, values, mask=None):
+        """Sum `values` (array or scalar 1) per user, optionally over `mask` rows only."""
+        weights = np.broadcast_to(np.asarray(values, dtype=np.int64), self.user.shape)
+        if mask is not None:
+            weights = np.where(mask, weights, 0)
+        return np.bincount(self.user, weights=weights, minlength=len(self.user_ids)).astype(np.int64)
+
+    def window(self, start, end):
+        """Row mask for start <= date < end."""
+        return (self.day >= start.toordinal()) & (self.day < end.toordinal())
+
+
+def load_log_arrays(session, user_ids=None, since=None, until=None, club_id=None):
+    """
+    Logs (optionally since <= date < until) as LogArrays, one query. Pass
+    `user_ids`, a `club_id`, or neither for every user.
+    """
+    if user_ids is not None:
+        user_filter = DailyLog.user_id.in_(sorted(set(user_ids)))
+    else:
+        # Subquery rather than a huge IN list of bound parameters
+        members = select(User.id)
+        if club_id is not None:
+            members = members.where(User.club_id == club_id)
+        user_ids = session.execute(members).scalars().all()
+        user_filter = DailyLog.user_id.in_(members)
+    user_ids = np.array(sorted(set(user_ids)), dtype=np.int64)
+
+    query = select(DailyLog.user_id, DailyLog.date, DailyLog.pages_read_prl, DailyLog.pages_read_rnk,
+                   DailyLog.status).where(user_filter)
+    if since is not None:
+        query = query.where(DailyLog.date >= since)
+    if until is not None:
+        query = query.where(DailyLog.date < until)
+    rows = session.execute(query).all()
+
+    n = len(rows)
+    uid = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+    return LogArrays(
+        user_ids=user_ids,
+        user=np.searchsorted(user_ids, uid),
+        day=np.fromiter((r[1].toordinal() for r in rows), dtype=np.int64, count=n),
+        prl=np.fromiter((r[2] or 0 for r in rows), dtype=np.int64, count=n),
+        rnk=np.fromiter((r[3] or 0 for r in rows), dtype=np.int64, count=n),
+        status=np.fromiter((STATUS_CODES.get(r[4], 0) for r in rows), dtype=np.int8, count=n),
+    )
+
+
+def window_stats(arrays, start, end):
+    """
+    Per-user totals for start <= date < end: {user_id: {'pages', 'prl', 'rnk',
+    'days_logged', 'days_achieved', 'days_active'}}.
+    """
+    mask = arrays.window(start, end)
+    columns = {
+        'pages': arrays.per_user(arrays.pages, mask),
+        'prl': arrays.per_user(arrays.prl, mask),
+        'rnk': arrays.per_user(arrays.rnk, mask),
+        'days_logged': arrays.per_user(1, mask),
+        'days_achieved': arrays.per_user(1, mask & (arrays.status == ACHIEVED)),
+        'days_active': arrays.per_user(1, mask & np.isin(arrays.status, (ACHIEVED, READ_NOT_ENOUGH))),
+    }
+    return {int(uid): {name: int(col[i]) for name, col in columns.items()} for i, uid in enumerate(arrays.user_ids)}
+
+
+def reading_stats(arrays, today):
+    """
+    The calculate_reading_stats numbers for every user in `arrays`, computed
+    from whatever history was loaded: {user_id: {...}}. 'today_pages_read',
+    'avg_pages_week' and 'avg_pages_month' need the logs since min(today - 7
+    days, first of month); the totals, all-time average and best weekday
+    need the full history.
+    """
+    tomorrow = today + datetime.timedelta(days=1)
+    week_ago = today - datetime.timedelta(days=7)
+    month_start = today.replace(day=1)
+    pages = arrays.pages
+    is_active = np.isin(arrays.status, (ACHIEVED, READ_NOT_ENOUGH))
+    n_users = len(arrays.user_ids)
+
+    today_pages = arrays.per_user(pages, arrays.day == today.toordinal())
+    week_pages = arrays.per_user(pages, arrays.window(week_ago, tomorrow))
+    month_pages = arrays.per_user(pages, arrays.window(month_start, tomorrow))
+    total_pages = arrays.per_user(pages)
+    active_days = arrays.per_user(1, is_active)
+
+    # First log of any status, per user (same rule as the rollup)
+    first_day = np.full(n_users, np.iinfo(np.int64).max)
+    np.minimum.at(first_day, arrays.user, arrays.day)
+
+    # Pages on active days per (user, weekday); date.fromordinal(1) is a Monday
+    weekday = (arrays.day - 1) % 7
+    by_weekday = np.bincount(arrays.user * 7 + weekday, weights=pages * is_active, minlength=n_users * 7)
+    by_weekday = by_weekday.reshape(n_users, 7).astype(np.int64)
+    best_weekday = by_weekday.argmax(axis=1)
+
+    days_in_month = (today - month_start).days + 1
+    result = {}
+    for i, uid in enumerate(arrays.user_ids):
+        has_history = first_day[i] != np.iinfo(np.int64).max
+        total_days = today.toordinal() - first_day[i] + 1 if has_history else 1
+        result[int(uid)] = {
+            'today_pages_read': int(today_pages[i]),
+            'avg_pages_week': round(int(week_pages[i]) / 7, 1),
+            'avg_pages_month': round(int(month_pages[i]) / days_in_month, 1),
+            'avg_pages_all_time': round(int(total_pages[i]) / max(int(total_days), 1), 1),
+            'total_pages_read': int(total_pages[i]),
+            'days_active': int(active_days[i]),
+            'first_log_date': datetime.date.fromordinal(int(first_day[i])) if has_history else None,
+            'weekday_pages': by_weekday[i].tolist(),
+            'most_productive_day': WEEKDAYS[best_weekday[i]] if by_weekday[i].max() > 0 else 'N/A',
+        }
+    return result
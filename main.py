@@ -1,12 +1,17 @@
 import os
+import asyncio
+import importlib
 import logging
+import time
 from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler
 from dotenv import load_dotenv
-from database import init_db, get_session_scope
+from database import init_db, get_session_scope, AsyncSession
 from handlers import setup_conv, report_conv, profile, leaderboard, help_command, badges, reading_now, stats
 from my_books_handler import my_books_conv
 from admin_panel import admin_panel_conv
-from scheduler_tasks import send_daily_checkin, send_reminder, close_questionnaire, send_daily_report, send_weekly_summary
+from graph_renderer import renderer as graph_renderer
+from identity_cache import identity_cache
+from scheduler_tasks import send_daily_checkin, send_reminder, close_questionnaire, send_daily_report, send_weekly_summary, refresh_recommendations
 from pytz import timezone
 
 # Load environment variables
@@ -21,6 +26,9 @@ logging.basicConfig(
 
 TOKEN = os.getenv('BOT_TOKEN')
 
+# Imported on first use by handlers; loaded in the background after startup
+WARM_UP_MODULES = ['recommendations', 'log_arrays']
+
 def main():
     # Load Config
     from utils import get_admin_ids
@@ -31,8 +39,9 @@ def main():
         print("Error: BOT_TOKEN not found in environment variables.")
         return
 
-    # Initialize DB
+    # Initialize DB (shared engine for every module)
     Session = init_db()
+    logging.info(f"Database pool: {Session.pool_stats()}")
     
     # Init Badges
     from gamification import init_badges
@@ -53,12 +62,33 @@ def main():
             ('change_club', 'Switch to a different club'),
             ('help', 'Show help message')
         ])
+        # Heavy first-use pieces load in the background so polling starts right away
+        application.create_task(warm_up(), name="warm_up")
+    
+    async def warm_up():
+        """Start the chart workers and load lazily-imported modules before the first user needs them."""
+        started = time.monotonic()
+        try:
+            await graph_renderer.warm_up()
+            for module in WARM_UP_MODULES:
+                await asyncio.to_thread(importlib.import_module, module)
+        except Exception as e:
+            logging.warning(f"Warm-up failed, modules will load on first use: {e}")
+            return
+        logging.info(f"Warm-up finished in {time.monotonic() - started:.2f}s")
+    
+    async def post_shutdown(application):
+        logging.info(f"Graph renderer: {graph_renderer.stats()}")
+        logging.info(f"Identity cache: {identity_cache.stats()}")
+        graph_renderer.shutdown()
+        await AsyncSession.dispose()
 
-    # Build Application with Persistence
-    from telegram.ext import PicklePersistence
-    persistence = PicklePersistence(filepath='bot_data.pickle')
+    # Build Application with Persistence (rows in our database; the old pickle is imported once)
+    from persistence import SQLPersistence, import_pickle
+    import_pickle('bot_data.pickle')
+    persistence = SQLPersistence()
     
-    application = ApplicationBuilder().token(TOKEN).post_init(post_init).persistence(persistence).build()
+    application = ApplicationBuilder().token(TOKEN).post_init(post_init).post_shutdown(post_shutdown).persistence(persistence).build()
     
     # Add Handlers
     application.add_handler(setup_conv)
@@ -102,11 +132,11 @@ def main():
     # 18:00 Check-in
     job_queue.run_daily(send_daily_checkin, time=datetime.time(hour=18, minute=0, tzinfo=tz))
     
-    # 20:00 Reminder
-    job_queue.run_daily(send_reminder, time=datetime.time(hour=20, minute=0, tzinfo=tz))
+    # 20:00 Reminder (named per hour, so each one keeps its own job run)
+    job_queue.run_daily(send_reminder, time=datetime.time(hour=20, minute=0, tzinfo=tz), name='send_reminder_20')
     
     # 22:00 Reminder
-    job_queue.run_daily(send_reminder, time=datetime.time(hour=22, minute=0, tzinfo=tz))
+    job_queue.run_daily(send_reminder, time=datetime.time(hour=22, minute=0, tzinfo=tz), name='send_reminder_22')
     
     # 00:00 Close Questionnaire
     job_queue.run_daily(close_questionnaire, time=datetime.time(hour=0, minute=0, tzinfo=tz))
@@ -114,9 +144,21 @@ def main():
     # 00:01 Daily Report
     job_queue.run_daily(send_daily_report, time=datetime.time(hour=0, minute=1, tzinfo=tz))
     
+    # 00:15 Precompute recommendations (after the daily report)
+    job_queue.run_daily(refresh_recommendations, time=datetime.time(hour=0, minute=15, tzinfo=tz))
+    
     # Weekly Summary - Every Sunday at 20:00
     job_queue.run_daily(send_weekly_summary, time=datetime.time(hour=20, minute=0, tzinfo=tz), days=(6,))  # 6 = Sunday
     
+    # Runs a restart cut short carry on from their checkpoint (see job_runs.py)
+    import job_runs
+    from utils import get_today_date
+    callbacks = {job.name: job.callback for job in job_queue.jobs()}
+    for run in job_runs.interrupted(get_today_date()):
+        if run.job_name in callbacks:
+            logging.info(f"Resuming {run.job_name} for {run.run_date} after id {run.last_id}")
+            job_queue.run_once(callbacks[run.job_name], when=0, name=run.job_name, data=run.run_date)
+    
     print("Bot is running...")
     application.run_polling()
 
@@ -1,8 +1,8 @@
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, MessageHandler, CallbackQueryHandler, filters
-from database import init_db, User, Book, UserBook, ActionLog
-
-Session = init_db()
+from database import Session, User, Book, UserBook, ActionLog
+from reading_stats import record_book_finished
+from identity_cache import get_user
 
 # States for My Books conversation
 MB_MENU = 0
@@ -13,18 +13,19 @@ MB_ADD_ALREADY_READ = 4
 MB_ADD_CURRENT_PAGE = 5
 
 async def my_books_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from recommendations import get_recommended_book, XP_SELECTION_BONUS
+    from recommendations import get_cached_recommendation, XP_SELECTION_BONUS
     
     session = Session()
-    user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
+    user = get_user(session, update.effective_user.id)
     
     if not user or not user.club_id:
         await update.message.reply_text("You are not in a club yet.")
         session.close()
         return ConversationHandler.END
     
-    # Get recommended book
-    recommended_book, priority = get_recommended_book(user, session)
+    # Get recommended book (precomputed nightly, computed live on a miss)
+    recommended_book, priority = get_cached_recommendation(user, session)
+    session.commit()  # keep a recommendation computed on a cache miss
     
     msg = "📚 <b>Your Books:</b>\n\n"
     
@@ -94,7 +95,7 @@ async def mb_add_select_cat(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['mb_category'] = category
     
     session = Session()
-    user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
+    user = get_user(session, update.effective_user.id)
     
     # Get available books
     all_books = session.query(Book).filter_by(club_id=user.club_id, category=category).all()
@@ -171,7 +172,7 @@ async def mb_add_already_read(update: Update, context: ContextTypes.DEFAULT_TYPE
         return ConversationHandler.END
     
     session = Session()
-    user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
+    user = get_user(session, update.effective_user.id)
     
     total_pages = context.user_data['mb_total_pages']
     book_id = context.user_data['mb_book_id']
@@ -194,6 +195,7 @@ async def mb_add_already_read(update: Update, context: ContextTypes.DEFAULT_TYPE
             is_recommended=is_recommended_selection
         )
         session.add(ub)
+        record_book_finished(session, user.id)
         
         # Award selection bonus if recommended
         bonus_msg = ""
@@ -295,7 +297,7 @@ async def mb_add_current_page(update: Update, context: ContextTypes.DEFAULT_TYPE
             return MB_ADD_CURRENT_PAGE
         
         session = Session()
-        user = session.query(User).filter_by(telegram_id=update.effective_user.id).first()
+        user = get_user(session, update.effective_user.id)
         book_id = context.user_data['mb_book_id']
         
         # Check if this is the recommended book
@@ -370,5 +372,7 @@ my_books_conv = ConversationHandler(
         MB_ADD_CURRENT_PAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, mb_add_current_page)],
     },
     fallbacks=[CommandHandler('cancel', mb_cancel)],
+    name='my_books_conv',
+    persistent=True,
     per_message=False
 )
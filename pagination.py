@@ -0,0 +1,104 @@
+"""
+Keyset-paginated inline keyboards for the admin lists.
+
+A list loads one page of rows (ORDER BY id, WHERE id > cursor LIMIT n)
+instead of the whole table, so it stays under Telegram's markup limits
+however many users or clubs there are. Prev/Next buttons carry the list's
+own callback data plus the page position:
+
+    user_list            first page
+    user_list|n120|ab    the page after id 120, names starting with "ab"
+    user_list|p101|ab    the page before id 101
+
+so a handler calls split_page_data() first and routes on the plain callback
+data exactly as before.
+"""
+from dataclasses import dataclass
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import ADMIN_PAGE_SIZE, MAX_BUTTONS_PER_MESSAGE
+
+CALLBACK_DATA_LIMIT = 64  # bytes, Telegram's limit
+# Leave room for the extra rows, Prev/Next and Back
+PAGE_SIZE = min(ADMIN_PAGE_SIZE, MAX_BUTTONS_PER_MESSAGE - 6)
+
+
+@dataclass
+class PageRequest:
+    after: int = 0  # Rows with id > after...
+    before: int = None  # ...or the page ending just before this id
+    name_prefix: str = ''
+
+
+@dataclass
+class Page:
+    rows: list
+    has_prev: bool
+    has_next: bool
+    name_prefix: str = ''
+
+
+def split_page_data(data):
+    """'kickuser_club_5|n120|ab' -> ('kickuser_club_5', PageRequest(after=120, name_prefix='ab'))"""
+    if '|' not in data:
+        return data, PageRequest()
+    data, position, name_prefix = data.split('|', 2)
+    if position[0] == 'p':
+        return data, PageRequest(before=int(position[1:]), name_prefix=name_prefix)
+    return data, PageRequest(after=int(position[1:]), name_prefix=name_prefix)
+
+
+def page_data(list_data, position, name_prefix=''):
+    """Callback data for a page of `list_data`, with the name prefix trimmed to fit."""
+    data = f"{list_data}|{position}|"
+    room = CALLBACK_DATA_LIMIT - len(data.encode())
+    return data + name_prefix.encode()[:max(room, 0)].decode(errors='ignore')
+
+
+def fetch_page(session, stmt, id_column, request, name_column=None, page_size=PAGE_SIZE):
+    """
+    One page of `stmt` in `id_column` order, as Rows. `stmt` must select the
+    id labelled 'id'; `name_column` is what request.name_prefix filters on.
+    Reads one row past the page to know whether there is another.
+    """
+    if request.name_prefix and name_column is not None:
+        escaped = request.name_prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        stmt = stmt.where(name_column.ilike(f"{escaped}%", escape='\\'))
+
+    if request.before is not None:
+        rows = session.execute(
+            stmt.where(id_column < request.before).order_by(id_column.desc()).limit(page_size + 1)
+        ).all()
+        return Page(rows[:page_size][::-1], has_prev=len(rows) > page_size, has_next=True,
+                    name_prefix=request.name_prefix)
+
+    rows = session.execute(
+        stmt.where(id_column > request.after).order_by(id_column).limit(page_size + 1)
+    ).all()
+    return Page(rows[:page_size], has_prev=request.after > 0, has_next=len(rows) > page_size,
+                name_prefix=request.name_prefix)
+
+
+def build_page_keyboard(page, list_data, button, back_data="back_main", top_rows=(), extra_rows=()):
+    """
+    Keyboard for a Page: `top_rows`, one button per row from button(row), Prev/Next
+    (back to `list_data`), `extra_rows` and a Back button.
+    """
+    keyboard = [list(r) for r in top_rows]
+    keyboard += [[button(row)] for row in page.rows]
+
+    nav = []
+    if page.rows and page.has_prev:
+        nav.append(InlineKeyboardButton(
+            "◀️ Prev", callback_data=page_data(list_data, f"p{page.rows[0].id}", page.name_prefix)
+        ))
+    if page.rows and page.has_next:
+        nav.append(InlineKeyboardButton(
+            "Next ▶️", callback_data=page_data(list_data, f"n{page.rows[-1].id}", page.name_prefix)
+        ))
+    if nav:
+        keyboard.append(nav)
+    keyboard += [list(r) for r in extra_rows]
+    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data=back_data)])
+    return InlineKeyboardMarkup(keyboard)
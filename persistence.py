@@ -0,0 +1,229 @@
+"""
+Bot persistence in the bot's own database, replacing PicklePersistence.
+
+PicklePersistence re-pickled every user's data and every conversation into
+one file on each flush, so flushes grew with the number of users and a crash
+mid-write could corrupt the file. Here each user_data / chat_data entry and
+each in-flight conversation is its own row:
+
+- a flush only writes entries whose pickle changed since they were loaded or
+  last written, all in one transaction
+- user and chat data load lazily: nothing at startup, then each entry the
+  first time PTB refreshes it for an update (refresh_user_data)
+- a conversation that ends deletes its row, so startup only reads the ones
+  still in flight
+
+import_pickle() moves an existing bot_data.pickle over once.
+"""
+import asyncio
+import json
+import logging
+import os
+import pickle
+from datetime import datetime
+
+from sqlalchemy import delete, func, select
+from telegram.ext import BasePersistence
+
+from database import (
+    AsyncSession, Session, PersistedConversation, PersistedData, _dialect_insert,
+    get_async_session_scope, get_session_scope
+)
+
+logger = logging.getLogger(__name__)
+
+BOT_KEY = 0  # bot_data and callback_data have one row each
+
+
+def _dumps(value):
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class SQLPersistence(BasePersistence):
+    """BasePersistence on the persisted_data / persisted_conversations tables."""
+
+    def __init__(self, session_factory=AsyncSession, store_data=None, update_interval=60):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self._session_factory = session_factory
+        self._written = {}  # row -> pickle as last loaded/written, to skip unchanged entries
+        self._loaded = set()  # (kind, id) of user/chat data already fetched
+        self._pending = {}  # row -> pickle to write, None to delete
+        self._lock = asyncio.Lock()
+
+    # Rows are ('data', kind, id) or ('conversation', name, key as JSON)
+
+    async def _load(self, kind, key):
+        async with get_async_session_scope(self._session_factory) as session:
+            blob = await session.scalar(select(PersistedData.value).filter_by(kind=kind, key=key))
+        if blob is None:
+            return None
+        self._written[('data', kind, key)] = blob
+        return pickle.loads(blob)
+
+    async def _refresh(self, kind, key, data):
+        if (kind, key) in self._loaded:
+            return
+        self._loaded.add((kind, key))
+        stored = await self._load(kind, key)
+        for name, value in (stored or {}).items():
+            # Anything set since startup wins over the stored copy
+            data.setdefault(name, value)
+
+    async def _store(self, row, value):
+        """Queue `row` (None deletes it) unless it's unchanged, then write the queue."""
+        blob = None if value is None else _dumps(value)
+        if blob is not None and self._written.get(row) == blob:
+            return
+        self._pending[row] = blob
+        await self._write_pending()
+
+    async def _write_pending(self):
+        # PTB stores every changed entry concurrently; whoever holds the lock
+        # writes everything queued so far in one transaction
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                async with get_async_session_scope(self._session_factory) as session:
+                    for row, blob in pending.items():
+                        await self._write_row(session, row, blob)
+            except Exception:
+                # Retried with the next flush unless a newer value arrives first
+                for row, blob in pending.items():
+                    self._pending.setdefault(row, blob)
+                raise
+            for row, blob in pending.items():
+                if blob is None:
+                    self._written.pop(row, None)
+                else:
+                    self._written[row] = blob
+
+    @staticmethod
+    async def _write_row(session, row, blob):
+        table, name, key = row
+        if table == 'data':
+            model, ids, column = PersistedData, {'kind': name, 'key': key}, 'value'
+        else:
+            model, ids, column = PersistedConversation, {'name': name, 'key': key}, 'state'
+
+        if blob is None:
+            await session.execute(delete(model).filter_by(**ids))
+            return
+        values = {column: blob, 'updated_at': datetime.now()}
+        dialect_insert = _dialect_insert(session.sync_session)
+        if dialect_insert is None:
+            await session.merge(model(**ids, **values))
+            return
+        await session.execute(
+            dialect_insert(model).values(**ids, **values)
+            .on_conflict_do_update(index_elements=list(ids), set_=values)
+        )
+
+    # ==================== BasePersistence ====================
+
+    async def get_user_data(self):
+        # Loaded per user on first use, see refresh_user_data
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return await self._load('bot_data', BOT_KEY) or {}
+
+    async def get_callback_data(self):
+        return await self._load('callback_data', BOT_KEY)
+
+    async def get_conversations(self, name):
+        async with get_async_session_scope(self._session_factory) as session:
+            rows = (await session.execute(
+                select(PersistedConversation.key, PersistedConversation.state).filter_by(name=name)
+            )).all()
+        conversations = {}
+        for key, blob in rows:
+            self._written[('conversation', name, key)] = blob
+            conversations[tuple(json.loads(key))] = pickle.loads(blob)
+        return conversations
+
+    async def update_conversation(self, name, key, new_state):
+        await self._store(('conversation', name, json.dumps(key)), new_state)
+
+    async def update_user_data(self, user_id, data):
+        await self._store(('data', 'user_data', user_id), data)
+
+    async def update_chat_data(self, chat_id, data):
+        await self._store(('data', 'chat_data', chat_id), data)
+
+    async def update_bot_data(self, data):
+        await self._store(('data', 'bot_data', BOT_KEY), data)
+
+    async def update_callback_data(self, data):
+        await self._store(('data', 'callback_data', BOT_KEY), data)
+
+    async def drop_user_data(self, user_id):
+        await self._store(('data', 'user_data', user_id), None)
+
+    async def drop_chat_data(self, chat_id):
+        await self._store(('data', 'chat_data', chat_id), None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        await self._refresh('user_data', user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        await self._refresh('chat_data', chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data):
+        pass  # Loaded once at startup; only this process changes it
+
+    async def flush(self):
+        await self._write_pending()
+
+
+def import_pickle(filepath='bot_data.pickle'):
+    """
+    Move a PicklePersistence file into the tables, once: skipped if the file
+    is missing or unreadable or the tables already hold data, renamed to
+    *.imported after if possible.
+    Returns the number of rows written.
+    """
+    if not os.path.exists(filepath):
+        return 0
+    with get_session_scope(Session) as session:
+        existing = session.scalar(select(func.count()).select_from(PersistedData))
+        existing += session.scalar(select(func.count()).select_from(PersistedConversation))
+    if existing:
+        logger.warning(f"Not importing {filepath}: persistence tables already hold {existing} rows")
+        return 0
+    try:
+        with open(filepath, 'rb') as f:
+            data = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError) as e:
+        # A truncated/corrupt file mustn't keep the bot from starting
+        logger.warning(f"Not importing {filepath}, could not read it: {e!r}")
+        return 0
+
+    rows = []
+    for kind in ('user_data', 'chat_data'):
+        for key, value in (data.get(kind) or {}).items():
+            if value:
+                rows.append(PersistedData(kind=kind, key=key, value=_dumps(value)))
+    if data.get('bot_data'):
+        rows.append(PersistedData(kind='bot_data', key=BOT_KEY, value=_dumps(data['bot_data'])))
+    if data.get('callback_data') is not None:
+        rows.append(PersistedData(kind='callback_data', key=BOT_KEY, value=_dumps(data['callback_data'])))
+    for name, conversations in (data.get('conversations') or {}).items():
+        for key, state in conversations.items():
+            if state is not None:
+                rows.append(PersistedConversation(name=name, key=json.dumps(key), state=_dumps(state)))
+
+    with get_session_scope(Session) as session:
+        session.add_all(rows)
+
+    logger.info(f"Imported {len(rows)} entries from {filepath}")
+    try:
+        os.replace(filepath, f"{filepath}.imported")
+    except OSError as e:
+        # e.g. a bind-mounted file; the tables aren't empty any more, so it won't be imported again
+        logger.warning(f"Could not rename {filepath} after import: {e}")
+    return len(rows)
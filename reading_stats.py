@@ -0,0 +1,191 @@
+"""
+Incremental per-user reading aggregates (the `user_reading_stats` rollup).
+
+finish_report and the book-finished paths update the rollup in the same
+transaction as the report itself, so profile/stats/badge readers never have
+to scan a user's whole DailyLog history.
+
+Rebuild everything from daily_logs with:
+    python reading_stats.py rebuild
+"""
+import sys
+from datetime import timedelta
+from sqlalchemy import func, case, and_, extract, select, insert, delete, update
+from database import DailyLog, UserBook, UserReadingStats
+
+ACTIVE_STATUSES = ('achieved', 'read_not_enough')
+WEEKDAY_COLUMNS = ['pages_mon', 'pages_tue', 'pages_wed', 'pages_thu', 'pages_fri', 'pages_sat', 'pages_sun']
+LOG_COLUMNS = ['total_pages', 'total_prl', 'total_rnk', 'active_days'] + WEEKDAY_COLUMNS
+
+
+def _empty_row(user_id):
+    row = {column: 0 for column in LOG_COLUMNS}
+    row.update(user_id=user_id, first_log_date=None, books_finished=0)
+    return row
+
+
+def rebuild(bind, user_ids=None):
+    """
+    Recompute the rollup from daily_logs and user_books for `user_ids` (or
+    everyone). `bind` can be a Session or a Connection. Returns the row count.
+    """
+    prl = func.coalesce(DailyLog.pages_read_prl, 0)
+    rnk = func.coalesce(DailyLog.pages_read_rnk, 0)
+    pages = prl + rnk
+    is_active = DailyLog.status.in_(ACTIVE_STATUSES)
+    # SQL day of week: 0 = Sunday .. 6 = Saturday
+    dow = extract('dow', DailyLog.date)
+
+    columns = [
+        DailyLog.user_id,
+        func.sum(pages).label('total_pages'),
+        func.sum(prl).label('total_prl'),
+        func.sum(rnk).label('total_rnk'),
+        func.sum(case((is_active, 1), else_=0)).label('active_days'),
+        # Any log counts, pending/missed included: the all-time average runs from here
+        func.min(DailyLog.date).label('first_log_date'),
+    ]
+    # Weekday totals only count active days (achieved / read_not_enough)
+    for sql_dow, column in zip([1, 2, 3, 4, 5, 6, 0], WEEKDAY_COLUMNS):
+        columns.append(func.sum(case((and_(is_active, dow == sql_dow), pages), else_=0)).label(column))
+
+    log_query = select(*columns).group_by(DailyLog.user_id)
+    books_query = (
+        select(UserBook.user_id, func.count().label('books_finished'))
+        .where(UserBook.finished == True)
+        .group_by(UserBook.user_id)
+    )
+    if user_ids is not None:
+        log_query = log_query.where(DailyLog.user_id.in_(user_ids))
+        books_query = books_query.where(UserBook.user_id.in_(user_ids))
+
+    rows = {uid: _empty_row(uid) for uid in (user_ids or [])}
+    for r in bind.execute(log_query).mappings():
+        row = rows.setdefault(r['user_id'], _empty_row(r['user_id']))
+        row.update({k: v or 0 for k, v in r.items() if k in LOG_COLUMNS})
+        row['first_log_date'] = r['first_log_date']
+    for user_id, books_finished in bind.execute(books_query):
+        rows.setdefault(user_id, _empty_row(user_id))['books_finished'] = books_finished
+
+    stmt = delete(UserReadingStats)
+    if user_ids is not None:
+        stmt = stmt.where(UserReadingStats.user_id.in_(user_ids))
+    bind.execute(stmt)
+    if rows:
+        bind.execute(insert(UserReadingStats), list(rows.values()))
+    return len(rows)
+
+
+def get_user_stats(session, user_id):
+    """Return the user's rollup row, building it from their logs if it doesn't exist yet."""
+    stats = session.get(UserReadingStats, user_id)
+    if stats is None:
+        rebuild(session, [user_id])
+        stats = session.get(UserReadingStats, user_id)
+    return stats
+
+
+def apply_report(session, user_id, day, pages_prl, pages_rnk, old_status, new_status, previous_pages=0):
+    """
+    Fold one report (already written to daily_logs) into the rollup.
+    `previous_pages` is what the day's log held before this report.
+    """
+    stats = session.get(UserReadingStats, user_id)
+    if stats is None:
+        # No rollup yet: the rebuild reads the logs, which already include this report
+        return get_user_stats(session, user_id)
+
+    pages = pages_prl + pages_rnk
+    stats.total_pages += pages
+    stats.total_prl += pages_prl
+    stats.total_rnk += pages_rnk
+
+    # Weekday totals follow the log in and out of the active statuses
+    was_active, is_active = old_status in ACTIVE_STATUSES, new_status in ACTIVE_STATUSES
+    weekday_delta = (pages if is_active else 0) + (previous_pages if is_active and not was_active else 0)
+    if was_active and not is_active:
+        weekday_delta -= previous_pages
+    weekday_column = WEEKDAY_COLUMNS[day.weekday()]
+    setattr(stats, weekday_column, getattr(stats, weekday_column) + weekday_delta)
+
+    if is_active and not was_active:
+        stats.active_days += 1
+    if stats.first_log_date is None or day < stats.first_log_date:
+        stats.first_log_date = day
+    return stats
+
+
+def record_book_finished(session, user_id):
+    """Count one more finished book for the user."""
+    stats = session.get(UserReadingStats, user_id)
+    if stats is None:
+        return get_user_stats(session, user_id)
+    stats.books_finished += 1
+    return stats
+
+
+def reset_log_stats(session, user_id):
+    """Clear everything derived from daily logs (used when an admin resets a user)."""
+    values = {column: 0 for column in LOG_COLUMNS}
+    values['first_log_date'] = None
+    session.execute(update(UserReadingStats).where(UserReadingStats.user_id == user_id).values(**values))
+
+
+def delete_user_stats(session, user_ids):
+    session.execute(delete(UserReadingStats).where(UserReadingStats.user_id.in_(user_ids)))
+
+
+def stats_summary(session, user_id, today):
+    """
+    Everything /stats shows, in one query: the rollup row plus this week's and
+    last week's pages summed over the two-week log window (index range on
+    (user_id, date), so the cost doesn't grow with the user's history).
+    Returns (stats, this_week_pages, last_week_pages).
+    """
+    week_ago = today - timedelta(days=7)
+    two_weeks_ago = today - timedelta(days=14)
+    pages = func.coalesce(DailyLog.pages_read_prl, 0) + func.coalesce(DailyLog.pages_read_rnk, 0)
+
+    window = (
+        select(
+            DailyLog.user_id,
+            func.sum(case((DailyLog.date >= week_ago, pages), else_=0)).label('this_week_pages'),
+            func.sum(case((DailyLog.date < week_ago, pages), else_=0)).label('last_week_pages'),
+        )
+        .where(DailyLog.user_id == user_id, DailyLog.date >= two_weeks_ago)
+        .group_by(DailyLog.user_id)
+        .subquery()
+    )
+    query = (
+        select(
+            UserReadingStats,
+            func.coalesce(window.c.this_week_pages, 0),
+            func.coalesce(window.c.last_week_pages, 0),
+        )
+        .outerjoin(window, window.c.user_id == UserReadingStats.user_id)
+        .where(UserReadingStats.user_id == user_id)
+    )
+    row = session.execute(query).first()
+    if row is None:
+        # No rollup yet: build it once, the next /stats is a single query
+        get_user_stats(session, user_id)
+        row = session.execute(query).first()
+    return tuple(row)
+
+
+def most_productive_weekday(stats):
+    """Index (0=Monday) of the weekday with the most pages, or None if nothing was read."""
+    totals = [getattr(stats, column) for column in WEEKDAY_COLUMNS]
+    best = max(totals)
+    return totals.index(best) if best > 0 else None
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['rebuild']:
+        print("Usage: python reading_stats.py rebuild")
+        sys.exit(1)
+
+    from database import init_db, get_session_scope
+    with get_session_scope(init_db()) as session:
+        count = rebuild(session)
+    print(f"Rebuilt reading stats for {count} users")
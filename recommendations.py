@@ -1,8 +1,9 @@
 """Book recommendation engine for the reading club bot"""
 import random
-from database import init_db, User, Book, UserBook
-
-Session = init_db()
+import unicodedata
+from datetime import datetime
+from sqlalchemy import select, insert, delete
+from database import User, Book, UserBook, Club, Recommendation
 
 # Priority tier mappings
 PRIORITY_BOOKS = {
@@ -67,64 +68,209 @@ PRIORITY_BOOKS = {
 XP_SELECTION_BONUS = 50
 XP_COMPLETION_BONUS = 100
 
+# Turkish letters fold to their ASCII base; dotted/dotless i both become "i"
+_TURKISH_FOLD = str.maketrans({
+    'İ': 'i', 'I': 'i', 'ı': 'i',
+    'Ğ': 'g', 'ğ': 'g', 'Ü': 'u', 'ü': 'u', 'Ş': 's', 'ş': 's',
+    'Ö': 'o', 'ö': 'o', 'Ç': 'c', 'ç': 'c',
+})
+
+
+def normalize_title(title):
+    """Case-, diacritic- and dotless-i-insensitive form of a title for matching."""
+    folded = unicodedata.normalize('NFKD', (title or '').translate(_TURKISH_FOLD))
+    folded = ''.join(ch for ch in folded if not unicodedata.combining(ch))
+    return ' '.join(folded.lower().split())
+
+
+# (tier, normalised name), best tier first
+_PRIORITY_NAMES = [
+    (priority, normalize_title(name))
+    for priority in sorted(PRIORITY_BOOKS)
+    for name in PRIORITY_BOOKS[priority]
+]
+DEFAULT_PRIORITY = 8
+
+
+def match_priority(title):
+    """Best tier whose name appears in `title`, or None if it isn't a priority book."""
+    normalized = normalize_title(title)
+    for priority, name in _PRIORITY_NAMES:
+        if name in normalized:
+            return priority
+    return None
+
+
 def get_book_priority(book_title):
     """Get priority level for a book title"""
-    title_upper = book_title.upper()
-    for priority, books in PRIORITY_BOOKS.items():
-        for book in books:
-            if book.upper() in title_upper or title_upper in book.upper():
-                return priority
-    return 8  # Default to lowest priority
+    normalized = normalize_title(book_title)
+    for priority, name in _PRIORITY_NAMES:
+        if name in normalized or normalized in name:
+            return priority
+    return DEFAULT_PRIORITY  # Default to lowest priority
 
-def get_recommended_book(user, session):
+
+class ClubPriorityIndex:
+    """A club's priority books: tier -> book ids, built from one query over the club's books."""
+
+    def __init__(self, books):
+        self.titles = {}
+        self.tiers = {}
+        for book_id, title in books:
+            priority = match_priority(title)
+            if priority is not None:
+                self.titles[book_id] = title
+                self.tiers.setdefault(priority, []).append(book_id)
+
+
+# club_id -> ClubPriorityIndex; admin book add/delete calls invalidate_priority_index
+_priority_indexes = {}
+
+
+def get_priority_index(session, club_id):
+    index = _priority_indexes.get(club_id)
+    if index is None:
+        books = session.execute(select(Book.id, Book.title).where(Book.club_id == club_id)).all()
+        index = _priority_indexes[club_id] = ClubPriorityIndex(books)
+    return index
+
+
+def invalidate_priority_index(club_id=None):
+    """Forget one club's index (or all of them) after its books change."""
+    if club_id is None:
+        _priority_indexes.clear()
+    else:
+        _priority_indexes.pop(club_id, None)
+
+
+def invalidate_club_recommendations(session, club_id):
+    """A club's books changed: drop its index and its members' cached recommendations."""
+    invalidate_priority_index(club_id)
+    session.execute(
+        delete(Recommendation)
+        .where(Recommendation.user_id.in_(select(User.id).where(User.club_id == club_id)))
+    )
+
+
+def invalidate_user_recommendation(session, user_id):
+    """The user changed club: drop their cached recommendation (including a cached 'nothing left')."""
+    session.execute(delete(Recommendation).where(Recommendation.user_id == user_id))
+
+
+def _pick(index, user_books):
     """
-    Get the next recommended book for a user based on their reading progress.
-    Returns (book, priority_level) or (None, None) if no recommendation available.
+    Choose from the best tier that still has a book the user hasn't added or
+    completed. `user_books` are (book_id, finished, title) rows for one user.
+    Returns (book_id, priority) or (None, None).
     """
-    # Get all completed books by user
-    completed_books = session.query(UserBook).filter(
-        UserBook.user_id == user.id,
-        UserBook.finished == True
-    ).all()
-    
-    completed_titles = {ub.book.title for ub in completed_books}
-    
-    # Get all books in user's current reading list (including completed)
-    user_book_ids = {ub.book_id for ub in user.readings}
-    
+    user_book_ids = {book_id for book_id, _, _ in user_books}
+    completed_titles = {title for _, finished, title in user_books if finished}
+
     # Find lowest priority tier with incomplete books
-    for priority in range(1, 9):  # 1 to 8
-        if priority in PRIORITY_BOOKS:
-            priority_books = PRIORITY_BOOKS[priority]
-            
-            # Find books in this tier that user hasn't completed
-            available_books = []
-            for book_name in priority_books:
-                # Check if this book exists in the club and is not completed
-                club_books = session.query(Book).filter(
-                    Book.club_id == user.club_id,
-                    Book.title.like(f"%{book_name}%")
-                ).all()
-                
-                for club_book in club_books:
-                    # Skip if already completed or already in user's list
-                    if club_book.title not in completed_titles and club_book.id not in user_book_ids:
-                        available_books.append(club_book)
-            
-            # If there are available books in this tier, randomly select one
-            if available_books:
-                recommended = random.choice(available_books)
-                return recommended, priority
-    
+    for priority in sorted(index.tiers):
+        available = [
+            book_id for book_id in index.tiers[priority]
+            if book_id not in user_book_ids and index.titles[book_id] not in completed_titles
+        ]
+        # If there are available books in this tier, randomly select one
+        if available:
+            return random.choice(available), priority
+
     # No recommendations available (completed all tiers)
     return None, None
 
+
+def _user_books_query():
+    return (
+        select(UserBook.user_id, UserBook.book_id, UserBook.finished, Book.title)
+        .outerjoin(Book, UserBook.book_id == Book.id)
+    )
+
+
+def get_recommended_book(user, session):
+    """
+    Get the next recommended book for a user based on their reading progress.
+    Returns (book, priority_level) or (None, None) if no recommendation available.
+    """
+    index = get_priority_index(session, user.club_id)
+    if not index.tiers:
+        return None, None
+
+    rows = session.execute(_user_books_query().where(UserBook.user_id == user.id)).all()
+    book_id, priority = _pick(index, [row[1:] for row in rows])
+    if book_id is None:
+        return None, None
+    return session.get(Book, book_id), priority
+
+
+def recommend_for_club(session, club_id):
+    """
+    Next recommended book for every member of a club in one pass: one query
+    for the members, one for all their UserBook rows, plus the club's index.
+    Returns {user_id: (book_id, priority)}.
+    """
+    index = get_priority_index(session, club_id)
+    member_ids = session.scalars(select(User.id).where(User.club_id == club_id)).all()
+
+    user_books = {user_id: [] for user_id in member_ids}
+    rows = session.execute(
+        _user_books_query().join(User, UserBook.user_id == User.id).where(User.club_id == club_id)
+    )
+    for user_id, book_id, finished, title in rows:
+        user_books[user_id].append((book_id, finished, title))
+
+    return {user_id: _pick(index, books) for user_id, books in user_books.items()}
+
+
+def store_recommendations(session, picks):
+    """Replace the cached recommendations of the users in `picks` ({user_id: (book_id, priority)})."""
+    if not picks:
+        return 0
+    now = datetime.now()
+    session.execute(delete(Recommendation).where(Recommendation.user_id.in_(list(picks))))
+    session.execute(insert(Recommendation), [
+        {'user_id': user_id, 'book_id': book_id, 'priority': priority, 'computed_at': now}
+        for user_id, (book_id, priority) in picks.items()
+    ])
+    return len(picks)
+
+
+def precompute_recommendations(session):
+    """Refresh the recommendations table for every club. Returns the number of users."""
+    total = 0
+    for club_id in session.scalars(select(Club.id)).all():
+        total += store_recommendations(session, recommend_for_club(session, club_id))
+    return total
+
+
+def get_cached_recommendation(user, session):
+    """
+    The user's precomputed recommendation as (book, priority_level), falling
+    back to a live computation (which is then cached) when there's no row yet
+    or the cached row is stale.
+    """
+    cached = session.get(Recommendation, user.id)
+    if cached is not None:
+        if cached.book_id is None:
+            return None, None
+        book = session.get(Book, cached.book_id)
+        already_added = session.scalar(
+            select(UserBook.id).where(UserBook.user_id == user.id, UserBook.book_id == cached.book_id).limit(1)
+        )
+        # Stale if the book was deleted, already added, or belongs to a club the user left
+        if book is not None and book.club_id == user.club_id and already_added is None:
+            return book, cached.priority
+
+    book, priority = get_recommended_book(user, session)
+    store_recommendations(session, {user.id: (book.id if book else None, priority)})
+    return book, priority
+
+
 def set_book_priorities(session):
     """Set priority levels for all books based on the priority mappings"""
-    for priority, book_names in PRIORITY_BOOKS.items():
-        for book_name in book_names:
-            books = session.query(Book).filter(Book.title.like(f"%{book_name}%")).all()
-            for book in books:
-                book.priority_level = priority
-    
+    for book in session.query(Book).all():
+        priority = match_priority(book.title)
+        if priority is not None:
+            book.priority_level = priority
+
     session.commit()
@@ -1,202 +1,335 @@
 from telegram.ext import ContextTypes
-from database import init_db, User, DailyLog, Club, Book, UserBook
 from utils import get_current_time, get_today_date, generate_contribution_graph
-from sqlalchemy import func
+from sqlalchemy import case, false, func, or_, select, true, update
+from sqlalchemy.orm import aliased
 import datetime
+import logging
+import time
 
-from database import init_db, User, DailyLog, Club, Book, UserBook, get_session_scope
-
-Session = init_db()
+from database import Session, AsyncSession, User, DailyLog, Club, Book, UserBook, UserReadingStats, get_session_scope, get_async_session_scope, insert_missing_daily_logs
+from delivery import deliver, OutgoingMessage
+import club_snapshots
+import job_runs
 
 async def send_daily_checkin(context: ContextTypes.DEFAULT_TYPE):
-    with get_session_scope(Session) as session:
-        users = session.query(User).all()
-        today = get_today_date()
+    run = job_runs.start(*job_runs.job_key(context, 'send_daily_checkin', get_today_date()))
+    if run is None:
+        return
+    today = run.run_date
+    
+    for session, users in iter_user_chunks(select(User.id, User.telegram_id), after=run.last_id or 0):
+        # Create a pending log for everyone who hasn't filled it early
+        created = insert_missing_daily_logs(session, [user.id for user in users], today)
+        job_runs.checkpoint(run, users[-1].id, session)
+        session.commit()
+        # Members without a log now have a pending one
+        club_snapshots.clear()
         
-        for user in users:
-            # Check if log already exists (maybe they filled it early?)
-            log = session.query(DailyLog).filter_by(user_id=user.id, date=today).first()
-            if not log:
-                # Create a pending log
-                log = DailyLog(user_id=user.id, date=today, status='pending')
-                session.add(log)
-                session.commit()
-                
-                try:
-                    await context.bot.send_message(chat_id=user.telegram_id, text="👋 Good evening! Did you do your reading today?\nUse /report to log your progress and keep your streak alive! 🔥")
-                except Exception as e:
-                    print(f"Failed to send to {user.telegram_id}: {e}")
+        outgoing = [
+            OutgoingMessage(
+                user.telegram_id,
+                "👋 Good evening! Did you do your reading today?\nUse /report to log your progress and keep your streak alive! 🔥",
+                parse_mode=None
+            )
+            for user in users if user.id in created
+        ]
+        await deliver(context.bot, outgoing, name="send_daily_checkin")
+    
+    job_runs.finish(run)
 
 async def send_reminder(context: ContextTypes.DEFAULT_TYPE):
-    with get_session_scope(Session) as session:
-        users = session.query(User).all()
-        today = get_today_date()
-        
-        for user in users:
-            log = session.query(DailyLog).filter_by(user_id=user.id, date=today).first()
-            if log and log.status == 'pending':
-                try:
-                    await context.bot.send_message(chat_id=user.telegram_id, text="⏰ <b>Reminder:</b> The day is almost over! Don't forget to /report your reading.", parse_mode='HTML')
-                except Exception as e:
-                    print(f"Failed to send reminder to {user.telegram_id}: {e}")
+    # Runs twice a day, so the run name carries the hour (main schedules send_reminder_20 and _22)
+    run = job_runs.start(*job_runs.job_key(context, f"send_reminder_{get_current_time().hour}", get_today_date()))
+    if run is None:
+        return
+    today = run.run_date
+    
+    # Only users whose log for today is still pending
+    pending = select(User.id, User.telegram_id).join(
+        DailyLog, (DailyLog.user_id == User.id) & (DailyLog.date == today) & (DailyLog.status == 'pending')
+    )
+    for session, users in iter_user_chunks(pending, after=run.last_id or 0):
+        session.commit()  # Nothing to write; don't hold the read open while sending
+        outgoing = [
+            OutgoingMessage(
+                user.telegram_id,
+                "⏰ <b>Reminder:</b> The day is almost over! Don't forget to /report your reading."
+            )
+            for user in users
+        ]
+        await deliver(context.bot, outgoing, name="send_reminder")
+        job_runs.checkpoint(run, users[-1].id)
+    
+    job_runs.finish(run)
 
 async def close_questionnaire(context: ContextTypes.DEFAULT_TYPE):
-    with get_session_scope(Session) as session:
-        users = session.query(User).all()
-        today = get_today_date()
-        
-        # Close yesterday's questionnaire (since this runs at 00:00)
-        yesterday = today - datetime.timedelta(days=1)
+    # Close yesterday's questionnaire (since this runs at 00:00)
+    yesterday = get_today_date() - datetime.timedelta(days=1)
+    run = job_runs.start(*job_runs.job_key(context, 'close_questionnaire', yesterday))
+    if run is None:
+        return
+    
+    for session, users in iter_user_chunks(select(User.id), after=run.last_id or 0):
+        # Set-based UPDATEs for the chunk, committed with the checkpoint so a restart never applies them twice
+        missed = close_day(session, run.run_date, [user.id for user in users])
+        job_runs.checkpoint(run, users[-1].id, session)
+        session.commit()
+        # Yesterday's pending logs are now missed
+        club_snapshots.clear()
         
-        for user in users:
-            log = session.query(DailyLog).filter_by(user_id=user.id, date=yesterday).first()
-            
-            # User achieved their goal today - clear any grace period and continue
-            if log and log.status == 'achieved':
-                if user.grace_period_active:
-                    user.grace_period_active = False
-                    session.commit()
-                continue  # Skip to next user - they're good!
-            
-            # User did NOT achieve goal today
-            # Check if user has an active grace period
-            if user.grace_period_active:
-                # Grace period was active but they still didn't achieve - reset streak
-                user.streak = 0
-                user.grace_period_active = False
-                session.commit()
-                
-                try:
-                    await context.bot.send_message(
-                        chat_id=user.telegram_id,
-                        text="⏰ <b>Grace Period Expired</b>\n\n"
-                             "You had 24 hours to make up yesterday's reading by reading double today, but didn't achieve it.\n"
-                             "🔥 Streak reset to 0. 😢\n\n"
-                             "<i>Don't give up! Start a new streak tomorrow!</i>",
-                        parse_mode='HTML'
-                    )
-                except Exception as e:
-                    print(f"Failed to send grace expired msg to {user.telegram_id}: {e}")
+        outgoing = []
+        for row in missed:
+            if row.grace_period_active:
+                # No grace period before - it's active for today now
+                outgoing.append(OutgoingMessage(
+                    row.telegram_id,
+                    "⏰ <b>Grace Period Activated!</b>\n\n"
+                    "You missed your daily reading goal. ⚠️\n\n"
+                    "📚 <b>Good news:</b> You have 24 hours to make it up!\n"
+                    "Read <b>DOUBLE</b> your daily goal tomorrow to preserve your streak.\n\n"
+                    f"🔥 Current streak: {row.streak} days (at risk)"
+                ))
             else:
-                # No grace period - activate it for tomorrow
-                user.grace_period_active = True
-                
-                if log and log.status == 'pending':
-                    log.status = 'missed'
-                    
-                session.commit()
-                
-                try:
-                    await context.bot.send_message(
-                        chat_id=user.telegram_id,
-                        text="⏰ <b>Grace Period Activated!</b>\n\n"
-                             "You missed your daily reading goal. ⚠️\n\n"
-                             "📚 <b>Good news:</b> You have 24 hours to make it up!\n"
-                             "Read <b>DOUBLE</b> your daily goal tomorrow to preserve your streak.\n\n"
-                             f"🔥 Current streak: {user.streak} days (at risk)",
-                        parse_mode='HTML'
-                    )
-                except Exception as e:
-                    print(f"Failed to send grace period msg to {user.telegram_id}: {e}")
+                # Grace period was active but they still didn't achieve - streak was reset
+                outgoing.append(OutgoingMessage(
+                    row.telegram_id,
+                    "⏰ <b>Grace Period Expired</b>\n\n"
+                    "You had 24 hours to make up yesterday's reading by reading double today, but didn't achieve it.\n"
+                    "🔥 Streak reset to 0. 😢\n\n"
+                    "<i>Don't give up! Start a new streak tomorrow!</i>"
+                ))
+        await deliver(context.bot, outgoing, name="close_questionnaire")
+    
+    job_runs.finish(run)
+
+def close_day(session, day, user_ids):
+    """
+    Apply the end-of-day streak rules for `day` to `user_ids` at once:
+
+    - achieved: grace period cleared
+    - missed, no grace period: grace period activated, pending log -> 'missed'
+    - missed during a grace period: streak reset, grace period cleared
+
+    Returns (telegram_id, streak, grace_period_active) rows, with the new
+    values, for everyone who missed - the ones to notify.
+    """
+    in_grace = func.coalesce(User.grace_period_active, false())
+    achieved = (
+        select(DailyLog.id)
+        .where(DailyLog.user_id == User.id, DailyLog.date == day, DailyLog.status == 'achieved')
+        .exists()
+    )
+    
+    # Before the users change: pending logs of those about to enter a grace period
+    session.execute(
+        update(DailyLog)
+        .where(DailyLog.date == day, DailyLog.status == 'pending',
+               DailyLog.user_id.in_(select(User.id).where(User.id.in_(user_ids), ~in_grace)))
+        .values(status='missed')
+        .execution_options(synchronize_session=False)
+    )
+    session.execute(
+        update(User)
+        .where(User.id.in_(user_ids), in_grace, achieved)
+        .values(grace_period_active=False)
+        .execution_options(synchronize_session=False)
+    )
+    # Both missed cases in one statement, so each user's old grace flag decides
+    return session.execute(
+        update(User)
+        .where(User.id.in_(user_ids), ~achieved)
+        .values(
+            streak=case((in_grace, 0), else_=User.streak),
+            grace_period_active=case((in_grace, false()), else_=true()),
+        )
+        .returning(User.telegram_id, User.streak, User.grace_period_active)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+DAILY_REPORT_BATCH_SIZE = 500
+USER_CHUNK_SIZE = 500  # users per keyset chunk (and per short transaction) in the jobs
+
+def user_chunk_query(stmt, last_id, chunk_size=USER_CHUNK_SIZE):
+    """The next keyset page of `stmt` (which selects from users): User.id > last_id, in id order."""
+    return stmt.where(User.id > last_id).order_by(User.id).limit(chunk_size)
+
+def iter_user_chunks(stmt=None, chunk_size=USER_CHUNK_SIZE, after=0):
+    """
+    Walk the users selected by `stmt` (default: User objects) with id > `after`
+    in keyset chunks, each in its own short session. Yields (session, rows); the chunk's
+    transaction commits when the loop moves on, so no job holds one read
+    transaction (or every User in the identity map) for its whole run.
+    `stmt` must select User or include User.id.
+    """
+    stmt = select(User) if stmt is None else stmt
+    entities = len(stmt.column_descriptions) == 1 and stmt.column_descriptions[0]['expr'] is User
+    last_id = after
+    while True:
+        with get_session_scope(Session) as session:
+            result = session.execute(user_chunk_query(stmt, last_id, chunk_size))
+            rows = result.scalars().all() if entities else result.all()
+            if not rows:
+                return
+            yield session, rows
+        last_id = rows[-1].id
+        if len(rows) < chunk_size:
+            return
+
+def daily_report_query(day, club_ids=None, batch_size=DAILY_REPORT_BATCH_SIZE):
+    """
+    One statement with everything the daily report needs: the user, their
+    club goal, the log for `day` and their all-time rank within the club (by
+    the reading stats rollup). Limited to the members of `club_ids` if given
+    (None in the list stands for users without a club), otherwise the whole
+    table streamed in batches of `batch_size`.
+    """
+    totals = UserReadingStats
+    day_log = aliased(DailyLog)
+    
+    # Users without any logs (no rollup row) are left unranked ("N/A")
+    has_logs = totals.user_id.isnot(None)
+    rank = func.rank().over(
+        partition_by=(User.club_id, has_logs),
+        order_by=totals.total_pages.desc()
+    )
+    ranked_in_club = func.count(totals.user_id).over(partition_by=User.club_id)
+    
+    stmt = (
+        select(
+            User.id, User.telegram_id, User.streak, User.level, User.xp, User.grace_period_active,
+            Club.id.label('club_id'), Club.goal_type, Club.daily_min_prl, Club.daily_min_rnk, Club.daily_min_total,
+            day_log.pages_read_prl, day_log.pages_read_rnk, day_log.status,
+            has_logs.label('ranked'), rank.label('rank'), ranked_in_club.label('ranked_in_club'),
+        )
+        .outerjoin(Club, User.club_id == Club.id)
+        .outerjoin(day_log, (day_log.user_id == User.id) & (day_log.date == day))
+        .outerjoin(totals, totals.user_id == User.id)
+        .order_by(User.id)
+    )
+    if club_ids is None:
+        return stmt.execution_options(yield_per=batch_size)
+    # Whole clubs only, so the window ranks see every member
+    in_clubs = User.club_id.in_([c for c in club_ids if c is not None])
+    return stmt.where(or_(in_clubs, User.club_id.is_(None)) if None in club_ids else in_clubs)
+
+def club_chunks(club_sizes, chunk_size=USER_CHUNK_SIZE):
+    """
+    Group (club_id, members) pairs into lists of club ids of about `chunk_size`
+    members each. A club is never split (ranks are per club), so one bigger
+    than `chunk_size` gets a chunk of its own.
+    """
+    chunk, members = [], 0
+    for club_id, size in club_sizes:
+        if chunk and members + size > chunk_size:
+            yield chunk
+            chunk, members = [], 0
+        chunk.append(club_id)
+        members += size
+    if chunk:
+        yield chunk
+
+def load_daily_report_rows(session, day, batch_size=DAILY_REPORT_BATCH_SIZE):
+    """Yield batches of daily_report_query rows from a sync session (scripts, tests)."""
+    for batch in session.execute(daily_report_query(day, batch_size=batch_size)).partitions():
+        yield batch
+
+def render_daily_report(row):
+    """Build the daily report text for one row of load_daily_report_rows (no DB access)"""
+    # Calculate pages read yesterday
+    pages_prl = row.pages_read_prl or 0
+    pages_rnk = row.pages_read_rnk or 0
+    pages_yesterday = pages_prl + pages_rnk
+    
+    # Get user's club goal
+    goal_info = "No club"
+    if row.club_id:
+        if row.goal_type == 'SEPARATE':
+            goal_info = f"{row.daily_min_prl}p PRL + {row.daily_min_rnk}p RNK"
+        else:
+            goal_info = f"{row.daily_min_total}p total"
+    
+    # Status message
+    if row.status == 'achieved':
+        status_emoji = "✅"
+        status_text = "Goal achieved!"
+    elif row.status == 'read_not_enough':
+        status_emoji = "📖"
+        status_text = "Read but didn't reach goal"
+    else:
+        status_emoji = "⚠️"
+        status_text = "Missed - try again today!"
+    
+    rank = row.rank if row.ranked else "N/A"
+    
+    # Grace period info
+    grace_info = ""
+    if row.grace_period_active:
+        grace_info = "\n⏰ <b>Grace Period Active</b> - Read double today!"
+    
+    return (
+        f"📊 <b>Daily Report</b>\n\n"
+        f"<b>Yesterday's Reading:</b>\n"
+        f"📄 Pages read: <b>{pages_yesterday}</b> ({pages_prl} PRL + {pages_rnk} RNK)\n"
+        f"🎯 Goal: {goal_info}\n"
+        f"{status_emoji} Status: {status_text}\n\n"
+        f"<b>Your Stats:</b>\n"
+        f"🔥 Streak: <b>{row.streak}</b> days\n"
+        f"🏆 Club Rank: <b>#{rank}</b> of {row.ranked_in_club}\n"
+        f"⭐ Level: {row.level} ({row.xp} XP)"
+        f"{grace_info}"
+    )
 
 async def send_daily_report(context: ContextTypes.DEFAULT_TYPE):
-    with get_session_scope(Session) as session:
-        users = session.query(User).all()
-        today = get_today_date()
-        yesterday = today - datetime.timedelta(days=1)
-        
-        # Calculate ranking based on total pages read
-        ranking_query = session.query(
-            User.id, 
-            func.sum(DailyLog.pages_read_prl + DailyLog.pages_read_rnk).label('total_pages')
-        ).join(DailyLog).group_by(User.id).order_by(func.sum(DailyLog.pages_read_prl + DailyLog.pages_read_rnk).desc()).all()
-        
-        ranking_map = {r.id: i+1 for i, r in enumerate(ranking_query)}
-        total_users = len(ranking_query)
-        
-        for user in users:
-            # Get yesterday's log for status
-            yesterday_log = session.query(DailyLog).filter_by(user_id=user.id, date=yesterday).first()
-            
-            # Calculate pages read yesterday
-            pages_prl = yesterday_log.pages_read_prl if yesterday_log and yesterday_log.pages_read_prl else 0
-            pages_rnk = yesterday_log.pages_read_rnk if yesterday_log and yesterday_log.pages_read_rnk else 0
-            pages_yesterday = pages_prl + pages_rnk
-            
-            # Get user's club goal
-            goal_info = "No club"
-            goal_met = False
-            if user.club:
-                club = user.club
-                if club.goal_type == 'SEPARATE':
-                    goal_info = f"{club.daily_min_prl}p PRL + {club.daily_min_rnk}p RNK"
-                    goal_met = pages_prl >= club.daily_min_prl and pages_rnk >= club.daily_min_rnk
-                else:
-                    goal_info = f"{club.daily_min_total}p total"
-                    goal_met = pages_yesterday >= club.daily_min_total
-            
-            # Status message
-            if yesterday_log and yesterday_log.status == 'achieved':
-                status_emoji = "✅"
-                status_text = "Goal achieved!"
-            elif yesterday_log and yesterday_log.status == 'read_not_enough':
-                status_emoji = "📖"
-                status_text = "Read but didn't reach goal"
-            else:
-                status_emoji = "⚠️"
-                status_text = "Missed - try again today!"
-            
-            rank = ranking_map.get(user.id, "N/A")
-            
-            # Grace period info
-            grace_info = ""
-            if user.grace_period_active:
-                grace_info = "\n⏰ <b>Grace Period Active</b> - Read double today!"
-            
-            msg = (
-                f"📊 <b>Daily Report</b>\n\n"
-                f"<b>Yesterday's Reading:</b>\n"
-                f"📄 Pages read: <b>{pages_yesterday}</b> ({pages_prl} PRL + {pages_rnk} RNK)\n"
-                f"🎯 Goal: {goal_info}\n"
-                f"{status_emoji} Status: {status_text}\n\n"
-                f"<b>Your Stats:</b>\n"
-                f"🔥 Streak: <b>{user.streak}</b> days\n"
-                f"🏆 Rank: <b>#{rank}</b> of {total_users}\n"
-                f"⭐ Level: {user.level} ({user.xp} XP)"
-                f"{grace_info}"
-            )
-            
-            try:
-                await context.bot.send_message(chat_id=user.telegram_id, text=msg, parse_mode='HTML')
-            except Exception as e:
-                print(f"Failed to send report to {user.telegram_id}: {e}")
+    run = job_runs.start(*job_runs.job_key(context, 'send_daily_report', get_today_date() - datetime.timedelta(days=1)))
+    if run is None:
+        return
+    yesterday = run.run_date
+    
+    async with get_async_session_scope(AsyncSession) as session:
+        club_sizes = (await session.execute(
+            select(User.club_id, func.count()).group_by(User.club_id).order_by(User.club_id.nulls_first())
+        )).all()
+    # Checkpointed by club id (0 = users without a club, always the first chunk)
+    if run.last_id is not None:
+        club_sizes = [(club_id, size) for club_id, size in club_sizes if (club_id or 0) > run.last_id]
+    
+    for club_ids in club_chunks(club_sizes):
+        # A fresh short transaction per chunk; the event loop serves handlers in between
+        async with get_async_session_scope(AsyncSession) as session:
+            rows = (await session.execute(daily_report_query(yesterday, club_ids))).all()
+        outgoing = [OutgoingMessage(row.telegram_id, render_daily_report(row)) for row in rows]
+        await deliver(context.bot, outgoing, name="send_daily_report")
+        job_runs.checkpoint(run, club_ids[-1] or 0)
+    
+    job_runs.finish(run)
 
 async def send_weekly_summary(context: ContextTypes.DEFAULT_TYPE):
     """Send weekly reading summary every Sunday"""
-    import datetime
+    from log_arrays import load_log_arrays, window_stats
+
+    run = job_runs.start(*job_runs.job_key(context, 'send_weekly_summary', get_today_date()))
+    if run is None:
+        return
+    today = run.run_date
     
-    with get_session_scope(Session) as session:
-        users = session.query(User).all()
-        today = get_today_date()
-        
-        # Get start of week (7 days ago)
-        week_start = today - datetime.timedelta(days=7)
+    # Get start of week (7 days ago)
+    week_start = today - datetime.timedelta(days=7)
+    
+    for session, users in iter_user_chunks(after=run.last_id or 0):
+        # The chunk's week in one query, summed per user with numpy
+        arrays = load_log_arrays(session, [u.id for u in users], since=week_start, until=today)
+        week = window_stats(arrays, week_start, today)
+        session.commit()
         
+        outgoing = []
         for user in users:
-            # Get logs for the past week
-            week_logs = session.query(DailyLog).filter(
-                DailyLog.user_id == user.id,
-                DailyLog.date >= week_start,
-                DailyLog.date < today
-            ).all()
-            
-            if not week_logs:
+            user_week = week[user.id]
+            if not user_week['days_logged']:
                 continue  # Skip users with no activity
             
-            # Calculate weekly stats
-            total_pages = sum((log.pages_read_prl or 0) + (log.pages_read_rnk or 0) for log in week_logs)
-            days_achieved = len([log for log in week_logs if log.status == 'achieved'])
-            days_active = len([log for log in week_logs if log.status in ['achieved', 'read_not_enough']])
+            total_pages = user_week['pages']
+            days_achieved = user_week['days_achieved']
+            days_active = user_week['days_active']
             
             # Determine streak status
             streak_status = "🔥 Active" if user.streak > 0 else "💤 Broken"
@@ -223,7 +356,25 @@ async def send_weekly_summary(context: ContextTypes.DEFAULT_TYPE):
             else:
                 msg += "💪 <b>New week, new you!</b> Don't give up! Every day is a chance to read! 🌱"
             
-            try:
-                await context.bot.send_message(chat_id=user.telegram_id, text=msg, parse_mode='HTML')
-            except Exception as e:
-                print(f"Failed to send weekly summary to {user.telegram_id}: {e}")
+            outgoing.append(OutgoingMessage(user.telegram_id, msg))
+        
+        await deliver(context.bot, outgoing, name="send_weekly_summary")
+        job_runs.checkpoint(run, users[-1].id)
+    
+    job_runs.finish(run)
+
+
+async def refresh_recommendations(context: ContextTypes.DEFAULT_TYPE):
+    """Nightly: precompute every member's next recommended book (runs after the daily report)."""
+    from recommendations import precompute_recommendations
+    
+    run = job_runs.start(*job_runs.job_key(context, 'refresh_recommendations', get_today_date()))
+    if run is None:
+        return
+    
+    # One pass over everyone, so no checkpoint - an interrupted run just starts over
+    started = time.monotonic()
+    with get_session_scope(Session) as session:
+        count = precompute_recommendations(session)
+    job_runs.finish(run)
+    logging.info(f"refresh_recommendations: {count} users in {time.monotonic() - started:.2f}s")
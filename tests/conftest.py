@@ -2,7 +2,7 @@ import pytest
 import pytest_asyncio
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from database import Base, User, Club, Book, DailyLog
+from database import Base, User, Club, Book, DailyLog, run_migrations
 from unittest.mock import MagicMock, AsyncMock
 import datetime
 
@@ -16,6 +16,8 @@ def engine():
 @pytest.fixture(scope="session")
 def tables(engine):
     Base.metadata.create_all(engine)
+    # Migrations add what create_all can't, e.g. the user search FTS table
+    run_migrations(engine)
     yield
     Base.metadata.drop_all(engine)
 
@@ -36,6 +38,33 @@ def db_session(engine, tables):
     transaction.rollback()
     connection.close()
 
+@pytest.fixture(autouse=True)
+def clear_identity_cache():
+    """User ids are reused between tests, so cached identities must not leak."""
+    from identity_cache import identity_cache
+    identity_cache.clear()
+    yield
+    identity_cache.clear()
+
+@pytest.fixture
+def session_registry(db_session):
+    """Point the shared database.Session registry at the test transaction."""
+    from database import Session
+    with Session.override(db_session.connection()):
+        yield Session
+
+@pytest_asyncio.fixture
+async def async_db(tmp_path):
+    """
+    Sync and async registries on a throwaway file database, for handlers on
+    AsyncSession (aiosqlite can't join the in-memory test transaction).
+    """
+    from database import Session, AsyncSession
+    Session.configure(f"sqlite:///{tmp_path / 'async.db'}")
+    yield Session, AsyncSession
+    await AsyncSession.dispose()
+    Session.configure(None)
+
 @pytest.fixture
 def mock_update():
     def _create_update(user_id=123, text="/start"):
@@ -0,0 +1,133 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from sqlalchemy import event, insert
+
+import admin_panel
+from config import MAX_BUTTONS_PER_MESSAGE
+from database import Club, User
+from pagination import PAGE_SIZE, page_data, split_page_data
+
+N_USERS = 130
+ADMIN_ID = 999
+
+
+@pytest.fixture
+def admin(db_session, session_registry, monkeypatch):
+    monkeypatch.setattr(admin_panel, "get_admin_ids", lambda: [ADMIN_ID])
+    db_session.execute(insert(Club), [
+        {'id': c, 'name': f'Club {c}', 'key': f'PG{c}', 'goal_type': 'OVERALL'} for c in range(1, 4)
+    ])
+    db_session.execute(insert(User), [
+        {'id': i, 'telegram_id': 5000 + i, 'full_name': ('Anna' if i % 10 == 0 else 'Bob') + f' {i}',
+         'club_id': 1 + i % 3 if i % 13 else None}
+        for i in range(1, N_USERS + 1)
+    ])
+    return db_session
+
+
+def click(data):
+    update = MagicMock()
+    update.effective_user.id = ADMIN_ID
+    update.callback_query.data = data
+    update.callback_query.answer = AsyncMock()
+    update.callback_query.edit_message_text = AsyncMock()
+    return update
+
+
+def buttons(update):
+    markup = update.callback_query.edit_message_text.call_args.kwargs['reply_markup']
+    return [b for row in markup.inline_keyboard for b in row]
+
+
+def nav(update, label):
+    return next((b.callback_data for b in buttons(update) if label in b.text), None)
+
+
+@pytest.mark.asyncio
+async def test_user_list_pages_through_everyone(admin, mock_context):
+    seen, data, pages = [], "user_list", 0
+    while data:
+        update = click(data)
+        await admin_panel.user_menu_handler(update, mock_context)
+        page_buttons = buttons(update)
+        assert len(page_buttons) <= MAX_BUTTONS_PER_MESSAGE
+        assert all(len(b.callback_data.encode()) <= 64 for b in page_buttons)
+        seen += [int(b.callback_data.split('_')[1]) for b in page_buttons if b.callback_data.startswith('viewuser_')]
+        pages += 1
+        data = nav(update, "Next")
+
+    assert seen == list(range(1, N_USERS + 1))
+    assert pages == -(-N_USERS // PAGE_SIZE)
+
+    # Prev from the last page is the page before it
+    await admin_panel.user_menu_handler(update := click(nav(update, "Prev")), mock_context)
+    ids = [int(b.callback_data.split('_')[1]) for b in buttons(update) if b.callback_data.startswith('viewuser_')]
+    last_full = (N_USERS - 1) // PAGE_SIZE * PAGE_SIZE
+    assert ids == list(range(last_full - PAGE_SIZE + 1, last_full + 1))
+
+
+@pytest.mark.asyncio
+async def test_user_list_name_prefix(admin, mock_update, mock_context):
+    update = mock_update(user_id=ADMIN_ID, text="ann")
+    await admin_panel.filter_users(update, mock_context)
+
+    markup = update.message.reply_text.call_args.kwargs['reply_markup']
+    names = [b.text for row in markup.inline_keyboard for b in row if b.callback_data.startswith('viewuser_')]
+    assert names and all(name.startswith('Anna') for name in names)
+    assert len(names) == N_USERS // 10
+    assert "Users named ann" in update.message.reply_text.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_club_selector_counts_members_in_one_query(admin, mock_context):
+    statements = []
+    engine = admin.get_bind().engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    update = click("user_kick")
+    await admin_panel.user_menu_handler(update, mock_context)
+    event.remove(engine, "before_cursor_execute", listener)
+
+    assert len(statements) == 1
+    counts = {b.callback_data: b.text for b in buttons(update) if b.callback_data.startswith('kickuser_club_')}
+    members = sum(1 for i in range(1, N_USERS + 1) if i % 13 and 1 + i % 3 == 2)
+    assert counts['kickuser_club_2'] == f"Club 2 ({members} members)"
+
+
+def test_page_data_fits_callback_limit():
+    data = page_data("resetuser_club_12345", "n1234567890", "ä" * 40)
+    assert len(data.encode()) <= 64
+    assert split_page_data(data)[0] == "resetuser_club_12345"
+    assert split_page_data("user_list|p7|a|b")[1].name_prefix == "a|b"
+
+
+@pytest.mark.asyncio
+async def test_broadcast_targets_page_through_clubs(admin, mock_context):
+    n_clubs = 3 + 2 * PAGE_SIZE
+    admin.execute(insert(Club), [
+        {'id': c, 'name': f'Club {c}', 'key': f'PG{c}', 'goal_type': 'OVERALL'} for c in range(4, n_clubs + 1)
+    ])
+    update = click("menu_broadcast")
+    assert await admin_panel.main_menu_handler(update, mock_context) == admin_panel.BROADCAST_CLUB
+    assert nav(update, "All Users") == "broadcast_all"
+
+    seen = []
+    while True:
+        seen += [int(b.callback_data.split('_')[1]) for b in buttons(update)
+                 if b.callback_data.startswith('broadcast_') and b.callback_data != 'broadcast_all']
+        data = nav(update, "Next")
+        if not data:
+            break
+        update = click(data)
+        assert await admin_panel.broadcast_handler(update, mock_context) == admin_panel.BROADCAST_CLUB
+    assert seen == list(range(1, n_clubs + 1))
+
+
+@pytest.mark.asyncio
+async def test_broadcast_handler_is_admin_only(admin, mock_context):
+    update = click("broadcast_all")
+    update.effective_user.id = ADMIN_ID + 1
+    update.callback_query.answer = AsyncMock()
+    assert await admin_panel.broadcast_handler(update, mock_context) == admin_panel.ConversationHandler.END
+    update.callback_query.edit_message_text.assert_not_called()
@@ -0,0 +1,115 @@
+"""
+Benchmark: p99 latency of a user-facing handler while the daily report job
+runs, with the job on AsyncSession (streamed) vs the old blocking sync path.
+"""
+import asyncio
+import datetime
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from sqlalchemy import insert
+
+from database import Club, User, DailyLog, get_session_scope
+from delivery import DeliveryStats
+from reading_stats import rebuild as rebuild_reading_stats
+from utils import get_today_date
+import handlers
+import scheduler_tasks
+
+N_USERS = 20_000
+N_CLUBS = 400
+INTERVAL = 0.01  # one /leaderboard every 10 ms while the job runs
+
+
+def seed(engine):
+    yesterday = get_today_date() - datetime.timedelta(days=1)
+    with engine.begin() as conn:
+        conn.execute(insert(Club), [
+            {'id': c, 'name': f'C{c}', 'key': f'C{c}', 'goal_type': 'OVERALL',
+             'daily_min_prl': 0, 'daily_min_rnk': 0, 'daily_min_total': 20}
+            for c in range(1, N_CLUBS + 1)
+        ])
+        conn.execute(insert(User), [
+            {'id': i, 'telegram_id': 1000 + i, 'full_name': f'U{i}', 'club_id': 1 + i % N_CLUBS, 'streak': 0,
+             'xp': i % 500, 'level': 1, 'best_streak': 0, 'grace_period_active': False}
+            for i in range(1, N_USERS + 1)
+        ])
+        conn.execute(insert(DailyLog), [
+            {'user_id': i, 'date': yesterday, 'pages_read_prl': i % 30, 'pages_read_rnk': i % 7, 'status': 'achieved'}
+            for i in range(1, N_USERS + 1)
+        ])
+        rebuild_reading_stats(conn)
+
+
+async def blocking_daily_report(context):
+    """The pre-async job: every batch fetched through the sync session on the event loop."""
+    outgoing = []
+    with get_session_scope(scheduler_tasks.Session) as session:
+        yesterday = get_today_date() - datetime.timedelta(days=1)
+        for batch in scheduler_tasks.load_daily_report_rows(session, yesterday):
+            outgoing.extend(scheduler_tasks.render_daily_report(row) for row in batch)
+    await asyncio.sleep(0)
+
+
+async def latencies_during(job):
+    """Fire /leaderboard on a fixed schedule while `job` runs; latency counts from the scheduled time."""
+    context = MagicMock()
+    context.user_data = {'club_id': 1}
+    results = []
+
+    async def timed(scheduled):
+        update = MagicMock()
+        update.effective_user.id = 1001
+        update.message.reply_text = AsyncMock()
+        await handlers.leaderboard(update, context)
+        results.append(time.perf_counter() - scheduled)
+
+    finished = []
+
+    async def run_job():
+        await job(AsyncMock())
+        finished.append(time.perf_counter())
+
+    job_task = asyncio.create_task(run_job())
+    started = time.perf_counter()
+    calls = []
+
+    def fire_due(until):
+        # Updates keep arriving while the loop is blocked; they're handled late, not dropped
+        while started + len(calls) * INTERVAL <= until:
+            calls.append(asyncio.create_task(timed(started + len(calls) * INTERVAL)))
+
+    while not job_task.done():
+        fire_due(time.perf_counter())
+        await asyncio.sleep(max(0.0, started + len(calls) * INTERVAL - time.perf_counter()))
+    fire_due(finished[0])
+    await job_task
+    await asyncio.gather(*calls)
+    return sorted(results), time.perf_counter() - started
+
+
+def p99(values):
+    return values[min(len(values) - 1, int(len(values) * 0.99))]
+
+
+@pytest.mark.asyncio
+async def test_handler_p99_during_daily_report(async_db, monkeypatch):
+    SyncSession, AsyncSession = async_db
+    seed(SyncSession.engine)
+
+    async def fake_deliver(bot, messages, name="delivery", **kwargs):
+        return DeliveryStats(name=name, sent=len(messages))
+
+    monkeypatch.setattr(scheduler_tasks, "deliver", fake_deliver)
+    # Warm both engines' pools and the identity cache
+    await latencies_during(lambda context: asyncio.sleep(0.01))
+
+    blocking, blocking_elapsed = await latencies_during(blocking_daily_report)
+    streamed, streamed_elapsed = await latencies_during(scheduler_tasks.send_daily_report)
+
+    print(f"\nsync job:  {len(blocking)} handler calls in {blocking_elapsed:.2f}s, "
+          f"p50 {blocking[len(blocking) // 2] * 1000:.1f} ms, p99 {p99(blocking) * 1000:.1f} ms")
+    print(f"async job: {len(streamed)} handler calls in {streamed_elapsed:.2f}s, "
+          f"p50 {streamed[len(streamed) // 2] * 1000:.1f} ms, p99 {p99(streamed) * 1000:.1f} ms")
+    assert p99(streamed) < p99(blocking)
@@ -0,0 +1,56 @@
+import datetime
+from sqlalchemy import event
+from database import User, UserBadge, Book, UserBook, upsert_daily_log
+from gamification import init_badges, check_badges, PAGES_ADDED, STREAK_CHANGED, BOOK_FINISHED
+from reading_stats import rebuild
+
+
+def make_user(session, **kwargs):
+    user = User(telegram_id=900, full_name="Badger", **kwargs)
+    session.add(user)
+    session.flush()
+    return user
+
+
+def count_statements(session):
+    statements = []
+    event.listen(session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_only_rules_for_the_event_are_evaluated(db_session):
+    init_badges(db_session)
+    user = make_user(db_session, streak=7, best_streak=7)
+    upsert_daily_log(db_session, user.id, datetime.date(2024, 6, 3), 150, 0)
+    rebuild(db_session, [user.id])
+
+    earned = check_badges(user, db_session, {PAGES_ADDED})
+
+    # The streak qualifies too, but no streak event happened
+    assert [rule.name for rule in earned] == ["100 Pages"]
+
+    earned = check_badges(user, db_session, {STREAK_CHANGED})
+    assert [rule.name for rule in earned] == ["3 Day Streak", "7 Day Streak"]
+    assert db_session.query(UserBadge).filter_by(user_id=user.id).count() == 3
+
+
+def test_book_finished_badges_use_few_queries(db_session):
+    init_badges(db_session)
+    user = make_user(db_session)
+    books = [Book(title="P", category="PRL", total_pages=10), Book(title="R", category="RNK", total_pages=10)]
+    db_session.add_all(books)
+    db_session.flush()
+    db_session.add_all([
+        UserBook(user_id=user.id, book_id=book.id, finished=True, finished_date=datetime.date(2024, 6, 3))
+        for book in books
+    ])
+    rebuild(db_session, [user.id])
+    db_session.flush()
+
+    statements = count_statements(db_session)
+    earned = check_badges(user, db_session, {BOOK_FINISHED})
+
+    assert {rule.name for rule in earned} == {"First Finish", "Speed Reader", "Diverse Reader"}
+    # earned set, rollup row, finished books, one bulk insert
+    assert len(statements) <= 4
+    assert check_badges(user, db_session, {BOOK_FINISHED}) == []
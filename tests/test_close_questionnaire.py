@@ -0,0 +1,115 @@
+"""
+close_questionnaire: the end-of-day streak rules as set-based UPDATEs, plus a
+benchmark for the midnight close with tens of thousands of users.
+"""
+import datetime
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy import event, insert
+
+from database import User, DailyLog, get_session_scope
+import scheduler_tasks
+
+TODAY = datetime.date(2024, 6, 20)
+YESTERDAY = TODAY - datetime.timedelta(days=1)
+N_USERS = 30_000
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    messages = []
+
+    async def fake_deliver(bot, outgoing, name="delivery", **kwargs):
+        messages.extend(outgoing)
+
+    monkeypatch.setattr(scheduler_tasks, "deliver", fake_deliver)
+    monkeypatch.setattr(scheduler_tasks, "get_today_date", lambda: TODAY)
+    return messages
+
+
+@pytest.mark.asyncio
+async def test_close_questionnaire_transitions(db_session, session_registry, sent):
+    cases = {
+        # name: (grace before, yesterday's log status)
+        'kept_going': (False, 'achieved'),
+        'made_it_up': (True, 'achieved'),
+        'first_miss': (False, 'pending'),
+        'not_enough': (False, 'read_not_enough'),
+        'no_log': (None, None),
+        'missed_again': (True, 'pending'),
+    }
+    users = {}
+    for i, (name, (grace, status)) in enumerate(cases.items()):
+        users[name] = User(telegram_id=1900 + i, full_name=name, streak=5, grace_period_active=grace)
+        db_session.add(users[name])
+        db_session.flush()
+        if status:
+            db_session.add(DailyLog(user_id=users[name].id, date=YESTERDAY, status=status))
+    db_session.flush()
+
+    await scheduler_tasks.close_questionnaire(AsyncMock())
+
+    db_session.expire_all()
+    state = {name: (u.streak, u.grace_period_active) for name, u in users.items()}
+    assert state == {
+        'kept_going': (5, False),
+        'made_it_up': (5, False),
+        'first_miss': (5, True),
+        'not_enough': (5, True),
+        'no_log': (5, True),
+        'missed_again': (0, False),
+    }
+    status = lambda name: db_session.query(DailyLog.status).filter_by(user_id=users[name].id).scalar()
+    assert status('first_miss') == 'missed'
+    assert status('missed_again') == 'pending'
+
+    texts = {m.chat_id: m.text for m in sent}
+    assert set(texts) == {users[n].telegram_id for n in ('first_miss', 'not_enough', 'no_log', 'missed_again')}
+    assert "Grace Period Activated" in texts[users['first_miss'].telegram_id]
+    assert "5 days (at risk)" in texts[users['first_miss'].telegram_id]
+    assert "Grace Period Expired" in texts[users['missed_again'].telegram_id]
+
+
+@pytest.mark.asyncio
+async def test_close_questionnaire_benchmark(async_db, sent):
+    SyncSession, _ = async_db
+    statuses = ['achieved', 'pending', 'read_not_enough', None]
+    with SyncSession.engine.begin() as conn:
+        conn.execute(insert(User), [
+            {'id': i, 'telegram_id': 1000 + i, 'full_name': f'U{i}', 'streak': i % 40,
+             'grace_period_active': i % 5 == 0}
+            for i in range(1, N_USERS + 1)
+        ])
+        conn.execute(insert(DailyLog), [
+            {'user_id': i, 'date': YESTERDAY, 'status': statuses[i % 4]}
+            for i in range(1, N_USERS + 1) if statuses[i % 4]
+        ])
+
+    statements, commits = [], []
+    engine = SyncSession.engine
+    on_execute = lambda conn, cursor, statement, *args: statements.append(statement)
+    on_commit = lambda conn: commits.append(1)
+    event.listen(engine, "before_cursor_execute", on_execute)
+    event.listen(engine, "commit", on_commit)
+    started = time.perf_counter()
+    await scheduler_tasks.close_questionnaire(AsyncMock())
+    elapsed = time.perf_counter() - started
+    event.remove(engine, "before_cursor_execute", on_execute)
+    event.remove(engine, "commit", on_commit)
+
+    # Timing is informational only; the statement counts are what's guarded
+    print(f"\nclose_questionnaire: {N_USERS} users in {elapsed:.2f}s, {len(sent)} notified, "
+          f"{len(statements)} statements, {len(commits)} commits")
+    assert len(sent) == N_USERS - N_USERS // 4
+    with get_session_scope(SyncSession) as session:
+        assert session.query(DailyLog).filter_by(status='pending').count() == \
+            sum(1 for i in range(1, N_USERS + 1) if i % 4 == 1 and i % 5 == 0)
+    # Per chunk of users: the chunk SELECT, three set-based UPDATEs and the
+    # checkpoint, in one transaction - never a statement or commit per user
+    n_chunks = -(-N_USERS // scheduler_tasks.USER_CHUNK_SIZE)
+    updates = [st for st in statements if st.startswith(('UPDATE users', 'UPDATE daily_logs'))]
+    assert len(updates) == 3 * n_chunks
+    assert len(statements) <= 5 * n_chunks + 5
+    assert len(commits) <= n_chunks + 3
@@ -0,0 +1,61 @@
+import datetime
+import pytest
+from database import Club, User, DailyLog
+import club_snapshots
+from club_snapshots import get_snapshot, record_report, load_snapshot, SKIPPED
+
+DAY = datetime.date(2024, 6, 3)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    club_snapshots.clear()
+    yield
+    club_snapshots.clear()
+
+
+def seed_club(session):
+    club = Club(name="Snap", key="SNAP")
+    session.add(club)
+    session.flush()
+    users = [User(telegram_id=700 + i, full_name=f"S{i}", club_id=club.id) for i in range(4)]
+    session.add_all(users)
+    session.flush()
+    session.add_all([
+        DailyLog(user_id=users[0].id, date=DAY, pages_read_prl=10, pages_read_rnk=5, status='achieved'),
+        DailyLog(user_id=users[1].id, date=DAY, pages_read_prl=3, pages_read_rnk=0, status='read_not_enough'),
+        DailyLog(user_id=users[2].id, date=DAY, status='pending'),
+    ])
+    session.flush()
+    return club, users
+
+
+def test_snapshot_counts_and_ranks(db_session):
+    club, users = seed_club(db_session)
+
+    snapshot = get_snapshot(db_session, club.id, DAY)
+
+    assert snapshot.total_members == 4
+    assert snapshot.counts['achieved'] == 1
+    assert snapshot.counts[SKIPPED] == 1
+    assert snapshot.percent('read_not_enough') == 25
+    assert snapshot.rank(users[0].id) == 1
+    assert snapshot.rank(users[1].id) == 2
+    assert [pages for _, pages in snapshot.ranking()] == [15, 3, 0, 0]
+
+
+def test_recorded_report_matches_a_fresh_load(db_session):
+    club, users = seed_club(db_session)
+    cached = get_snapshot(db_session, club.id, DAY)
+
+    log = db_session.query(DailyLog).filter_by(user_id=users[1].id, date=DAY).one()
+    log.pages_read_prl = 30
+    log.status = 'achieved'
+    db_session.flush()
+    record_report(db_session, club.id, DAY, users[1].id, 30, 'achieved')
+
+    fresh = load_snapshot(db_session, club.id, DAY)
+    assert get_snapshot(db_session, club.id, DAY) is cached
+    assert cached.counts == fresh.counts
+    assert cached.ranking() == fresh.ranking()
+    assert cached.rank(users[1].id) == 1
@@ -0,0 +1,96 @@
+"""
+Benchmark: send_daily_report issues one SQL statement per chunk of clubs
+(plus one for the club sizes), never one per user.
+"""
+import datetime
+import time
+import pytest
+from unittest.mock import AsyncMock
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from database import Session, User, Club, DailyLog, async_url
+from delivery import DeliveryStats
+from utils import get_today_date
+from reading_stats import rebuild as rebuild_reading_stats
+import scheduler_tasks
+
+
+def seed(engine, n_users):
+    yesterday = get_today_date() - datetime.timedelta(days=1)
+    with engine.begin() as conn:
+        conn.execute(insert(Club), [
+            {'id': 1, 'name': 'A', 'key': 'A', 'goal_type': 'OVERALL',
+             'daily_min_prl': 0, 'daily_min_rnk': 0, 'daily_min_total': 20},
+            {'id': 2, 'name': 'B', 'key': 'B', 'goal_type': 'SEPARATE',
+             'daily_min_prl': 10, 'daily_min_rnk': 10, 'daily_min_total': 0},
+        ])
+        conn.execute(insert(User), [
+            {'id': i, 'telegram_id': 1000 + i, 'full_name': f'U{i}', 'club_id': 1 + i % 2,
+             'streak': 0, 'xp': 0, 'level': 1, 'best_streak': 0, 'grace_period_active': False}
+            for i in range(1, n_users + 1)
+        ])
+        conn.execute(insert(DailyLog), [
+            {'user_id': i, 'date': yesterday, 'pages_read_prl': i % 30, 'pages_read_rnk': i % 7,
+             'status': 'achieved' if i % 3 else 'read_not_enough'}
+            for i in range(1, n_users + 1) if i % 4
+        ])
+        rebuild_reading_stats(conn)
+
+
+async def run_report(monkeypatch, tmp_path, n_users):
+    url = f"sqlite:///{tmp_path / f'report_{n_users}.db'}"
+    # Job runs are recorded through the sync registry
+    Session.configure(url)
+    seed(Session.engine, n_users)
+
+    async_engine = create_async_engine(async_url(url))
+    statements = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    sent = []
+
+    async def fake_deliver(bot, messages, name="delivery", **kwargs):
+        sent.extend(messages)
+        return DeliveryStats(name=name, sent=len(sent))
+
+    monkeypatch.setattr(scheduler_tasks, "AsyncSession", async_sessionmaker(bind=async_engine, expire_on_commit=False))
+    monkeypatch.setattr(scheduler_tasks, "deliver", fake_deliver)
+
+    started = time.perf_counter()
+    await scheduler_tasks.send_daily_report(AsyncMock())
+    elapsed = time.perf_counter() - started
+    await async_engine.dispose()
+    Session.configure(None)
+
+    print(f"\nsend_daily_report: {n_users} users, {len(statements)} statements, {elapsed:.2f}s")
+    return statements, sent
+
+
+@pytest.mark.asyncio
+async def test_daily_report_query_count_scales_with_chunks(monkeypatch, tmp_path):
+    small_statements, small_sent = await run_report(monkeypatch, tmp_path, 100)
+    large_statements, large_sent = await run_report(monkeypatch, tmp_path, 10_000)
+
+    assert len(small_sent) == 100
+    assert len(large_sent) == 10_000
+    # Two clubs of 5000 are two chunks; two clubs of 50 fit in one
+    assert len(small_statements) == 2
+    assert len(large_statements) == 3
+
+
+def test_club_chunks_never_split_a_club():
+    sizes = [(None, 3), (1, 200), (2, 350), (3, 900), (4, 10), (5, 20)]
+    chunks = list(scheduler_tasks.club_chunks(sizes, chunk_size=500))
+    assert chunks == [[None, 1], [2], [3], [4, 5]]
+
+
+@pytest.mark.asyncio
+async def test_daily_report_ranks_within_club(monkeypatch, tmp_path):
+    _, sent = await run_report(monkeypatch, tmp_path, 8)
+
+    by_chat = {m.chat_id: m.text for m in sent}
+    # User 4 and 8 have no logs at all -> unranked
+    assert "#N/A" in by_chat[1004]
+    # Club 2 holds users 2, 4, 6, 8; only 2 and 6 have logs
+    assert "of 2" in by_chat[1002]
+    assert "#1</b> of 2" in by_chat[1006]
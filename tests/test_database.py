@@ -0,0 +1,123 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+from database import SessionRegistry, Session, User, async_url, get_session_scope, get_async_session_scope
+import handlers
+import scheduler_tasks
+import admin_panel
+
+
+def test_modules_share_one_registry():
+    assert handlers.Session is Session
+    assert scheduler_tasks.Session is Session
+    assert admin_panel.Session is Session
+
+
+def test_registry_creates_engine_lazily(tmp_path):
+    registry = SessionRegistry(f"sqlite:///{tmp_path / 'lazy.db'}")
+    assert registry.pool_stats() == {}
+    assert not (tmp_path / 'lazy.db').exists()
+
+    session = registry()
+    session.add(User(telegram_id=1, full_name="Lazy"))
+    session.commit()
+    session.close()
+
+    stats = registry.pool_stats()
+    assert stats['class'] == 'QueuePool'
+    assert stats['checkedout'] == 0
+    registry.dispose()
+
+
+def test_session_registry_fixture_uses_test_transaction(session_registry, db_session):
+    session = session_registry()
+    session.add(User(telegram_id=77, full_name="Scoped"))
+    session.flush()
+
+    assert db_session.query(User).filter_by(telegram_id=77).first() is not None
+
+
+def test_upsert_daily_log_accumulates(db_session):
+    import datetime
+    from database import upsert_daily_log, DailyLog
+    day = datetime.date(2024, 5, 1)
+
+    upsert_daily_log(db_session, 1, day, 5, 0)
+    log = upsert_daily_log(db_session, 1, day, 3, 4)
+
+    assert (log.pages_read_prl, log.pages_read_rnk, log.status) == (8, 4, 'pending')
+    assert db_session.query(DailyLog).filter_by(user_id=1, date=day).count() == 1
+
+
+def test_insert_missing_daily_logs_skips_existing(db_session):
+    import datetime
+    from database import upsert_daily_log, insert_missing_daily_logs
+    day = datetime.date(2024, 5, 2)
+    upsert_daily_log(db_session, 1, day, 10, 0)
+
+    assert insert_missing_daily_logs(db_session, [1, 2, 3], day) == {2, 3}
+    assert insert_missing_daily_logs(db_session, [1, 2, 3], day) == set()
+
+
+def test_migration_merges_duplicate_logs(tmp_path):
+    from sqlalchemy import create_engine, text
+    from database import Base, run_migrations
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE daily_logs (id INTEGER PRIMARY KEY, user_id INTEGER, date DATE NOT NULL, "
+            "pages_read_prl INTEGER, pages_read_rnk INTEGER, status VARCHAR)"
+        ))
+        conn.execute(text(
+            "INSERT INTO daily_logs (user_id, date, pages_read_prl, pages_read_rnk, status) VALUES "
+            "(1, '2024-05-01', 5, 0, 'read_not_enough'), (1, '2024-05-01', 10, 2, 'achieved'), "
+            "(1, '2024-05-02', 0, 0, 'pending')"
+        ))
+
+    # create_all leaves the existing daily_logs table (and its missing index) alone
+    Base.metadata.create_all(engine)
+    run_migrations(engine)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT date, pages_read_prl, pages_read_rnk, status FROM daily_logs ORDER BY date")).all()
+        assert [tuple(r) for r in rows] == [('2024-05-01', 15, 2, 'achieved'), ('2024-05-02', 0, 0, 'pending')]
+        with pytest.raises(IntegrityError):
+            conn.execute(text("INSERT INTO daily_logs (user_id, date) VALUES (1, '2024-05-02')"))
+    engine.dispose()
+
+
+def test_migration_adds_missing_indexes(tmp_path):
+    from sqlalchemy import create_engine, inspect, text
+    from database import Base, run_migrations
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, telegram_id INTEGER, club_id INTEGER)"))
+
+    Base.metadata.create_all(engine)
+    run_migrations(engine)
+
+    assert 'ix_users_club_id' in {ix['name'] for ix in inspect(engine).get_indexes('users')}
+    engine.dispose()
+
+
+def test_async_url_maps_drivers():
+    assert async_url("sqlite:///reading_club.db").drivername == "sqlite+aiosqlite"
+    assert async_url("postgresql://u:p@db/club").drivername == "postgresql+asyncpg"
+
+
+@pytest.mark.asyncio
+async def test_async_scope_commits_on_shared_database(async_db):
+    SyncSession, AsyncSession = async_db
+    async with get_async_session_scope(AsyncSession) as session:
+        session.add(User(telegram_id=7, full_name="Async"))
+
+    # Same file, visible through the sync facade
+    with get_session_scope(SyncSession) as session:
+        assert session.query(User).filter_by(telegram_id=7).one().full_name == "Async"
+
+    with pytest.raises(RuntimeError):
+        async with get_async_session_scope(AsyncSession) as session:
+            session.add(User(telegram_id=8, full_name="Rolled back"))
+            await session.flush()
+            raise RuntimeError
+    with get_session_scope(SyncSession) as session:
+        assert session.query(User).filter_by(telegram_id=8).first() is None
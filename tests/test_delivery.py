@@ -0,0 +1,78 @@
+import pytest
+from unittest.mock import AsyncMock
+from telegram.error import BadRequest, RetryAfter, Forbidden, TimedOut
+from delivery import deliver, OutgoingMessage, TokenBucket
+import delivery
+
+
+@pytest.mark.asyncio
+async def test_deliver_counts_sent_and_failed(mock_context):
+    async def fake_send(chat_id, text, parse_mode):
+        if chat_id == 2:
+            raise Forbidden("bot was blocked by the user")
+
+    mock_context.bot.send_message = AsyncMock(side_effect=fake_send)
+    messages = [OutgoingMessage(chat_id, "hi") for chat_id in (1, 2, 3)]
+
+    stats = await deliver(mock_context.bot, messages, name="test")
+
+    assert stats.sent == 2
+    assert stats.failed == 1
+    assert mock_context.bot.send_message.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_deliver_retries_after_flood_limit(mock_context, monkeypatch):
+    calls = []
+
+    async def fake_send(chat_id, text, parse_mode):
+        calls.append(chat_id)
+        if len(calls) == 1:
+            raise RetryAfter(0)
+
+    mock_context.bot.send_message = AsyncMock(side_effect=fake_send)
+    # Don't make the test wait a full second for the per-chat bucket to refill
+    monkeypatch.setattr(delivery, "DELIVERY_PER_CHAT_RATE", 1000)
+
+    stats = await deliver(mock_context.bot, [OutgoingMessage(1, "hi")], name="test")
+
+    assert stats.sent == 1
+    assert stats.retried == 1
+    assert calls == [1, 1]
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_burst():
+    import time
+    bucket = TokenBucket(rate=50, capacity=5)
+
+    started = time.monotonic()
+    for _ in range(10):
+        await bucket.acquire()
+
+    # 5 tokens are available immediately, the other 5 take ~0.1s at 50/s
+    assert time.monotonic() - started >= 0.08
+
+
+@pytest.mark.asyncio
+async def test_deliver_counts_only_retries_that_happen(mock_context, monkeypatch):
+    mock_context.bot.send_message = AsyncMock(side_effect=RetryAfter(0))
+    monkeypatch.setattr(delivery, "DELIVERY_PER_CHAT_RATE", 1000)
+    monkeypatch.setattr(delivery, "DELIVERY_MAX_RETRIES", 2)
+
+    stats = await deliver(mock_context.bot, [OutgoingMessage(1, "hi")], name="test")
+
+    assert stats.failed == 1
+    assert mock_context.bot.send_message.await_count == 3
+    assert stats.retried == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error", [BadRequest("Chat not found"), TimedOut()])
+async def test_deliver_does_not_retry_bad_request_or_timeout(mock_context, error):
+    mock_context.bot.send_message = AsyncMock(side_effect=error)
+
+    stats = await deliver(mock_context.bot, [OutgoingMessage(1, "hi")], name="test")
+
+    assert mock_context.bot.send_message.await_count == 1
+    assert (stats.failed, stats.retried) == (1, 0)
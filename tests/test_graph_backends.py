@@ -0,0 +1,50 @@
+"""
+Pillow vs matplotlib calendar renderers: the Pillow output must stay visually
+identical to the original, and the benchmark prints renders/second for both.
+"""
+import calendar
+import io
+import time
+import numpy as np
+import pytest
+from PIL import Image
+from utils import render_contribution_graph
+
+
+def sample_statuses(year, month):
+    days = calendar.monthrange(year, month)[1]
+    return tuple(('ARMS.' * 7)[:days])
+
+
+def pixels(png):
+    return np.asarray(Image.open(io.BytesIO(png)).convert('RGB')).astype(int)
+
+
+# Four-, five- and six-week months
+@pytest.mark.parametrize("year, month", [(2021, 2), (2024, 3), (2024, 9)])
+def test_pillow_output_matches_matplotlib(year, month):
+    statuses = sample_statuses(year, month)
+    reference = pixels(render_contribution_graph(year, month, 10, statuses, backend='matplotlib'))
+    candidate = pixels(render_contribution_graph(year, month, 10, statuses, backend='pillow'))
+
+    assert candidate.shape == reference.shape
+    diff = np.abs(reference - candidate).max(axis=2)
+    # Only glyph anti-aliasing may differ; colours and layout must line up
+    assert (diff > 40).mean() < 0.03
+    assert diff.mean() < 6
+
+
+def test_renderer_benchmark():
+    rates = {}
+    for backend in ('matplotlib', 'pillow'):
+        render_contribution_graph(2024, 9, 10, sample_statuses(2024, 9), backend=backend)  # warm up
+        count = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < 1.0:
+            statuses = sample_statuses(2024, 9)[count % 5:] + ('.',) * (count % 5)
+            render_contribution_graph(2024, 9, 10, statuses, backend=backend)
+            count += 1
+        rates[backend] = count / (time.perf_counter() - started)
+
+    print(f"\nrenders/s: matplotlib={rates['matplotlib']:.1f} pillow={rates['pillow']:.1f}")
+    assert rates['pillow'] > rates['matplotlib']
@@ -0,0 +1,102 @@
+import datetime
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+from graph_cache import GraphCache, graph_key, send_graph
+from utils import month_day_statuses
+import graph_cache as graph_cache_module
+import graph_renderer
+from graph_renderer import GraphRenderer
+
+
+def log(day, status):
+    return SimpleNamespace(date=day, status=status)
+
+
+def test_status_vector_ignores_other_months_and_marks_skipped_days():
+    today = datetime.date(2024, 2, 10)
+    logs = [
+        log(datetime.date(2024, 2, 1), 'achieved'),
+        log(datetime.date(2024, 2, 3), 'missed'),
+        log(datetime.date(2024, 1, 31), 'achieved'),
+    ]
+
+    year, month, today_day, statuses = month_day_statuses(logs, today)
+
+    assert (year, month, today_day) == (2024, 2, 10)
+    assert len(statuses) == 29
+    assert ''.join(statuses[:10]) == 'ASMSSSSSS.'
+    assert set(statuses[10:]) == {'.'}
+
+
+def test_identical_calendars_render_once(tmp_path):
+    cache = GraphCache(max_size=2, directory=str(tmp_path))
+    renders = []
+
+    def render():
+        renders.append(1)
+        return b'png'
+
+    key = graph_key(2024, 2, 10, 'AAAA')
+    assert cache.get_or_render(key, render) == b'png'
+    assert cache.get_or_render(key, render) == b'png'
+    assert len(renders) == 1
+
+    # A fresh process (empty LRU) still finds the PNG on disk
+    assert GraphCache(directory=str(tmp_path)).get_or_render(key, render) == b'png'
+    assert len(renders) == 1
+
+
+CALENDAR = (2024, 2, 10, tuple('A' * 10 + '.' * 19))
+
+
+@pytest.mark.asyncio
+async def test_send_graph_reuses_file_id(monkeypatch):
+    monkeypatch.setattr(graph_cache_module, "graph_cache", GraphCache(directory=''))
+    monkeypatch.setattr(graph_renderer.renderer, "render", AsyncMock(return_value=b'png'))
+    uploaded = SimpleNamespace(photo=[SimpleNamespace(file_id='small'), SimpleNamespace(file_id='big')])
+    send = AsyncMock(return_value=uploaded)
+
+    await send_graph(send, CALENDAR, caption='hi')
+    await send_graph(send, CALENDAR, caption='hi')
+
+    first, second = send.await_args_list
+    assert first.kwargs['photo'].getvalue() == b'png'
+    assert second.kwargs['photo'] == 'big'
+    assert graph_renderer.renderer.render.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_send_graph_falls_back_when_render_queue_is_full(monkeypatch):
+    monkeypatch.setattr(graph_cache_module, "graph_cache", GraphCache(directory=''))
+    monkeypatch.setattr(graph_renderer, "renderer", GraphRenderer(workers=1, max_queue=0))
+    send = AsyncMock()
+    fallback = AsyncMock()
+
+    await send_graph(send, CALENDAR, fallback=fallback)
+
+    send.assert_not_awaited()
+    fallback.assert_awaited_once()
+    assert graph_renderer.renderer.rejected == 1
+
+
+@pytest.mark.asyncio
+async def test_renderer_returns_png_from_worker_process():
+    renderer = GraphRenderer(workers=1)
+    try:
+        png = await renderer.render(*CALENDAR)
+    finally:
+        renderer.shutdown()
+
+    assert png.startswith(b'\x89PNG')
+    assert renderer.stats()['rendered'] == 1
+    assert renderer.queue_depth == 0
+
+
+def test_renderer_is_part_of_the_key(tmp_path):
+    cache = GraphCache(directory=str(tmp_path))
+    cache.put_png(graph_key(*CALENDAR, backend='matplotlib'), b'mpl')
+
+    # Switching GRAPH_RENDERER must not serve the other backend's PNG from disk
+    assert GraphCache(directory=str(tmp_path)).get_png(graph_key(*CALENDAR, backend='pillow')) is None
+    assert graph_key(*CALENDAR, backend='pillow')[:7] == '2024-02'  # month prefix still prunes
@@ -97,3 +97,63 @@ async def test_report_flow(mock_update, mock_context, db_session):
     assert log is not None
     assert log.pages_read_prl == 10
     assert log.status == 'read_not_enough' # Goal is 10 PRL + 10 RNK, read 10 PRL only
+
+@pytest.mark.asyncio
+async def test_book_added_as_read_earns_badge_on_next_report(mock_update, mock_context, db_session, monkeypatch):
+    from unittest.mock import AsyncMock, MagicMock
+    from gamification import init_badges
+    import my_books_handler
+    monkeypatch.setattr(my_books_handler, "Session", lambda: db_session)
+    init_badges(db_session)
+
+    club = Club(name="Badge Club", key="BADGEKEY", daily_min_prl=10, daily_min_rnk=10)
+    db_session.add(club)
+    db_session.flush()
+    done = Book(title="Done", category="PRL", total_pages=50, club_id=club.id)
+    reading = Book(title="Reading", category="PRL", total_pages=100, club_id=club.id)
+    user = User(telegram_id=4, username="user_4", club_id=club.id)
+    db_session.add_all([done, reading, user])
+    db_session.flush()
+    db_session.add(UserBook(user_id=user.id, book_id=reading.id, total_pages=100, current_page=0))
+    db_session.commit()
+
+    # My Books: add a book as already read - no badge check happens there
+    update = mock_update(user_id=4)
+    update.callback_query = MagicMock()
+    update.callback_query.data = "mb_status_finished"
+    update.callback_query.answer = AsyncMock()
+    update.callback_query.edit_message_text = AsyncMock()
+    mock_context.user_data.update(mb_total_pages=50, mb_book_id=done.id)
+    await my_books_handler.mb_add_already_read(update, mock_context)
+
+    # The next report awards it
+    update = mock_update(user_id=4)
+    await report_start(update, mock_context)
+    update.message.text = "5"
+    await report_book_progress(update, mock_context)
+
+    db_session.expire_all()
+    user = db_session.query(User).filter_by(telegram_id=4).one()
+    assert "First Finish" in {ub.badge.name for ub in user.badges}
+
+@pytest.mark.asyncio
+async def test_club_change_drops_cached_empty_recommendation(mock_update, mock_context, db_session):
+    from database import Recommendation
+    from recommendations import get_cached_recommendation
+
+    old, new = Club(name="Old", key="OLDKEY"), Club(name="New", key="NEWKEY")
+    db_session.add_all([old, new])
+    db_session.flush()
+    book = Book(title="Zekat", category="PRL", total_pages=100, club_id=new.id)
+    user = User(telegram_id=5, username="user_5", club_id=old.id)
+    db_session.add_all([book, user])
+    db_session.flush()
+    # Nothing left to read in the old club
+    db_session.add(Recommendation(user_id=user.id, book_id=None, priority=None))
+    db_session.commit()
+
+    await enter_key(mock_update(user_id=5, text="NEWKEY"), mock_context)
+
+    db_session.expire_all()
+    user = db_session.query(User).filter_by(telegram_id=5).one()
+    assert get_cached_recommendation(user, db_session)[0].id == book.id
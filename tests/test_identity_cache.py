@@ -0,0 +1,42 @@
+from sqlalchemy import event
+from database import Club, User
+from identity_cache import IdentityCache, UserIdentity, identity_cache, get_user, get_identity
+
+
+def test_identity_is_cached_and_user_loaded_by_primary_key(db_session):
+    club = Club(name="Ident", key="IDENT", goal_type='OVERALL', daily_min_total=20)
+    db_session.add(club)
+    db_session.flush()
+    user = User(telegram_id=1500, full_name="Cached", club_id=club.id)
+    db_session.add(user)
+    db_session.flush()
+    db_session.expunge_all()
+
+    identity = get_identity(db_session, 1500)
+    assert (identity.user_id, identity.club_id, identity.club.daily_min_total) == (user.id, club.id, 20)
+    assert identity_cache.stats()['misses'] == 1
+
+    statements = []
+    event.listen(db_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert get_identity(db_session, 1500) == identity
+    assert statements == []
+
+    db_session.expunge_all()
+    assert get_user(db_session, 1500).id == user.id
+    assert len(statements) == 1 and statements[0].rstrip().endswith("WHERE users.id = ?")
+    assert identity_cache.stats()['hits'] == 2
+
+    identity_cache.invalidate(1500)
+    assert get_identity(db_session, 1500) == identity
+    assert identity_cache.stats()['misses'] == 2
+
+
+def test_expired_and_club_entries_are_dropped():
+    cache = IdentityCache(ttl=0)
+    cache.put(UserIdentity(1, 10, "A", None))
+    assert cache.get(10) is None
+
+    cache = IdentityCache(max_size=1)
+    cache.put(UserIdentity(1, 10, "A", None))
+    cache.put(UserIdentity(2, 20, "B", None))
+    assert cache.get(10) is None and cache.get(20) is not None
@@ -0,0 +1,102 @@
+import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from sqlalchemy import insert
+
+from database import DailyLog, JobRun, User
+import job_runs
+import scheduler_tasks
+
+TODAY = datetime.date(2024, 6, 20)
+YESTERDAY = TODAY - datetime.timedelta(days=1)
+N_USERS = 1200  # three chunks
+
+
+class Restart(Exception):
+    pass
+
+
+@pytest.fixture
+def members(db_session, session_registry, monkeypatch):
+    db_session.execute(insert(User), [
+        {'id': i, 'telegram_id': 1000 + i, 'full_name': f'U{i}', 'streak': 3, 'grace_period_active': False}
+        for i in range(1, N_USERS + 1)
+    ])
+    db_session.execute(insert(DailyLog), [
+        {'user_id': i, 'date': YESTERDAY, 'status': 'pending'} for i in range(1, N_USERS + 1)
+    ])
+    monkeypatch.setattr(scheduler_tasks, "get_today_date", lambda: TODAY)
+    return db_session
+
+
+def delivery(monkeypatch, crash_on_call=None):
+    sent, calls = [], []
+
+    async def fake_deliver(bot, messages, name="delivery", **kwargs):
+        calls.append(name)
+        if len(calls) == crash_on_call:
+            raise Restart()
+        sent.extend(messages)
+
+    monkeypatch.setattr(scheduler_tasks, "deliver", fake_deliver)
+    return sent
+
+
+@pytest.mark.asyncio
+async def test_interrupted_close_questionnaire_resumes_without_repeating(members, monkeypatch):
+    sent = delivery(monkeypatch, crash_on_call=2)
+    with pytest.raises(Restart):
+        await scheduler_tasks.close_questionnaire(AsyncMock())
+
+    run = members.query(JobRun).filter_by(job_name='close_questionnaire', run_date=YESTERDAY).one()
+    # The second chunk's updates were committed with its checkpoint; only its messages were lost
+    assert (run.status, run.last_id) == ('running', 1000)
+    assert len(sent) == 500
+
+    sent = delivery(monkeypatch)
+    await scheduler_tasks.close_questionnaire(AsyncMock())
+    assert [m.chat_id for m in sent] == [1000 + i for i in range(1001, N_USERS + 1)]
+
+    # Applied once: a second pass would have reset every streak
+    members.expire_all()
+    assert members.query(User).filter_by(grace_period_active=True, streak=3).count() == N_USERS
+    assert members.query(DailyLog).filter_by(status='missed').count() == N_USERS
+
+    # Finished for that date -> skipped
+    sent = delivery(monkeypatch)
+    await scheduler_tasks.close_questionnaire(AsyncMock())
+    assert sent == []
+    assert members.query(User).filter_by(grace_period_active=True).count() == N_USERS
+
+
+@pytest.mark.asyncio
+async def test_reminders_are_separate_runs(members, monkeypatch):
+    sent = delivery(monkeypatch)
+    monkeypatch.setattr(scheduler_tasks, "get_today_date", lambda: YESTERDAY)
+    for hour in (20, 20, 22):
+        context = MagicMock()
+        context.job.name, context.job.data = f'send_reminder_{hour}', None
+        await scheduler_tasks.send_reminder(context)
+
+    assert len(sent) == 2 * N_USERS
+
+
+def test_interrupted_runs_within_window(db_session, session_registry):
+    db_session.add_all([
+        JobRun(job_name='send_daily_report', run_date=YESTERDAY, status='running', last_id=4),
+        JobRun(job_name='send_daily_checkin', run_date=TODAY - datetime.timedelta(days=5), status='running'),
+        JobRun(job_name='close_questionnaire', run_date=YESTERDAY, status='done'),
+    ])
+    db_session.flush()
+
+    assert [(r.job_name, r.last_id) for r in job_runs.interrupted(TODAY)] == [('send_daily_report', 4)]
+    assert db_session.query(JobRun).filter_by(status='abandoned').count() == 1
+
+
+def test_job_key_prefers_the_scheduled_job():
+    context = MagicMock()
+    context.job.name, context.job.data = 'send_reminder_22', YESTERDAY
+    assert job_runs.job_key(context, 'send_reminder_13', TODAY) == ('send_reminder_22', YESTERDAY)
+    # Called directly (tests, scripts): the defaults
+    assert job_runs.job_key(AsyncMock(), 'send_reminder_13', TODAY) == ('send_reminder_13', TODAY)
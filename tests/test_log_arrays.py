@@ -0,0 +1,89 @@
+import datetime
+from unittest.mock import AsyncMock
+
+import pytest
+
+from database import Club, User, DailyLog
+from log_arrays import load_log_arrays, reading_stats, window_stats
+import scheduler_tasks
+
+TODAY = datetime.date(2024, 6, 20)  # a Thursday
+STATUSES = ['achieved', 'read_not_enough', 'missed', 'pending']
+
+
+def seed_club(session):
+    club = Club(name="Arrays", key="ARRAYS", goal_type='OVERALL', daily_min_total=20)
+    session.add(club)
+    session.flush()
+    users = [User(telegram_id=1800 + i, full_name=f"Col {i}", club_id=club.id) for i in range(4)]
+    session.add_all(users)
+    session.flush()
+    # User 3 has no logs at all
+    for i, user in enumerate(users[:3]):
+        for days_ago in range(0, 40, i + 1):
+            session.add(DailyLog(user_id=user.id, date=TODAY - datetime.timedelta(days=days_ago),
+                                 pages_read_prl=(days_ago * 3 + i) % 25, pages_read_rnk=None if days_ago % 4 else i,
+                                 status=STATUSES[(days_ago + i) % len(STATUSES)]))
+    session.flush()
+    return club, users
+
+
+def python_stats(logs, today):
+    """The per-user loops the columnar path replaces."""
+    pages = lambda l: (l.pages_read_prl or 0) + (l.pages_read_rnk or 0)
+    week = [l for l in logs if today - datetime.timedelta(days=7) <= l.date <= today]
+    month = [l for l in logs if today.replace(day=1) <= l.date <= today]
+    active = [l for l in logs if l.status in ('achieved', 'read_not_enough')]
+    return {
+        'today_pages_read': sum(pages(l) for l in logs if l.date == today),
+        'avg_pages_week': round(sum(pages(l) for l in week) / 7, 1),
+        'avg_pages_month': round(sum(pages(l) for l in month) / today.day, 1),
+        'total_pages_read': sum(pages(l) for l in logs),
+        'days_active': len(active),
+        'first_log_date': min((l.date for l in logs), default=None),
+        'weekday_pages': [sum(pages(l) for l in active if l.date.weekday() == d) for d in range(7)],
+    }
+
+
+def test_club_stats_match_per_user_loops(db_session):
+    club, users = seed_club(db_session)
+
+    stats = reading_stats(load_log_arrays(db_session, club_id=club.id), TODAY)
+
+    assert set(stats) == {u.id for u in users}
+    for user in users:
+        logs = db_session.query(DailyLog).filter_by(user_id=user.id).all()
+        expected = python_stats(logs, TODAY)
+        assert {k: stats[user.id][k] for k in expected} == expected
+    assert stats[users[3].id]['most_productive_day'] == 'N/A'
+
+
+def test_window_stats_counts_statuses(db_session):
+    club, users = seed_club(db_session)
+    week_start = TODAY - datetime.timedelta(days=7)
+
+    week = window_stats(load_log_arrays(db_session, [u.id for u in users], since=week_start), week_start, TODAY)
+
+    logs = db_session.query(DailyLog).filter(DailyLog.user_id == users[0].id, DailyLog.date >= week_start,
+                                              DailyLog.date < TODAY).all()
+    assert week[users[0].id]['days_logged'] == len(logs)
+    assert week[users[0].id]['days_achieved'] == sum(1 for l in logs if l.status == 'achieved')
+    assert week[users[3].id] == dict.fromkeys(['pages', 'prl', 'rnk', 'days_logged', 'days_achieved',
+                                               'days_active'], 0)
+
+
+@pytest.mark.asyncio
+async def test_weekly_summary_skips_inactive_members(db_session, session_registry, monkeypatch):
+    club, users = seed_club(db_session)
+    sent = []
+
+    async def fake_deliver(bot, messages, name="delivery", **kwargs):
+        sent.extend(messages)
+
+    monkeypatch.setattr(scheduler_tasks, "deliver", fake_deliver)
+    monkeypatch.setattr(scheduler_tasks, "get_today_date", lambda: TODAY)
+    await scheduler_tasks.send_weekly_summary(AsyncMock())
+
+    chat_ids = {m.chat_id for m in sent}
+    assert {u.telegram_id for u in users[:3]} <= chat_ids
+    assert users[3].telegram_id not in chat_ids
@@ -0,0 +1,107 @@
+import asyncio
+import pickle
+
+import pytest
+from sqlalchemy import event
+
+from database import PersistedConversation, PersistedData, get_session_scope
+from persistence import SQLPersistence, import_pickle
+
+
+def count_writes(AsyncSession):
+    """INSERT/DELETE statements and commits on the async engine."""
+    counts = {'writes': 0, 'commits': 0}
+    engine = AsyncSession.engine.sync_engine
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        if statement.startswith(('INSERT', 'DELETE')):
+            counts['writes'] += 1
+
+    def commit(conn):
+        counts['commits'] += 1
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "commit", commit)
+    return counts
+
+
+@pytest.mark.asyncio
+async def test_entries_round_trip_and_load_lazily(async_db):
+    persistence = SQLPersistence()
+    await persistence.update_user_data(42, {'report_queue': [1, 2], 'club_id': 7})
+    await persistence.update_conversation('report_conv', (42, 42), 3)
+    await persistence.update_conversation('report_conv', (43, 43), 1)
+    await persistence.update_conversation('report_conv', (43, 43), None)
+
+    restarted = SQLPersistence()
+    assert await restarted.get_user_data() == {}
+    assert await restarted.get_conversations('report_conv') == {(42, 42): 3}
+    assert await restarted.get_conversations('setup_conv') == {}
+
+    user_data = {'club_id': 9}
+    await restarted.refresh_user_data(42, user_data)
+    # Set before the refresh wins
+    assert user_data == {'club_id': 9, 'report_queue': [1, 2]}
+
+
+@pytest.mark.asyncio
+async def test_only_changed_entries_are_written_in_one_transaction(async_db):
+    _, AsyncSession = async_db
+    persistence = SQLPersistence()
+    for user_id in range(50):
+        await persistence.update_user_data(user_id, {'n': user_id})
+
+    counts = count_writes(AsyncSession)
+    # A flush: PTB hands every touched user over concurrently, most unchanged
+    await asyncio.gather(*(
+        persistence.update_user_data(user_id, {'n': user_id + (user_id < 5)})
+        for user_id in range(50)
+    ))
+    assert counts['writes'] == 5
+    assert counts['commits'] <= 2
+
+    restarted = SQLPersistence()
+    user_data = {}
+    await restarted.refresh_user_data(3, user_data)
+    assert user_data == {'n': 4}
+
+
+@pytest.mark.asyncio
+async def test_drop_user_data(async_db):
+    persistence = SQLPersistence()
+    await persistence.update_user_data(42, {'a': 1})
+    await persistence.drop_user_data(42)
+
+    user_data = {}
+    await SQLPersistence().refresh_user_data(42, user_data)
+    assert user_data == {}
+
+
+def test_import_pickle_once(async_db, tmp_path):
+    SyncSession, _ = async_db
+    path = tmp_path / 'bot_data.pickle'
+    with open(path, 'wb') as f:
+        pickle.dump({
+            'conversations': {'setup_conv': {(5, 5): 2}, 'report_conv': {}},
+            'user_data': {5: {'report_results': {'PRL': 13}}, 6: {}},
+            'chat_data': {5: {}},
+            'bot_data': {},
+            'callback_data': None,
+        }, f)
+
+    assert import_pickle(str(path)) == 2
+    assert not path.exists()
+    assert (tmp_path / 'bot_data.pickle.imported').exists()
+    with get_session_scope(SyncSession) as session:
+        assert session.query(PersistedData).filter_by(kind='user_data').count() == 1
+        assert session.query(PersistedConversation).one().key == '[5, 5]'
+
+    assert import_pickle(str(path)) == 0
+
+
+def test_import_pickle_skips_corrupt_file(async_db, tmp_path):
+    path = tmp_path / 'bot_data.pickle'
+    path.write_bytes(pickle.dumps({'user_data': {5: {'a': 1}}})[:-10])  # truncated mid-write
+
+    assert import_pickle(str(path)) == 0
+    assert path.exists()  # left in place for a manual look
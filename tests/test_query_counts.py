@@ -0,0 +1,148 @@
+"""
+SQL statements per handler, with an upper bound for each.
+
+The seeded user has enough books, badges and logs that a lazy load per row
+(N+1) blows straight through the bounds. If a handler legitimately needs
+another query, raise its bound here on purpose.
+"""
+import datetime
+from contextlib import contextmanager
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from sqlalchemy import event
+
+import admin_panel
+import graph_cache
+import handlers
+from database import Badge, Book, Club, DailyLog, User, UserBadge, UserBook, get_session_scope
+from reading_stats import rebuild as rebuild_reading_stats
+from utils import get_today_date
+
+N_BOOKS = 12
+N_BADGES = 6
+
+
+@contextmanager
+def count_statements(session):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = session.get_bind().engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def seed_reader(db_session):
+    club = Club(name="Counted", key="COUNTED", goal_type='OVERALL', daily_min_total=20)
+    db_session.add(club)
+    db_session.flush()
+    user = User(telegram_id=1600, full_name="Counted Reader", club_id=club.id, streak=3, best_streak=5)
+    mate = User(telegram_id=1601, full_name="Club Mate", club_id=club.id)
+    db_session.add_all([user, mate])
+    db_session.flush()
+
+    today = get_today_date()
+    for i in range(N_BOOKS):
+        book = Book(title=f"Counted Book {i}", total_pages=100, category='PRL' if i % 2 else 'RNK', club_id=club.id)
+        db_session.add(book)
+        db_session.flush()
+        finished = i % 3 == 0
+        db_session.add(UserBook(user_id=user.id, book_id=book.id, total_pages=100, current_page=100 if finished else i,
+                                finished=finished, finished_date=today if finished else None))
+        db_session.add(UserBook(user_id=mate.id, book_id=book.id, total_pages=100, current_page=1))
+    for i in range(N_BADGES):
+        badge = Badge(name=f"Counted Badge {i}", description="", icon="*")
+        db_session.add(badge)
+        db_session.flush()
+        db_session.add(UserBadge(user_id=user.id, badge_id=badge.id))
+    for days_ago in range(1, 90):
+        db_session.add(DailyLog(user_id=user.id, date=today - datetime.timedelta(days=days_ago),
+                                pages_read_prl=10, pages_read_rnk=10, status='achieved'))
+    db_session.flush()
+    # The rollup always exists in production (backfill + per-report upkeep)
+    rebuild_reading_stats(db_session, [user.id, mate.id])
+    db_session.expunge_all()
+    return user
+
+
+@pytest.fixture
+def reader(db_session, session_registry):
+    return seed_reader(db_session)
+
+
+@pytest.fixture
+def no_graph(monkeypatch):
+    send = AsyncMock()
+    monkeypatch.setattr(handlers, "send_graph", send)
+    monkeypatch.setattr(graph_cache, "send_graph", send)
+    return send
+
+
+def callback_update(user_id, data):
+    update = MagicMock()
+    update.effective_user.id = user_id
+    update.callback_query.data = data
+    update.callback_query.answer = AsyncMock()
+    update.callback_query.message.delete = AsyncMock()
+    return update
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("handler, max_statements", [
+    (handlers.profile, 6),
+    (handlers.report_start, 3),
+    (handlers.badges, 5),
+])
+async def test_command_handlers_stay_under_query_bound(db_session, reader, no_graph, mock_update, mock_context,
+                                                       handler, max_statements):
+    with count_statements(db_session) as statements:
+        await handler(mock_update(user_id=reader.telegram_id), mock_context)
+
+    print(f"\n{handler.__name__}: {len(statements)} statements")
+    assert len(statements) <= max_statements
+
+
+@pytest.mark.asyncio
+async def test_async_reading_now_query_bound(async_db, mock_update, mock_context):
+    SyncSession, AsyncSession = async_db
+    with get_session_scope(SyncSession) as session:
+        reader = seed_reader(session)
+
+    statements = []
+    event.listen(AsyncSession.engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    update = mock_update(user_id=reader.telegram_id)
+    await handlers.reading_now(update, mock_context)
+
+    print(f"\nreading_now: {len(statements)} statements")
+    assert len(statements) <= 3
+    assert "Counted Book" in update.message.reply_text.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_finished_books_query_bound(db_session, reader, mock_context):
+    update = callback_update(reader.telegram_id, f"view_finished_books_{reader.telegram_id}")
+    with count_statements(db_session) as statements:
+        await handlers.view_finished_books(update, mock_context)
+
+    print(f"\nview_finished_books: {len(statements)} statements")
+    assert len(statements) <= 2
+    text = mock_context.bot.send_message.call_args.kwargs['text']
+    assert text.count("✅") == len(range(0, N_BOOKS, 3))
+
+
+@pytest.mark.asyncio
+async def test_admin_user_view_query_bound(db_session, reader, no_graph, mock_context, monkeypatch):
+    monkeypatch.setattr(admin_panel, "get_admin_ids", lambda: [reader.telegram_id])
+    update = callback_update(reader.telegram_id, f"viewuser_{reader.id}")
+    with count_statements(db_session) as statements:
+        await admin_panel.user_menu_handler(update, mock_context)
+
+    assert no_graph.await_count == 1
+    print(f"\nadmin viewuser: {len(statements)} statements")
+    assert len(statements) <= 6
@@ -0,0 +1,70 @@
+import datetime
+from database import User, UserReadingStats, upsert_daily_log
+from reading_stats import apply_report, rebuild, get_user_stats, LOG_COLUMNS
+
+
+def snapshot(session, user_id):
+    session.expire_all()
+    stats = session.get(UserReadingStats, user_id)
+    return {c: getattr(stats, c) for c in LOG_COLUMNS + ['first_log_date', 'books_finished']}
+
+
+def test_incremental_rollup_matches_rebuild(db_session):
+    user = User(telegram_id=500, full_name="Roll Up")
+    db_session.add(user)
+    db_session.flush()
+    get_user_stats(db_session, user.id)
+
+    monday = datetime.date(2024, 6, 3)
+    reports = [
+        (monday, 5, 0, 'read_not_enough'),
+        (monday, 10, 10, 'achieved'),
+        (monday + datetime.timedelta(days=2), 0, 7, 'read_not_enough'),
+    ]
+    for day, prl, rnk, new_status in reports:
+        log = upsert_daily_log(db_session, user.id, day, prl, rnk)
+        old_status = log.status
+        log.status = new_status
+        apply_report(db_session, user.id, day, prl, rnk, old_status, new_status)
+    db_session.flush()
+
+    incremental = snapshot(db_session, user.id)
+    rebuild(db_session, [user.id])
+    rebuilt = snapshot(db_session, user.id)
+
+    assert incremental == rebuilt
+    assert rebuilt['total_pages'] == 32
+    assert rebuilt['active_days'] == 2
+    assert rebuilt['pages_mon'] == 25
+    assert rebuilt['pages_wed'] == 7
+    assert rebuilt['first_log_date'] == monday
+
+
+def test_first_log_and_weekdays_keep_the_original_definitions(db_session):
+    from database import DailyLog, insert_missing_daily_logs
+    user = User(telegram_id=501, full_name="Late Starter")
+    db_session.add(user)
+    db_session.flush()
+    get_user_stats(db_session, user.id)
+
+    sunday = datetime.date(2024, 6, 2)
+    monday = sunday + datetime.timedelta(days=1)
+    # History starts with a pending (later missed) day: the all-time average still counts it
+    insert_missing_daily_logs(db_session, [user.id], sunday)
+    log = upsert_daily_log(db_session, user.id, monday, 12, 0)
+    old_status, log.status = log.status, 'read_not_enough'
+    apply_report(db_session, user.id, monday, 12, 0, old_status, 'read_not_enough')
+    db_session.flush()
+
+    incremental = snapshot(db_session, user.id)
+    rebuild(db_session, [user.id])
+    assert snapshot(db_session, user.id) == incremental
+    assert incremental['first_log_date'] == sunday
+
+    # Pages on a day that isn't active don't count toward its weekday
+    db_session.add(DailyLog(user_id=user.id, date=sunday + datetime.timedelta(days=2), status='missed',
+                            pages_read_prl=9, pages_read_rnk=0))
+    db_session.flush()
+    rebuild(db_session, [user.id])
+    rebuilt = snapshot(db_session, user.id)
+    assert (rebuilt['pages_mon'], rebuilt['pages_tue'], rebuilt['total_pages']) == (12, 0, 21)
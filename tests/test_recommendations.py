@@ -0,0 +1,84 @@
+import pytest
+from sqlalchemy import event
+from database import Club, User, Book, UserBook
+import recommendations
+from recommendations import get_recommended_book, get_book_priority, invalidate_priority_index
+
+
+@pytest.fixture(autouse=True)
+def fresh_index():
+    invalidate_priority_index()
+    yield
+    invalidate_priority_index()
+
+
+def test_priority_matching_folds_turkish_letters():
+    assert get_book_priority("İnancın Gölgesinde") == 1
+    assert get_book_priority("Kalbin Zümrüt Tepeleri 2") == 5
+    assert get_book_priority("Some Other Book") == 8
+
+
+def test_recommends_best_unread_tier_without_like_queries(db_session):
+    club = Club(name="Rec", key="REC")
+    db_session.add(club)
+    db_session.flush()
+    user = User(telegram_id=1300, full_name="Reader", club_id=club.id)
+    tier1 = Book(title="İNANCIN GÖLGESİNDE", club_id=club.id, category="PRL", total_pages=100)
+    tier2 = Book(title="Oruç", club_id=club.id, category="PRL", total_pages=100)
+    other = Book(title="Unrelated", club_id=club.id, category="PRL", total_pages=100)
+    db_session.add_all([user, tier1, tier2, other])
+    db_session.flush()
+    db_session.add(UserBook(user_id=user.id, book_id=tier1.id, finished=True))
+    db_session.flush()
+
+    statements = []
+    event.listen(db_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    book, priority = get_recommended_book(user, db_session)
+
+    assert (book.id, priority) == (tier2.id, 2)
+    assert not any("LIKE" in sql.upper() for sql in statements)
+
+    # The index is cached per club until the admin panel invalidates it
+    new_book = Book(title="Sonsuz Nur 1", club_id=club.id, category="PRL", total_pages=100)
+    db_session.add(new_book)
+    db_session.flush()
+    assert get_recommended_book(user, db_session)[0].id == tier2.id
+    invalidate_priority_index(club.id)
+    assert get_recommended_book(user, db_session) == (new_book, 1)
+
+
+def test_batch_precompute_matches_single_user_and_is_served_from_cache(db_session):
+    from database import Recommendation
+    from recommendations import recommend_for_club, precompute_recommendations, get_cached_recommendation
+
+    club = Club(name="Batch", key="BATCH")
+    db_session.add(club)
+    db_session.flush()
+    books = [Book(title=title, club_id=club.id, category="PRL", total_pages=100)
+             for title in ("Sonsuz Nur 1", "Zekat", "Kırık Mızrap")]
+    users = [User(telegram_id=1400 + i, full_name=f"B{i}", club_id=club.id) for i in range(3)]
+    db_session.add_all(books + users)
+    db_session.flush()
+    # User 1 finished tier 1, user 2 finished everything
+    db_session.add(UserBook(user_id=users[1].id, book_id=books[0].id, finished=True))
+    db_session.add_all([UserBook(user_id=users[2].id, book_id=book.id, finished=True) for book in books])
+    db_session.flush()
+
+    statements = []
+    event.listen(db_session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    picks = recommend_for_club(db_session, club.id)
+
+    assert picks == {users[0].id: (books[0].id, 1), users[1].id: (books[1].id, 2), users[2].id: (None, None)}
+    assert len(statements) == 3  # club books, members, all members' UserBooks
+
+    precompute_recommendations(db_session)
+    assert db_session.query(Recommendation).filter_by(user_id=users[1].id).one().book_id == books[1].id
+
+    statements.clear()
+    assert get_cached_recommendation(users[1], db_session) == (books[1], 2)
+    assert not any("user_books" in sql and "JOIN" in sql for sql in statements)
+
+    # Once the user adds the recommended book the cached row is stale
+    db_session.add(UserBook(user_id=users[1].id, book_id=books[1].id))
+    db_session.flush()
+    assert get_cached_recommendation(users[1], db_session) == (books[2], 7)
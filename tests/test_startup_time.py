@@ -0,0 +1,46 @@
+"""
+Cold-start budget: importing main must stay cheap so a container restart
+gets back to polling quickly. Uses `python -X importtime` in a fresh process.
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Generous for slow CI boxes; the import graph itself is what we're guarding
+STARTUP_BUDGET_MS = int(os.getenv('STARTUP_BUDGET_MS', 1500))
+
+# Only needed on first use (or inside the render workers), never at startup
+LAZY_MODULES = ['matplotlib', 'PIL', 'numpy', 'recommendations', 'log_arrays', 'graph_pillow']
+
+
+def import_times(module):
+    """{module name: cumulative import time in µs} for a cold `import module`."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+        env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'},
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_main_cold_start_within_budget():
+    times = import_times('main')
+    total_ms = times['main'] / 1000
+
+    print(f"\ncold start: import main took {total_ms:.0f}ms (budget {STARTUP_BUDGET_MS}ms)")
+    loaded_early = [m for m in LAZY_MODULES if m in times]
+    assert not loaded_early, f"imported at startup: {loaded_early}"
+    assert total_ms < STARTUP_BUDGET_MS
+
+
+def test_importing_main_does_not_create_the_engine():
+    code = "import main, database, sys; sys.exit(database.Session._engine is not None)"
+    assert subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True).returncode == 0
@@ -0,0 +1,83 @@
+"""
+Benchmark: /stats for a member with 3 years of daily logs must cost the same
+as for a member who joined last week.
+"""
+import datetime
+import time
+import pytest
+from sqlalchemy import event, insert
+from database import Session, AsyncSession, Club, User, DailyLog
+from identity_cache import identity_cache
+from reading_stats import rebuild as rebuild_reading_stats, stats_summary
+from utils import get_today_date
+import handlers
+
+YEARS = 3
+USERS = 50
+
+
+def seed(engine, days):
+    today = get_today_date()
+    with engine.begin() as conn:
+        conn.execute(insert(Club), [{'id': 1, 'name': 'A', 'key': 'A', 'goal_type': 'OVERALL',
+                                     'daily_min_prl': 0, 'daily_min_rnk': 0, 'daily_min_total': 20}])
+        conn.execute(insert(User), [
+            {'id': i, 'telegram_id': 1000 + i, 'full_name': f'U{i}', 'club_id': 1,
+             'streak': 0, 'xp': 0, 'level': 1, 'best_streak': 0, 'grace_period_active': False}
+            for i in range(1, USERS + 1)
+        ])
+        conn.execute(insert(DailyLog), [
+            {'user_id': i, 'date': today - datetime.timedelta(days=d), 'pages_read_prl': (i + d) % 30,
+             'pages_read_rnk': d % 7, 'status': 'achieved' if d % 3 else 'read_not_enough'}
+            for i in range(1, USERS + 1) for d in range(days)
+        ])
+        rebuild_reading_stats(conn)
+
+
+async def run_stats(tmp_path, mock_update, mock_context, days):
+    Session.configure(f"sqlite:///{tmp_path / f'stats_{days}.db'}")
+    seed(Session.engine, days)
+    identity_cache.clear()
+
+    statements = []
+    event.listen(AsyncSession.engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    replies = []
+    started = time.perf_counter()
+    for i in range(1, USERS + 1):
+        update = mock_update(user_id=1000 + i)
+        await handlers.stats(update, mock_context)
+        replies.append(update.message.reply_text.call_args.args[0])
+    elapsed = time.perf_counter() - started
+
+    await AsyncSession.dispose()
+    Session.configure(None)
+    assert all("Reading Analytics" in reply for reply in replies)
+    print(f"\n/stats: {days} days of logs, {len(statements) / USERS:.0f} statements/call, "
+          f"{elapsed / USERS * 1000:.2f} ms/call")
+    return statements, elapsed
+
+
+@pytest.mark.asyncio
+async def test_stats_cost_does_not_grow_with_history(tmp_path, mock_update, mock_context):
+    new_statements, new_elapsed = await run_stats(tmp_path, mock_update, mock_context, 7)
+    old_statements, old_elapsed = await run_stats(tmp_path, mock_update, mock_context, 365 * YEARS)
+
+    assert len(old_statements) == len(new_statements)
+    # Loose: only guards against going back to scanning the whole history
+    assert old_elapsed < new_elapsed * 3 + 0.5
+
+
+def test_stats_summary_pace_windows(db_session):
+    user = User(telegram_id=1700, full_name="Pace")
+    db_session.add(user)
+    db_session.flush()
+    today = datetime.date(2024, 6, 20)
+    for days_ago, pages in [(0, 5), (7, 10), (8, 20), (14, 40), (15, 80)]:
+        db_session.add(DailyLog(user_id=user.id, date=today - datetime.timedelta(days=days_ago),
+                                pages_read_prl=pages, pages_read_rnk=0, status='achieved'))
+    db_session.flush()
+
+    stats, this_week, last_week = stats_summary(db_session, user.id, today)
+    assert (this_week, last_week) == (15, 60)
+    assert stats.total_pages == 155
@@ -0,0 +1,107 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import Session as OrmSession
+
+import admin_panel
+from database import Base, Club, User
+from user_search import fts_query, search_users
+
+ADMIN_ID = 999
+
+
+@pytest.fixture
+def people(db_session):
+    db_session.execute(insert(Club), [{'id': 1, 'name': 'Morning', 'key': 'US1', 'goal_type': 'OVERALL'}])
+    db_session.add_all([
+        User(id=1, telegram_id=1001, full_name="Anna Karimova", username="annak", club_id=1),
+        User(id=2, telegram_id=1002, full_name="Ánton Petrov", username="tony"),
+        User(id=3, telegram_id=1003, full_name="Bob Annenkov", username=None),
+    ])
+    db_session.flush()
+    return db_session
+
+
+def names(rows):
+    return [row.full_name for row in rows]
+
+
+def test_search_by_name_prefix_username_and_id(people):
+    assert names(search_users(people, "kari")) == ["Anna Karimova"]
+    assert names(search_users(people, "ann kar")) == ["Anna Karimova"]
+    assert set(names(search_users(people, "ann"))) == {"Anna Karimova", "Bob Annenkov"}
+    assert names(search_users(people, "@tony")) == ["Ánton Petrov"]
+    assert names(search_users(people, "anton")) == ["Ánton Petrov"]  # diacritics folded
+    assert names(search_users(people, "1003")) == ["Bob Annenkov"]
+    assert search_users(people, "1003")[0].club_name is None
+    assert search_users(people, "zzz") == []
+    assert search_users(people, '"*') == []  # nothing searchable, not an FTS syntax error
+
+
+def test_index_follows_inserts_updates_and_deletes(people):
+    user = people.get(User, 3)
+    user.full_name = "Robert Smith"
+    people.add(User(id=4, telegram_id=1004, full_name="Zoe Annikova"))
+    people.flush()
+    assert set(names(search_users(people, "ann"))) == {"Anna Karimova", "Zoe Annikova"}
+
+    people.delete(people.get(User, 1))
+    people.flush()
+    assert names(search_users(people, "ann")) == ["Zoe Annikova"]
+    assert names(search_users(people, "robert")) == ["Robert Smith"]
+
+
+def test_like_fallback_without_fts():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)  # no migrations, so no users_fts
+    with OrmSession(engine) as session:
+        session.add_all([User(telegram_id=1, full_name="Anna 100%"), User(telegram_id=2, full_name="Bob")])
+        session.flush()
+        assert names(search_users(session, "nna")) == ["Anna 100%"]
+        assert names(search_users(session, "%")) == ["Anna 100%"]
+    engine.dispose()
+
+
+def test_fts_query_quotes_every_word():
+    assert fts_query('Ann "K') == '"Ann"* """K"*'
+    assert fts_query("  - ") == ""
+
+
+def test_search_uses_the_fts_index_at_scale(db_session):
+    first = ["Anna", "Boris", "Dilnoza", "Ivan", "Madina", "Olga", "Timur", "Zarina"]
+    last = ["Karimova", "Petrov", "Sidorov", "Usmonova", "Nazarov", "Ivanova", "Rashidov"]
+    db_session.execute(insert(User), [
+        {'telegram_id': 10_000 + i, 'full_name': f"{first[i % 8]} {last[i % 7]} {i}", 'username': f"reader{i}"}
+        for i in range(30_000)
+    ])
+
+    statements = []
+    listener = lambda conn, cursor, statement, parameters, *args: statements.append((statement, parameters))
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    started = time.perf_counter()
+    for query in ("kari", "reader2999", "zarina nazarov", "29999", "ivan iv"):
+        assert search_users(db_session, query)
+    elapsed = (time.perf_counter() - started) / 5
+    event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+    print(f"\nuser search: {elapsed * 1000:.1f} ms per search over 30k users")
+
+    # Lookups go through the FTS index and the users indexes - no scan of users
+    plans = [
+        detail for statement, parameters in statements if 'sqlite_master' not in statement
+        for *_, detail in db_session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+    ]
+    assert any(detail.startswith("SCAN users_fts VIRTUAL TABLE INDEX") for detail in plans)
+    assert not [detail for detail in plans if detail.startswith("SCAN users") and "users_fts" not in detail]
+
+
+@pytest.mark.asyncio
+async def test_admin_search_shows_matches(people, session_registry, mock_update, mock_context):
+    update = mock_update(user_id=ADMIN_ID, text="@annak")
+    assert await admin_panel.search_users_handler(update, mock_context) == admin_panel.USER_MENU
+
+    markup = update.message.reply_text.call_args.kwargs['reply_markup']
+    buttons = [b for row in markup.inline_keyboard for b in row]
+    assert buttons[0].text == "Anna Karimova @annak (Morning)"
+    assert buttons[0].callback_data == "viewuser_1"
+    assert [b.callback_data for b in buttons[1:]] == ["user_search", "back_users"]
@@ -0,0 +1,110 @@
+"""
+Admin user search: part of a name, a username or a telegram id -> the best
+matches.
+
+On SQLite, users_fts is an FTS5 index over users.full_name and username. It
+is an external-content table (only the index is stored), and triggers keep it
+in sync with every insert, delete and name/username change on users, so
+joins, profile updates and kicks need no extra code. Each word typed matches
+the start of a word in the name or username ("ann kar" finds "Anna Karimova"),
+best matches first (bm25). Without FTS5, or on another database, search
+falls back to a case-insensitive LIKE scan.
+"""
+import logging
+
+from sqlalchemy import inspect, or_, select, text
+from sqlalchemy.exc import OperationalError
+
+from database import Club, User
+
+logger = logging.getLogger(__name__)
+
+SEARCH_LIMIT = 10
+
+FTS_TABLE = (
+    "CREATE VIRTUAL TABLE users_fts USING fts5("
+    "full_name, username, content='users', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+FTS_TRIGGERS = [
+    "CREATE TRIGGER users_fts_ai AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts(rowid, full_name, username) VALUES (new.id, new.full_name, new.username); END",
+    "CREATE TRIGGER users_fts_ad AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, full_name, username) "
+    "VALUES ('delete', old.id, old.full_name, old.username); END",
+    # Only name changes touch the index, not XP/streak updates
+    "CREATE TRIGGER users_fts_au AFTER UPDATE OF full_name, username ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, full_name, username) "
+    "VALUES ('delete', old.id, old.full_name, old.username); "
+    "INSERT INTO users_fts(rowid, full_name, username) VALUES (new.id, new.full_name, new.username); END",
+]
+
+
+def has_search_index(connection):
+    if connection.dialect.name != 'sqlite':
+        return False
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'")
+    ).first() is not None
+
+
+def create_search_index(connection):
+    """Create users_fts and its triggers, filled from users (SQLite with FTS5 only)."""
+    if connection.dialect.name != 'sqlite' or has_search_index(connection):
+        return
+    if not {'full_name', 'username'} <= {c['name'] for c in inspect(connection).get_columns('users')}:
+        return
+    try:
+        connection.execute(text(FTS_TABLE))
+    except OperationalError as e:
+        logger.warning(f"SQLite has no FTS5, user search falls back to LIKE: {e}")
+        return
+    for trigger in FTS_TRIGGERS:
+        connection.execute(text(trigger))
+    connection.execute(text("INSERT INTO users_fts(users_fts) VALUES ('rebuild')"))
+
+
+def fts_query(query):
+    """'ann kar' -> '"ann"* "kar"*': every word a quoted prefix, so nothing typed is FTS syntax."""
+    words = [w for w in query.split() if any(c.isalnum() for c in w)]
+    return ' '.join('"{}"*'.format(w.replace('"', '""')) for w in words)
+
+
+def search_users(session, query, limit=SEARCH_LIMIT):
+    """
+    Up to `limit` users matching `query`, as rows of (id, full_name, username,
+    telegram_id, club_name): an exact telegram id first, then name/username
+    matches.
+    """
+    query = query.strip().lstrip('@')
+    ids = []
+    if query.isdigit():
+        ids += session.scalars(select(User.id).where(User.telegram_id == int(query))).all()
+
+    connection = session.connection()
+    if has_search_index(connection):
+        match = fts_query(query)
+        if match:
+            ids += session.scalars(
+                text("SELECT rowid FROM users_fts WHERE users_fts MATCH :match ORDER BY rank LIMIT :limit"),
+                {'match': match, 'limit': limit}
+            ).all()
+    elif query:
+        escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        pattern = f"%{escaped}%"
+        ids += session.scalars(
+            select(User.id)
+            .where(or_(User.full_name.ilike(pattern, escape='\\'), User.username.ilike(pattern, escape='\\')))
+            .order_by(User.id).limit(limit)
+        ).all()
+
+    ids = list(dict.fromkeys(ids))[:limit]
+    if not ids:
+        return []
+    rows = session.execute(
+        select(User.id, User.full_name, User.username, User.telegram_id, Club.name.label('club_name'))
+        .outerjoin(Club, User.club_id == Club.id)
+        .where(User.id.in_(ids))
+    ).all()
+    by_id = {row.id: row for row in rows}
+    return [by_id[i] for i in ids if i in by_id]
@@ -1,6 +1,5 @@
 from datetime import datetime, timedelta
 import pytz
-import matplotlib.pyplot as plt
 import io
 
 TIMEZONE = pytz.timezone('Etc/GMT-5') # UTC+5
@@ -32,110 +31,170 @@ def get_admin_ids():
     cleaned = env_val.replace('[', '').replace(']', '').replace('"', '').replace("'", '')
     return [int(x) for x in cleaned.split(',') if x.strip()]
 
-def generate_contribution_graph(daily_logs):
+# One character per calendar day; the graph image is fully determined by these
+DAY_ACHIEVED = 'A'
+DAY_NOT_ENOUGH = 'R'
+DAY_MISSED = 'M'
+DAY_SKIPPED = 'S'
+DAY_EMPTY = '.'  # today (pending), future days, or logs without a final status
+
+DAY_STYLES = {
+    DAY_ACHIEVED: ('#27ae60', "✓"),  # Green
+    DAY_NOT_ENOUGH: ('#f39c12', "~"),  # Orange
+    DAY_MISSED: ('#c0392b', "✕"),  # Red
+    DAY_SKIPPED: ('#95a5a6', "»"),  # Gray
+    DAY_EMPTY: ('#34495e', ""),  # Default greyish
+}
+
+LOG_STATUS_CODES = {
+    'achieved': DAY_ACHIEVED,
+    'read_not_enough': DAY_NOT_ENOUGH,
+    'missed': DAY_MISSED,
+}
+
+
+def month_day_statuses(daily_logs, today=None):
+    """
+    Reduce a user's logs to the current month's status vector.
+    Returns (year, month, today_day, statuses) - plain data, cheap to hash.
+    """
+    import calendar
+
+    today = today or get_today_date()
+    year, month = today.year, today.month
+    log_map = {l.date.day: l.status for l in daily_logs if l.date.year == year and l.date.month == month}
+
+    statuses = []
+    for day in range(1, calendar.monthrange(year, month)[1] + 1):
+        if day in log_map:
+            statuses.append(LOG_STATUS_CODES.get(log_map[day], DAY_EMPTY))
+        elif day < today.day:
+            # Past day with no log -> Skipped
+            statuses.append(DAY_SKIPPED)
+        else:
+            statuses.append(DAY_EMPTY)
+    return year, month, today.day, tuple(statuses)
+
+
+def current_month_logs(session, user_id, today=None):
+    """The user's DailyLogs for the current month - all month_day_statuses looks at."""
+    from database import DailyLog
+
+    today = today or get_today_date()
+    return session.query(DailyLog).filter(
+        DailyLog.user_id == user_id,
+        DailyLog.date >= today.replace(day=1),
+        DailyLog.date <= today
+    ).all()
+
+
+def render_contribution_graph(year, month, today_day, statuses, backend=None):
+    """Draw the calendar for a status vector with the configured backend and return the PNG bytes."""
+    from config import GRAPH_RENDERER
+
+    backend = backend or GRAPH_RENDERER
+    if backend == 'pillow':
+        import graph_pillow
+        return graph_pillow.render(year, month, today_day, statuses)
+    if backend != 'matplotlib':
+        raise ValueError(f"Unknown graph renderer: {backend}")
+    return render_contribution_graph_matplotlib(year, month, today_day, statuses)
+
+
+def render_contribution_graph_matplotlib(year, month, today_day, statuses):
     # Calendar View (Monthly)
     import matplotlib.pyplot as plt
     import calendar
-    
-    # Configuration
-    today = get_today_date()
-    year = today.year
-    month = today.month
-    
+
     # Create calendar grid
     cal = calendar.monthcalendar(year, month)
     month_name = calendar.month_name[month]
-    
-    # Map logs
-    log_map = {l.date.day: l for l in daily_logs if l.date.year == year and l.date.month == month}
-    
+
     # Plotting
     fig, ax = plt.subplots(figsize=(6, 5))
     ax.set_facecolor('#2c3e50') # Dark blue-grey background
     fig.patch.set_facecolor('#2c3e50')
-    
+
     # Grid settings
     rows = len(cal)
     cols = 7
-    
+
     ax.set_xlim(0, cols)
     ax.set_ylim(0, rows + 1) # +1 for header
     ax.axis('off')
-    
+
     # Draw Header (Month Year)
-    ax.text(3.5, rows + 0.5, f"{month_name} {year}", 
+    ax.text(3.5, rows + 0.5, f"{month_name} {year}",
             ha='center', va='center', color='white', fontsize=16, weight='bold')
-            
+
     # Draw Day Names
     days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
     for i, day in enumerate(days):
-        ax.text(i + 0.5, rows - 0.2, day, 
+        ax.text(i + 0.5, rows - 0.2, day,
                 ha='center', va='center', color='#bdc3c7', fontsize=10)
-                
+
     # Draw Days
     for r, week in enumerate(cal):
         for c, day in enumerate(week):
             if day == 0:
                 continue
-                
+
             # Coordinates (row 0 is top, so we invert y)
             y = rows - 1 - r
             x = c
-            
-            # Draw Box
-            # Determine status
-            status_color = '#34495e' # Default greyish
-            status_text = ""
-            
-            if day in log_map:
-                log = log_map[day]
-                if log.status == 'achieved':
-                    status_color = '#27ae60' # Green
-                    status_text = "✓"
-                elif log.status == 'read_not_enough':
-                    status_color = '#f39c12' # Orange
-                    status_text = "~"
-                elif log.status == 'missed':
-                    status_color = '#c0392b' # Red
-                    status_text = "✕"
-            elif day < today.day:
-                # Past day with no log -> Skipped
-                status_color = '#95a5a6' # Gray
-                status_text = "»"
-            elif day == today.day:
-                 status_color = '#34495e' # Today pending
-            
-            # Draw Rectangle
-            rect = plt.Rectangle((x + 0.05, y + 0.05), 0.9, 0.9, 
-                               color=status_color, ec='none', alpha=0.8)
-            # Using basic rectangle for now. FancyBboxPatch could do rounded.
-            import matplotlib.patches as mpatches
-            # box = mpatches.FancyBboxPatch((x + 0.1, y + 0.1), 0.8, 0.8, boxstyle="round,pad=0.02", color=status_color)
-            # ax.add_patch(box)
+
+            status_color, status_text = DAY_STYLES[statuses[day - 1]]
+
             # Stick to simple rectangle for reliability
+            rect = plt.Rectangle((x + 0.05, y + 0.05), 0.9, 0.9,
+                               color=status_color, ec='none', alpha=0.8)
             ax.add_patch(rect)
-            
+
             # Draw Day Number
-            ax.text(x + 0.5, y + 0.5, str(day), 
+            ax.text(x + 0.5, y + 0.5, str(day),
                     ha='center', va='center', color='white', fontsize=12, weight='bold')
-            
+
             # Draw Status Icon (small)
             if status_text:
-                ax.text(x + 0.8, y + 0.2, status_text, 
+                ax.text(x + 0.8, y + 0.2, status_text,
                         ha='center', va='center', color='white', fontsize=10, weight='bold')
 
     plt.tight_layout()
-    
+
     buf = io.BytesIO()
     plt.savefig(buf, format='png', bbox_inches='tight', dpi=150)
-    buf.seek(0)
-    plt.close()
-    return buf
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def text_calendar(year, month, today_day, statuses):
+    """Plain-text version of the calendar graph (HTML <pre> block)."""
+    import calendar
+
+    glyphs = {DAY_ACHIEVED: "✓", DAY_NOT_ENOUGH: "~", DAY_MISSED: "✕", DAY_SKIPPED: "»", DAY_EMPTY: "·"}
+    lines = [f"{calendar.month_name[month]} {year}", " Mo  Tu  We  Th  Fr  Sa  Su"]
+    for week in calendar.monthcalendar(year, month):
+        cells = []
+        for day in week:
+            cells.append("    " if day == 0 else f"{day:>2}{glyphs[statuses[day - 1]]} ")
+        lines.append("".join(cells).rstrip())
+    return "<pre>" + "\n".join(lines) + "</pre>"
+
+
+def generate_contribution_graph(daily_logs):
+    """PNG of the user's monthly calendar as a BytesIO (served from the render cache)."""
+    from graph_cache import graph_cache, graph_key
+
+    calendar = month_day_statuses(daily_logs)
+    return io.BytesIO(graph_cache.get_or_render(graph_key(*calendar), lambda: render_contribution_graph(*calendar)))
 
 def calculate_reading_stats(user):
     """Calculate comprehensive reading statistics for a user"""
     from datetime import timedelta
-    from collections import Counter
+    from sqlalchemy.orm import object_session
+    from database import Book
+    from reading_stats import get_user_stats, most_productive_weekday
+    from log_arrays import load_log_arrays, reading_stats
     
     stats = {
         'avg_pages_week': 0,
@@ -145,61 +204,45 @@ def calculate_reading_stats(user):
         'current_streak': user.streak,
         'most_productive_day': 'N/A',
         'total_books_finished': 0,
+        'total_books_count': 0,
+        'today_pages_read': 0,
         'total_pages_read': 0,
         'days_active': 0,
         'reading_speed': {}  # book_id: days_to_finish
     }
     
-    logs = user.logs
-    if not logs:
+    session = object_session(user)
+    if user.club_id:
+        stats['total_books_count'] = session.query(Book).filter(Book.club_id == user.club_id).count()
+    
+    # Lifetime totals come from the incrementally maintained rollup
+    rollup = get_user_stats(session, user.id)
+    if rollup.first_log_date is None:
         return stats
-        
-    # Sort logs by date
-    sorted_logs = sorted(logs, key=lambda x: x.date)
     
-    # Total stats
-    stats['total_pages_read'] = sum((l.pages_read_prl or 0) + (l.pages_read_rnk or 0) for l in logs)
-    stats['days_active'] = len([l for l in logs if l.status in ['achieved', 'read_not_enough']])
-    stats['total_books_finished'] = len([ub for ub in user.readings if ub.finished])
-    stats['total_books_count'] = len(user.club.books) if user.club else 0
+    stats['total_pages_read'] = rollup.total_pages
+    stats['days_active'] = rollup.active_days
+    stats['total_books_finished'] = rollup.books_finished
     
     # Average calculations
     today = get_today_date()
-    
-    # Today's pages
-    today_log = next((l for l in logs if l.date == today), None)
-    stats['today_pages_read'] = (today_log.pages_read_prl or 0) + (today_log.pages_read_rnk or 0) if today_log else 0
-    
-    # Last 7 days
     week_ago = today - timedelta(days=7)
-    week_logs = [l for l in logs if l.date >= week_ago]
-    if week_logs:
-        week_pages = sum((l.pages_read_prl or 0) + (l.pages_read_rnk or 0) for l in week_logs)
-        stats['avg_pages_week'] = round(week_pages / 7, 1)
-    
-    # This month
     month_start = today.replace(day=1)
-    month_logs = [l for l in logs if l.date >= month_start]
-    if month_logs:
-        days_in_month = (today - month_start).days + 1
-        month_pages = sum((l.pages_read_prl or 0) + (l.pages_read_rnk or 0) for l in month_logs)
-        stats['avg_pages_month'] = round(month_pages / days_in_month, 1)
+    
+    # Only the current week/month windows need individual logs
+    arrays = load_log_arrays(session, [user.id], since=min(week_ago, month_start))
+    window = reading_stats(arrays, today)[user.id]
+    stats['today_pages_read'] = window['today_pages_read']
+    stats['avg_pages_week'] = window['avg_pages_week']
+    stats['avg_pages_month'] = window['avg_pages_month']
     
     # All time
-    if sorted_logs:
-        first_log = sorted_logs[0].date
-        total_days = (today - first_log).days + 1
-        stats['avg_pages_all_time'] = round(stats['total_pages_read'] / total_days, 1)
+    total_days = (today - rollup.first_log_date).days + 1
+    stats['avg_pages_all_time'] = round(stats['total_pages_read'] / max(total_days, 1), 1)
     
     # Most productive day of week (0=Monday, 6=Sunday)
-    day_counter = Counter()
-    for log in logs:
-        if log.status in ['achieved', 'read_not_enough']:
-            pages = (log.pages_read_prl or 0) + (log.pages_read_rnk or 0)
-            day_counter[log.date.weekday()] += pages
-            
-    if day_counter:
-        most_productive_day_num = day_counter.most_common(1)[0][0]
+    most_productive_day_num = most_productive_weekday(rollup)
+    if most_productive_day_num is not None:
         days_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
         stats['most_productive_day'] = days_names[most_productive_day_num]
     